@@ -54,3 +54,15 @@ def accountant_required(view_func):
         return view_func(request, *args, **kwargs)
     return _wrapped_view
 
+
+def auditor_required(view_func):
+    """Decorator to require auditor or admin role."""
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return redirect('accounts:login')
+        if not request.user.can_view_audit_trail():
+            messages.error(request, 'You do not have permission to access this page.')
+            return redirect('analytics:dashboard')
+        return view_func(request, *args, **kwargs)
+    return _wrapped_view
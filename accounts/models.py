@@ -57,6 +57,10 @@ class User(AbstractUser):
         """Check if user can view financial reports."""
         return self.is_admin() or self.is_accountant()
     
+    def can_view_audit_trail(self):
+        """Check if user can browse and export the audit trail."""
+        return self.is_admin() or self.is_auditor()
+    
     def has_read_access(self):
         """Check if user has read access (all roles)."""
         return True
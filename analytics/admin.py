@@ -1,4 +1,10 @@
 from django.contrib import admin
+from .models import BookingFact
 
-# Analytics app doesn't have models to register
 
+@admin.register(BookingFact)
+class BookingFactAdmin(admin.ModelAdmin):
+    list_display = ['day', 'package', 'agent', 'status', 'booking_count', 'total_amount']
+    list_filter = ['status', 'day']
+    readonly_fields = ['day', 'package', 'agent', 'status', 'booking_count', 'subtotal',
+                       'tax_amount', 'discount_amount', 'commission_amount', 'total_amount']
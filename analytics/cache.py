@@ -0,0 +1,229 @@
+"""
+Result cache for analytics reports.
+
+Report data (never rendered HTML) is stored in a Django cache backend chosen
+by ``settings.ANALYTICS_REPORT_CACHE['ALIAS']``. With the default local-memory
+backend each worker has its own cache; point the alias at a file-based or
+database cache to share entries between gunicorn workers.
+
+Keys are built from the report name, the normalized filter parameters, the
+viewer's role scope and the version stamps of every month the report range
+touches. Saving or deleting a ``Booking`` or ``Payment`` bumps the stamp of
+the booking's month, so cached reports covering that month are never read
+again and simply age out. The number of live entries is bounded with a
+least-recently-used index kept in the same backend. The index is rewritten
+under a lock held with ``add()`` on the backend, so concurrent workers do
+not drop each other's entries; a worker that cannot get the lock within
+``LOCK_WAIT`` seconds skips its update, which only makes that entry look
+older (it still expires after ``TIMEOUT``).
+"""
+import hashlib
+import json
+import time
+from datetime import date
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+
+KEY_PREFIX = 'analytics:report'
+LRU_INDEX_KEY = f'{KEY_PREFIX}:lru'
+LRU_LOCK_KEY = f'{KEY_PREFIX}:lru:lock'
+
+# Seconds to wait for the LRU index lock, and how long a held lock lives
+# if its holder dies
+LOCK_WAIT = 0.05
+LOCK_TIMEOUT = 5
+GLOBAL_VERSION = 'all'
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'MAX_ENTRIES': 200,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'ANALYTICS_REPORT_CACHE', {}))
+    return config
+
+
+def get_backend():
+    return caches[get_config()['ALIAS']]
+
+
+def viewer_scope(user):
+    """Role scope of the viewer; reports differ by role, not by individual user."""
+    if user.is_admin():
+        return 'admin'
+    if user.is_sales_agent():
+        return f'sales_agent:{user.pk}'
+    return user.role
+
+
+def month_keys(first_day, last_day):
+    """Version keys for every calendar month in an inclusive range of days."""
+    keys = []
+    year, month = first_day.year, first_day.month
+    while (year, month) <= (last_day.year, last_day.month):
+        keys.append(_version_key(f'{year:04d}-{month:02d}'))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def _version_key(bucket):
+    return f'{KEY_PREFIX}:version:{bucket}'
+
+
+def _stat_key(name):
+    return f'{KEY_PREFIX}:stats:{name}'
+
+
+def _new_stamp():
+    return time.time_ns()
+
+
+def bump_version(day=None):
+    """Invalidate cached reports covering ``day`` (or every report if None)."""
+    backend = get_backend()
+    if day is None:
+        key = _version_key(GLOBAL_VERSION)
+    else:
+        key = _version_key(f'{day.year:04d}-{day.month:02d}')
+    backend.set(key, _new_stamp(), timeout=None)
+
+
+def bump_version_for(created_at):
+    """Invalidate cached reports covering a booking created at ``created_at``."""
+    if created_at is not None:
+        bump_version(timezone.localdate(created_at))
+
+
+def _current_versions(backend, keys):
+    """
+    Read version stamps, creating missing ones.
+
+    Stamps are timestamps rather than counters so a stamp that was culled
+    from the backend comes back with a fresh value and cannot resurrect
+    entries written under an older one.
+    """
+    versions = backend.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            backend.add(key, _new_stamp(), timeout=None)
+            versions[key] = backend.get(key)
+    return [versions[key] for key in keys]
+
+
+def _incr(backend, name):
+    key = _stat_key(name)
+    try:
+        backend.incr(key)
+    except ValueError:
+        backend.add(key, 0, timeout=None)
+        backend.incr(key)
+
+
+def _normalize(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        # Text filters are matched case-insensitively (icontains)
+        return value.strip().lower()
+    return value
+
+
+def make_key(name, params, scope, first_day, last_day):
+    backend = get_backend()
+    version_keys = [_version_key(GLOBAL_VERSION)] + month_keys(first_day, last_day)
+    payload = {
+        'report': name,
+        'scope': scope,
+        'params': {k: _normalize(v) for k, v in sorted(params.items()) if v not in (None, '')},
+        'versions': _current_versions(backend, version_keys),
+    }
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return f'{KEY_PREFIX}:data:{digest}'
+
+
+def _acquire(backend):
+    deadline = time.monotonic() + LOCK_WAIT
+    while not backend.add(LRU_LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def _touch(backend, key, max_entries):
+    """Record ``key`` as most recently used and evict the overflow."""
+    if not _acquire(backend):
+        return
+    try:
+        _update_index(backend, key, max_entries)
+    finally:
+        backend.delete(LRU_LOCK_KEY)
+
+
+def _update_index(backend, key, max_entries):
+    index = backend.get(LRU_INDEX_KEY) or {}
+    index.pop(key, None)
+    index[key] = time.time()
+    evicted = []
+    while len(index) > max_entries:
+        oldest = min(index, key=index.get)
+        del index[oldest]
+        evicted.append(oldest)
+    if evicted:
+        backend.delete_many(evicted)
+        for _ in evicted:
+            _incr(backend, 'evictions')
+    backend.set(LRU_INDEX_KEY, index, timeout=None)
+
+
+def cached_report(name, user, params, first_day, last_day, build):
+    """
+    Return report data for the given filters, computing it with ``build()``
+    on a miss. ``params`` must already hold the resolved filter values so
+    equivalent requests share an entry.
+    """
+    config = get_config()
+    backend = get_backend()
+    key = make_key(name, params, viewer_scope(user), first_day, last_day)
+
+    data = backend.get(key)
+    if data is not None:
+        _incr(backend, 'hits')
+        _touch(backend, key, config['MAX_ENTRIES'])
+        return data
+
+    _incr(backend, 'misses')
+    data = build()
+    backend.set(key, data, timeout=config['TIMEOUT'])
+    _touch(backend, key, config['MAX_ENTRIES'])
+    return data
+
+
+def get_stats():
+    """Hit/miss/eviction counters and the current number of tracked entries."""
+    backend = get_backend()
+    names = ('hits', 'misses', 'evictions')
+    values = backend.get_many([_stat_key(name) for name in names])
+    stats = {name: values.get(_stat_key(name), 0) for name in names}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['entries'] = len(backend.get(LRU_INDEX_KEY) or {})
+    stats['max_entries'] = get_config()['MAX_ENTRIES']
+    stats['backend'] = get_config()['ALIAS']
+    return stats
+
+
+def clear():
+    """Drop every cached report and reset the counters."""
+    backend = get_backend()
+    index = backend.get(LRU_INDEX_KEY) or {}
+    backend.delete_many(list(index) + [LRU_INDEX_KEY] + [
+        _stat_key(name) for name in ('hits', 'misses', 'evictions')
+    ])
+    bump_version()
@@ -0,0 +1,120 @@
+"""
+Maintenance and querying of the booking fact table.
+
+Each ``BookingFact`` row holds the counts and money sums of every booking
+created on one local day for one package, agent and status. Rows are
+adjusted incrementally whenever a booking is saved or deleted, and can be
+rebuilt from scratch with ``manage.py rebuild_booking_facts``. Deleting an
+agent keeps their bookings (``created_by`` is set to NULL), so their rows
+are folded into the agent-less cells rather than deleted with them.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import BookingFact
+
+
+MEASURES = ('subtotal', 'tax_amount', 'discount_amount', 'commission_amount', 'total_amount')
+
+# Booking fields needed to place a booking in the cube
+SNAPSHOT_FIELDS = ('created_at', 'package_id', 'created_by_id', 'status') + MEASURES
+
+
+def snapshot(booking):
+    """Return the cube cell and measures contributed by a booking."""
+    return {field: getattr(booking, field) for field in SNAPSHOT_FIELDS}
+
+
+def apply_snapshot(snap, sign):
+    """Add (sign=1) or remove (sign=-1) a booking snapshot from the cube."""
+    if snap is None or snap['created_at'] is None:
+        return
+
+    cell = {
+        'day': timezone.localdate(snap['created_at']),
+        'package_id': snap['package_id'],
+        'agent_id': snap['created_by_id'],
+        'status': snap['status'],
+    }
+    updates = {'booking_count': F('booking_count') + sign}
+    for measure in MEASURES:
+        updates[measure] = F(measure) + sign * (snap[measure] or 0)
+
+    with transaction.atomic():
+        fact, _ = BookingFact.objects.get_or_create(**cell)
+        BookingFact.objects.filter(pk=fact.pk).update(**updates)
+
+
+def apply_snapshots(snaps, sign=1):
+    """Add or remove many snapshots with one update per cube cell."""
+    cells = {}
+    for snap in snaps:
+        if snap['created_at'] is None:
+            continue
+        cell = (timezone.localdate(snap['created_at']), snap['package_id'],
+                snap['created_by_id'], snap['status'])
+        totals = cells.setdefault(cell, dict.fromkeys(('booking_count',) + MEASURES, 0))
+        totals['booking_count'] += 1
+        for measure in MEASURES:
+            totals[measure] += snap[measure] or 0
+
+    with transaction.atomic():
+        for (day, package_id, agent_id, status), totals in cells.items():
+            fact, _ = BookingFact.objects.get_or_create(
+                day=day, package_id=package_id, agent_id=agent_id, status=status
+            )
+            BookingFact.objects.filter(pk=fact.pk).update(**{
+                field: F(field) + sign * value for field, value in totals.items()
+            })
+
+
+def fold_agent(agent_id):
+    """Move an agent's rows into the matching ``agent=None`` cells."""
+    with transaction.atomic():
+        rows = list(BookingFact.objects.filter(agent_id=agent_id).values(
+            'pk', 'day', 'package_id', 'status', 'booking_count', *MEASURES
+        ))
+        for row in rows:
+            fact, _ = BookingFact.objects.get_or_create(
+                day=row['day'], package_id=row['package_id'], agent_id=None, status=row['status']
+            )
+            BookingFact.objects.filter(pk=fact.pk).update(**{
+                field: F(field) + row[field] for field in ('booking_count',) + MEASURES
+            })
+        BookingFact.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+
+
+def rebuild():
+    """Recompute the whole cube from the bookings table. Returns the row count."""
+    from bookings.models import Booking
+
+    rows = Booking.objects.order_by().annotate(
+        day=TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+    ).values('day', 'package_id', 'created_by_id', 'status').annotate(
+        booking_count=Count('id'),
+        **{measure: Sum(measure) for measure in MEASURES}
+    )
+
+    facts = [
+        BookingFact(
+            day=row['day'],
+            package_id=row['package_id'],
+            agent_id=row['created_by_id'],
+            status=row['status'],
+            booking_count=row['booking_count'],
+            **{measure: row[measure] for measure in MEASURES}
+        )
+        for row in rows
+    ]
+
+    with transaction.atomic():
+        BookingFact.objects.all().delete()
+        BookingFact.objects.bulk_create(facts, batch_size=1000)
+
+    return len(facts)
+
+
+def facts_between(first_day, last_day):
+    """Fact rows for an inclusive range of local days."""
+    return BookingFact.objects.filter(day__gte=first_day, day__lte=last_day)
@@ -0,0 +1,114 @@
+import random
+import resource
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from bookings.models import Booking
+from packages.models import Package
+from analytics.exports import CHUNK_SIZE, EXPORT_FORMATS, export_response
+
+
+BENCH_PREFIX = 'BENCH'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the streaming sales export (time to first byte, throughput, peak RSS). '
+        'Use --seed to insert synthetic bookings first, in a separate run so the '
+        'seeding does not inflate the measured peak RSS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Insert this many synthetic bookings and exit.')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete previously seeded synthetic bookings and exit.')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = Booking.objects.filter(booking_number__startswith=BENCH_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} synthetic rows.')
+            return
+        if options['seed']:
+            self.seed(options['seed'])
+            return
+        self.measure(options['format'])
+
+    def seed(self, count):
+        packages = list(Package.objects.all()[:20])
+        if not packages:
+            raise CommandError('Create at least one package before seeding bookings.')
+
+        start = Booking.objects.filter(booking_number__startswith=BENCH_PREFIX).count()
+        now = timezone.now()
+        rng = random.Random(start)
+        batch = []
+        for n in range(start, start + count):
+            package = rng.choice(packages)
+            price = package.get_current_price() * rng.randint(1, 4)
+            booking = Booking(
+                booking_number=f'{BENCH_PREFIX}{n:010d}',
+                package=package,
+                customer_name=f'Customer {n}',
+                customer_email=f'customer{n}@example.com',
+                customer_phone=f'{9000000000 + n % 999999999}',
+                travel_date=now.date() + timedelta(days=rng.randint(1, 365)),
+                package_price=price,
+                discount_percentage=Decimal(rng.randint(0, 10)),
+                status=rng.choice(['pending', 'approved', 'rejected']),
+            )
+            booking.calculate_totals()
+            booking.set_derived_fields()
+            batch.append(booking)
+            if len(batch) == 5000:
+                with transaction.atomic():
+                    Booking.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                Booking.objects.bulk_create(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {count} bookings. Run rebuild_booking_facts to refresh analytics.'
+        ))
+
+    def measure(self, export_format):
+        rows = Booking.objects.order_by('created_at', 'id').values_list(
+            'booking_number', 'created_at', 'customer_name', 'package__name',
+            'package__destination', 'created_by__username', 'status',
+            'subtotal', 'tax_amount', 'commission_amount', 'total_amount'
+        ).iterator(chunk_size=CHUNK_SIZE)
+
+        counted = _Counter(rows)
+        response = export_response(export_format, 'benchmark', ['c'] * 11, counted)
+
+        started = time.perf_counter()
+        first_byte = None
+        total_bytes = 0
+        for chunk in response.streaming_content:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            total_bytes += len(chunk)
+        elapsed = time.perf_counter() - started
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        self.stdout.write(
+            f'format={export_format} rows={counted.count} bytes={total_bytes} '
+            f'first_byte={first_byte or 0:.3f}s total={elapsed:.2f}s '
+            f'rows_per_sec={counted.count / elapsed if elapsed else 0:.0f} '
+            f'peak_rss={peak_rss_mb:.1f}MB'
+        )
+
+
+class _Counter:
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from analytics import facts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the booking fact table from the bookings table.'
+
+    def handle(self, *args, **options):
+        count = facts.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} booking fact rows.'))
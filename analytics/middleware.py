@@ -0,0 +1,31 @@
+from django.db import connections
+
+
+class QueryCountMiddleware:
+    """Report the number of database queries a request made in ``X-Query-Count``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = _QueryCounter()
+        wrapped = []
+        for connection in connections.all():
+            connection.execute_wrappers.append(counter)
+            wrapped.append(connection)
+        try:
+            response = self.get_response(request)
+        finally:
+            for connection in wrapped:
+                connection.execute_wrappers.remove(counter)
+        response['X-Query-Count'] = str(counter.count)
+        return response
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
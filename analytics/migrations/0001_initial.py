@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-16 22:28
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import django.db.models.deletion
+
+
+MEASURES = ('subtotal', 'tax_amount', 'discount_amount', 'commission_amount', 'total_amount')
+
+
+def populate_booking_facts(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    BookingFact = apps.get_model('analytics', 'BookingFact')
+    rows = Booking.objects.order_by().annotate(
+        day=TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+    ).values('day', 'package_id', 'created_by_id', 'status').annotate(
+        booking_count=Count('id'),
+        **{measure: Sum(measure) for measure in MEASURES}
+    )
+    BookingFact.objects.bulk_create([
+        BookingFact(
+            day=row['day'],
+            package_id=row['package_id'],
+            agent_id=row['created_by_id'],
+            status=row['status'],
+            booking_count=row['booking_count'],
+            **{measure: row[measure] for measure in MEASURES}
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('packages', '0001_initial'),
+        ('bookings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('booking_count', models.IntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('commission_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('agent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='booking_facts', to=settings.AUTH_USER_MODEL)),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_facts', to='packages.package')),
+            ],
+            options={
+                'db_table': 'booking_facts',
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day', 'status'], name='booking_fac_day_7b0383_idx'), models.Index(fields=['agent', 'day'], name='booking_fac_agent_i_a23a2d_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='bookingfact',
+            constraint=models.UniqueConstraint(fields=('day', 'package', 'agent', 'status'), name='booking_facts_cell_uniq'),
+        ),
+        migrations.RunPython(populate_booking_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import models
+from decimal import Decimal
+
+
+class BookingFact(models.Model):
+    """Pre-aggregated booking totals per day, package, agent and status."""
+
+    day = models.DateField()
+    package = models.ForeignKey(
+        'packages.Package',
+        on_delete=models.CASCADE,
+        related_name='booking_facts'
+    )
+    agent = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='booking_facts'
+    )
+    status = models.CharField(max_length=20)
+
+    # Measures
+    booking_count = models.IntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    discount_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    commission_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        db_table = 'booking_facts'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'package', 'agent', 'status'],
+                name='booking_facts_cell_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'status']),
+            models.Index(fields=['agent', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.package_id}/{self.agent_id}/{self.status}: {self.booking_count}"
@@ -0,0 +1,116 @@
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from accounts.models import User
+from bookings.models import Booking
+from bookings.signals import bookings_created, bookings_updated
+from packages.models import Package
+from payments.models import Payment
+from . import cache, facts
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_cell(sender, instance, raw=False, **kwargs):
+    """Capture the cube contribution of a booking before it changes."""
+    instance._fact_snapshot = None
+    if raw or instance.pk is None:
+        return
+    instance._fact_snapshot = Booking.objects.filter(pk=instance.pk).values(
+        *facts.SNAPSHOT_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=Booking)
+def update_booking_facts(sender, instance, created, raw=False, **kwargs):
+    """Move a booking's contribution to its new cube cell."""
+    if raw:
+        return
+    cache.bump_version_for(instance.created_at)
+    old = getattr(instance, '_fact_snapshot', None)
+    new = facts.snapshot(instance)
+    if old == new:
+        return
+    facts.apply_snapshot(old, -1)
+    facts.apply_snapshot(new, 1)
+
+
+@receiver(bookings_created, sender=Booking)
+def add_bulk_booking_facts(sender, bookings, **kwargs):
+    """Add bookings written with ``bulk_create`` to the cube in one pass."""
+    for day in {timezone.localdate(booking.created_at) for booking in bookings}:
+        cache.bump_version(day)
+    facts.apply_snapshots(facts.snapshot(booking) for booking in bookings)
+
+
+@receiver(bookings_updated, sender=Booking)
+def move_bulk_booking_facts(sender, bookings, previous, **kwargs):
+    """Move bookings changed in bulk between cube cells in one pass."""
+    old, new = [], []
+    for booking in bookings:
+        snap = facts.snapshot(booking)
+        changed = {field: value for field, value in previous[booking.pk].items() if field in snap}
+        if any(snap[field] != value for field, value in changed.items()):
+            old.append({**snap, **changed})
+            new.append(snap)
+    for day in {timezone.localdate(booking.created_at) for booking in bookings}:
+        cache.bump_version(day)
+    facts.apply_snapshots(old, -1)
+    facts.apply_snapshots(new, 1)
+
+
+@receiver(post_delete, sender=Booking)
+def remove_booking_facts(sender, instance, **kwargs):
+    """Drop a deleted booking from the cube."""
+    cache.bump_version_for(instance.created_at)
+    facts.apply_snapshot(facts.snapshot(instance), -1)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_payment_reports(sender, instance, **kwargs):
+    """Payments feed the financial report of their booking's month."""
+    cache.bump_version_for(instance.booking.created_at)
+
+
+# User fields shown in reports (agent names and lists)
+USER_REPORT_FIELDS = ('username', 'first_name', 'last_name', 'role', 'is_active')
+
+
+@receiver(pre_save, sender=User)
+def remember_user_report_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Capture the reported fields of a user before they change."""
+    instance._report_snapshot = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(USER_REPORT_FIELDS):
+        # e.g. update_last_login on every sign-in
+        instance._report_snapshot = False
+        return
+    instance._report_snapshot = User.objects.filter(pk=instance.pk).values(*USER_REPORT_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_reports_for_user(sender, instance, raw=False, **kwargs):
+    """Agent names and lists appear in every report."""
+    if raw:
+        return
+    old = getattr(instance, '_report_snapshot', None)
+    if old is False:
+        return
+    if old == {field: getattr(instance, field) for field in USER_REPORT_FIELDS}:
+        return
+    cache.bump_version()
+
+
+@receiver(pre_delete, sender=User)
+def fold_agent_facts(sender, instance, **kwargs):
+    """The agent's bookings outlive them with no agent; so do their facts."""
+    facts.fold_agent(instance.pk)
+    cache.bump_version()
+
+
+@receiver(post_save, sender=Package)
+def invalidate_all_reports(sender, instance, raw=False, **kwargs):
+    """Package names/rates appear in every report."""
+    if not raw:
+        cache.bump_version()
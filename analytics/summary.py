@@ -0,0 +1,66 @@
+"""
+Headline report metrics computed in a single aggregate query.
+
+``build_summary`` works on either a ``BookingFact`` queryset or a raw
+``Booking`` queryset; every metric is a (conditionally filtered) aggregate
+in the same ``SELECT`` so a report page scans its rows once.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from django.db.models import Count, Q, Sum
+from .models import BookingFact
+
+
+CENT = Decimal('0.01')
+
+
+@dataclass(frozen=True)
+class ReportSummary:
+    """Booking counts and money totals for a report."""
+
+    total_bookings: int = 0
+    approved_bookings: int = 0
+    rejected_bookings: int = 0
+    pending_bookings: int = 0
+    total_revenue: Decimal = Decimal('0.00')
+    total_subtotal: Decimal = Decimal('0.00')
+    total_tax: Decimal = Decimal('0.00')
+    total_commission: Decimal = Decimal('0.00')
+    total_discount: Decimal = Decimal('0.00')
+
+    @property
+    def average_booking_value(self):
+        if not self.total_bookings:
+            return Decimal('0.00')
+        return round(self.total_revenue / self.total_bookings, 2)
+
+
+def build_summary(queryset):
+    """Compute a ``ReportSummary`` for a fact or booking queryset in one query."""
+    if queryset.model is BookingFact:
+        def count(**filters):
+            return Sum('booking_count', filter=Q(**filters) if filters else None)
+    else:
+        def count(**filters):
+            return Count('id', filter=Q(**filters) if filters else None)
+
+    row = queryset.order_by().aggregate(
+        total_bookings=count(),
+        approved_bookings=count(status='approved'),
+        rejected_bookings=count(status='rejected'),
+        pending_bookings=count(status='pending'),
+        total_revenue=Sum('total_amount'),
+        total_subtotal=Sum('subtotal'),
+        total_tax=Sum('tax_amount'),
+        total_commission=Sum('commission_amount'),
+        total_discount=Sum('discount_amount'),
+    )
+
+    values = {}
+    for name, value in row.items():
+        if value is None:
+            continue
+        if name.startswith('total_') and name != 'total_bookings':
+            value = Decimal(value).quantize(CENT)
+        values[name] = value
+    return ReportSummary(**values)
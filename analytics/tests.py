@@ -0,0 +1,246 @@
+import csv
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from bookings.models import Booking
+from bookings.tests import BookingTestCase
+from bookings.validation import bulk_validate
+from . import cache, facts
+from .summary import ReportSummary, build_summary
+from .models import BookingFact
+
+
+class ReportCacheTests(TestCase):
+
+    def setUp(self):
+        self.backend = caches[cache.get_config()['ALIAS']]
+        self.backend.clear()
+        self.addCleanup(self.backend.clear)
+        self.user = User.objects.create_user('agent', password='x', role='sales_agent')
+
+    def global_version(self):
+        return self.backend.get(cache._version_key(cache.GLOBAL_VERSION))
+
+    def test_login_keeps_cached_reports(self):
+        cache.bump_version()
+        version = self.global_version()
+        self.assertTrue(self.client.login(username='agent', password='x'))
+        self.assertEqual(self.global_version(), version)
+
+    def test_unchanged_full_save_keeps_cached_reports(self):
+        cache.bump_version()
+        version = self.global_version()
+        self.user.save()
+        self.assertEqual(self.global_version(), version)
+
+    def test_role_change_invalidates_reports(self):
+        cache.bump_version()
+        version = self.global_version()
+        self.user.role = 'manager'
+        self.user.save()
+        self.assertNotEqual(self.global_version(), version)
+
+    def test_lru_index_keeps_entries_of_every_writer(self):
+        for number in range(5):
+            cache._touch(self.backend, f'entry:{number}', max_entries=10)
+        self.assertEqual(len(self.backend.get(cache.LRU_INDEX_KEY)), 5)
+        self.assertIsNone(self.backend.get(cache.LRU_LOCK_KEY))
+
+    def test_lru_update_is_skipped_while_locked(self):
+        cache._touch(self.backend, 'entry:1', max_entries=10)
+        self.backend.add(cache.LRU_LOCK_KEY, 1)
+        cache._touch(self.backend, 'entry:2', max_entries=10)
+        self.assertEqual(list(self.backend.get(cache.LRU_INDEX_KEY)), ['entry:1'])
+        # The lock belongs to its holder
+        self.assertIsNotNone(self.backend.get(cache.LRU_LOCK_KEY))
+
+
+class BookingFactTests(BookingTestCase):
+
+    def cube(self):
+        """Non-empty fact cells, as compared with a rebuild."""
+        return {
+            (fact.day, fact.package_id, fact.agent_id, fact.status): (
+                fact.booking_count, *(getattr(fact, measure) for measure in facts.MEASURES)
+            )
+            for fact in BookingFact.objects.filter(booking_count__gt=0)
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.cube()
+        facts.rebuild()
+        self.assertEqual(incremental, self.cube())
+
+    def test_saves_and_deletes_keep_facts_in_step(self):
+        bookings = [self.make_booking(f'BK60000{i}', f'Customer {i}') for i in range(3)]
+        self.make_booking('BK600010', 'Customer Other', created_by=self.other_agent)
+        self.assertMatchesRebuild()
+
+        bookings[0].status = 'approved'
+        bookings[0].save()
+        bookings[1].number_of_travelers = 3
+        bookings[1].calculate_totals()
+        bookings[1].save()
+        bookings[2].delete()
+        self.assertMatchesRebuild()
+
+    def test_bulk_validation_moves_facts(self):
+        bookings = [self.make_booking(f'BK60002{i}', f'Customer {i}') for i in range(3)]
+        bulk_validate([booking.pk for booking in bookings[:2]], 'reject', self.manager, 'Wrong dates')
+        self.assertMatchesRebuild()
+
+    def test_deleting_an_agent_keeps_their_bookings_in_the_facts(self):
+        for i in range(2):
+            self.make_booking(f'BK60003{i}', f'Customer {i}', created_by=self.other_agent)
+        self.make_booking('BK600040', 'Customer Mine')
+        # Also land in an agent-less cell that already exists
+        orphan = self.make_booking('BK600041', 'Customer Orphan')
+        Booking.objects.filter(pk=orphan.pk).update(created_by=None)
+        facts.rebuild()
+        total = sum(count for count, *_ in self.cube().values())
+        agent_id = self.other_agent.pk
+
+        self.other_agent.delete()
+
+        self.assertEqual(Booking.objects.filter(created_by__isnull=True).count(), 3)
+        self.assertFalse(BookingFact.objects.filter(agent_id=agent_id).exists())
+        self.assertEqual(sum(count for count, *_ in self.cube().values()), total)
+        self.assertMatchesRebuild()
+
+
+
+class ReportSummaryTests(BookingTestCase):
+
+    def expected(self, bookings):
+        """The summary worked out from the bookings one by one."""
+        def total(field):
+            return sum((getattr(booking, field) for booking in bookings), Decimal('0.00'))
+
+        return ReportSummary(
+            total_bookings=len(bookings),
+            approved_bookings=sum(booking.status == 'approved' for booking in bookings),
+            rejected_bookings=sum(booking.status == 'rejected' for booking in bookings),
+            pending_bookings=sum(booking.status == 'pending' for booking in bookings),
+            total_revenue=total('total_amount'),
+            total_subtotal=total('subtotal'),
+            total_tax=total('tax_amount'),
+            total_commission=total('commission_amount'),
+            total_discount=total('discount_amount'),
+        )
+
+    def test_facts_and_bookings_summarise_like_the_raw_rows(self):
+        for number, status in enumerate(['pending', 'approved', 'approved', 'rejected', 'approved'], 1):
+            booking = self.make_booking(
+                f'BK7000{number:02d}', f'Customer {number}', self.other_agent if number % 2 else None, status
+            )
+            booking.number_of_travelers = number
+            booking.package_price = self.package.get_current_price() * number
+            booking.calculate_totals()
+            booking.save()
+        expected = self.expected(list(Booking.objects.all()))
+
+        for queryset in (BookingFact.objects.all(), Booking.objects.all()):
+            summary = build_summary(queryset)
+            self.assertEqual(summary, expected)
+            self.assertIs(type(summary.total_bookings), int)
+            self.assertIs(type(summary.total_revenue), Decimal)
+            self.assertEqual(summary.average_booking_value, round(expected.total_revenue / 5, 2))
+
+    def test_no_rows_give_zeros(self):
+        self.assertEqual(build_summary(BookingFact.objects.all()), ReportSummary())
+
+
+
+class ReportExportTests(BookingTestCase):
+
+    def setUp(self):
+        for number in range(1, 8):
+            self.make_booking(
+                f'BK80000{number}', f'Customer "{number}", Jr.', self.other_agent if number % 2 else None,
+                ('pending', 'approved', 'rejected')[number % 3],
+            )
+        self.client.force_login(self.admin)
+
+    def whole_export(self):
+        """The sales export built in memory from model instances."""
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['Booking #', 'Created', 'Customer', 'Package', 'Destination', 'Agent',
+                         'Status', 'Subtotal', 'Tax', 'Commission', 'Total'])
+        for booking in Booking.objects.order_by('created_at', 'id'):
+            writer.writerow([
+                booking.booking_number, timezone.localtime(booking.created_at).strftime('%Y-%m-%d %H:%M:%S'),
+                booking.customer_name, booking.package.name, booking.package.destination,
+                booking.created_by.username, booking.status, booking.subtotal, booking.tax_amount,
+                booking.commission_amount, booking.total_amount,
+            ])
+        return output.getvalue()
+
+    def export(self, export_format):
+        # Small chunks and buffers, so the rows cross several of each
+        with mock.patch('analytics.views.CHUNK_SIZE', 2), mock.patch('analytics.exports.FLUSH_BYTES', 256):
+            response = self.client.get(reverse('analytics:sales_report'), {'format': export_format})
+            chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        return b''.join(chunks)
+
+    def test_chunked_csv_equals_the_whole_export(self):
+        self.assertEqual(self.export('csv').decode(), self.whole_export())
+
+    def test_chunked_xlsx_holds_the_same_rows(self):
+        with zipfile.ZipFile(BytesIO(self.export('xlsx'))) as workbook:
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = [
+            [''.join(cell.itertext()) for cell in row.findall('s:c', namespace)]
+            for row in sheet.iterfind('s:sheetData/s:row', namespace)
+        ]
+
+        self.assertEqual(rows, list(csv.reader(StringIO(self.whole_export()))))
+
+
+@override_settings(MIDDLEWARE=settings.MIDDLEWARE + ['analytics.middleware.QueryCountMiddleware'])
+class ReportQueryBudgetTests(BookingTestCase):
+    """Report pages make the same few queries whatever the amount of data."""
+
+    REPORTS = ('analytics:dashboard', 'analytics:sales_report', 'analytics:financial_report',
+               'analytics:agent_performance')
+
+    def setUp(self):
+        self.backend = caches[cache.get_config()['ALIAS']]
+        self.client.force_login(self.admin)
+
+    def query_counts(self):
+        counts = {}
+        for name in self.REPORTS:
+            self.backend.clear()
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            counts[name] = int(response['X-Query-Count'])
+        return counts
+
+    def add_bookings(self, start, count):
+        for number in range(start, start + count):
+            booking = self.make_booking(
+                f'BK{number:06d}', f'Customer {number}', number % 2 and self.other_agent or self.agent,
+                status=('pending', 'approved', 'rejected')[number % 3],
+            )
+            Booking.objects.filter(pk=booking.pk).update(created_at=timezone.now() - timedelta(days=number * 7))
+
+    def test_query_count_does_not_grow_with_the_data(self):
+        self.add_bookings(1, 3)
+        few = self.query_counts()
+        self.add_bookings(4, 40)
+
+        self.assertEqual(self.query_counts(), few)
+        for name, count in few.items():
+            self.assertLessEqual(count, 10, name)
@@ -0,0 +1,96 @@
+"""
+Zero-filled time series over booking querysets.
+
+``bucket_series`` groups a queryset into day, week or month buckets in the
+configured ``TIME_ZONE`` with a single ``GROUP BY`` query, then fills the
+buckets that had no rows with zeros so charts get a continuous axis.
+"""
+from datetime import date, datetime, timedelta
+from django.db.models import DateTimeField
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+
+PERIODS = ('day', 'week', 'month')
+
+LABEL_FORMATS = {
+    'day': '%d %b %Y',
+    'week': 'Week of %d %b %Y',
+    'month': '%b %Y',
+}
+
+
+def bucket_start(day, period):
+    """First day of the bucket containing ``day`` (weeks start on Monday)."""
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def next_bucket(start, period):
+    """First day of the bucket following the one starting on ``start``."""
+    if period == 'month':
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+    if period == 'week':
+        return start + timedelta(days=7)
+    return start + timedelta(days=1)
+
+
+def bucket_range(first_day, last_day, period):
+    """All bucket start days covering the inclusive range of days."""
+    buckets = []
+    current = bucket_start(first_day, period)
+    while current <= last_day:
+        buckets.append(current)
+        current = next_bucket(current, period)
+    return buckets
+
+
+def months_back(day, months):
+    """First day of the month ``months`` calendar months before ``day``."""
+    index = day.year * 12 + day.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def bucket_series(queryset, period, first_day, last_day, field='created_at', **aggregates):
+    """
+    Aggregate ``queryset`` into zero-filled buckets between two local days.
+
+    ``field`` may be a date or datetime field; datetimes are truncated in
+    the current time zone. Each keyword argument is an aggregate expression
+    evaluated per bucket. Returns a list of dicts with ``period``, ``label``
+    and one key per aggregate.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period {period!r}; expected one of {PERIODS}")
+
+    trunc_kwargs = {}
+    if isinstance(queryset.model._meta.get_field(field), DateTimeField):
+        trunc_kwargs['tzinfo'] = timezone.get_current_timezone()
+
+    rows = queryset.order_by().annotate(
+        bucket=Trunc(field, period, **trunc_kwargs)
+    ).values('bucket').annotate(**aggregates)
+
+    totals = {}
+    for row in rows:
+        bucket = row.pop('bucket')
+        if isinstance(bucket, datetime):
+            bucket = timezone.localtime(bucket).date() if timezone.is_aware(bucket) else bucket.date()
+        totals[bucket] = row
+
+    series = []
+    for start in bucket_range(first_day, last_day, period):
+        row = totals.get(start, {})
+        entry = {
+            'period': start,
+            'label': start.strftime(LABEL_FORMATS[period]),
+        }
+        for name in aggregates:
+            entry[name] = row.get(name) or 0
+        series.append(entry)
+    return series
@@ -8,5 +8,6 @@ urlpatterns = [
     path('reports/sales/', views.sales_report, name='sales_report'),
     path('reports/financial/', views.financial_report, name='financial_report'),
     path('reports/agents/', views.agent_performance, name='agent_performance'),
+    path('reports/cache/', views.report_cache_stats, name='report_cache_stats'),
 ]
 
@@ -1,13 +1,65 @@
 from django.shortcuts import render
+from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, Count, Q, Avg
+from django.db.models import Sum, Q
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 from bookings.models import Booking
 from packages.models import Package
 from payments.models import Payment
 from accounts.models import User
-from accounts.decorators import manager_required, accountant_required
+from accounts.decorators import admin_required, manager_required, accountant_required
+from . import cache
+from .cache import cached_report
+from .exports import CHUNK_SIZE, EXPORT_FORMATS, export_response
+from .facts import facts_between
+from .summary import build_summary
+from .timeseries import PERIODS, bucket_series, months_back
+
+
+def _day_start(day):
+    """Aware datetime for local midnight at the start of ``day``."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _report_days(request, default_start):
+    """Parse start/end date filters into an inclusive range of local days."""
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    
+    if start_date:
+        first_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+    else:
+        first_day = default_start
+    
+    if end_date:
+        last_day = datetime.strptime(end_date, '%Y-%m-%d').date()
+    else:
+        last_day = timezone.localdate()
+    
+    return first_day, last_day
+
+
+def _trend_period(request, first_day, last_day):
+    """Bucket size for report trend charts, from ``?interval=`` or the range length."""
+    period = request.GET.get('interval')
+    if period in PERIODS:
+        return period
+    days = (last_day - first_day).days
+    if days <= 31:
+        return 'day'
+    if days <= 183:
+        return 'week'
+    return 'month'
+
+
+def _bookings_between(first_day, last_day):
+    """Raw bookings created within an inclusive range of local days."""
+    return Booking.objects.filter(
+        created_at__gte=_day_start(first_day),
+        created_at__lt=_day_start(last_day + timedelta(days=1))
+    )
 
 
 @login_required
@@ -15,65 +67,54 @@ def dashboard(request):
     """Main dashboard with analytics."""
     user = request.user
     
-    # Date range for analytics (last 30 days)
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=30)
+    # Date range for analytics (last 30 days, as whole local days)
+    today = timezone.localdate()
+    first_day = today - timedelta(days=30)
     
     # Total sales and revenue
-    bookings_query = Booking.objects.filter(created_at__gte=start_date)
+    bookings_query = _bookings_between(first_day, today)
+    facts = facts_between(first_day, today)
+    chart_facts = facts_between(months_back(today, 5), today)
     
     # Sales agents can only see their own data
     if user.is_sales_agent() and not user.is_admin():
         bookings_query = bookings_query.filter(created_by=user)
+        facts = facts.filter(agent=user)
+        chart_facts = chart_facts.filter(agent=user)
     
-    total_sales = bookings_query.count()
-    total_revenue = bookings_query.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    summary = build_summary(facts)
     
     # Pending validations (only for managers/admins)
     pending_validations = 0
     if user.can_validate_booking():
         pending_validations = Booking.objects.filter(status='pending').count()
     
-    # Monthly sales data for chart
-    monthly_sales = []
-    for i in range(6):  # Last 6 months
-        month_start = (end_date - timedelta(days=30*i)).replace(day=1)
-        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-        
-        month_bookings = bookings_query.filter(
-            created_at__gte=month_start,
-            created_at__lte=month_end
-        )
-        
-        monthly_sales.append({
-            'month': month_start.strftime('%b %Y'),
-            'count': month_bookings.count(),
-            'revenue': month_bookings.aggregate(total=Sum('total_amount'))['total'] or 0
-        })
-    
-    monthly_sales.reverse()
+    # Monthly sales data for chart (last 6 calendar months)
+    monthly_sales = bucket_series(
+        chart_facts, 'month', months_back(today, 5), today, field='day',
+        count=Sum('booking_count'),
+        revenue=Sum('total_amount')
+    )
     
     # Recent bookings
     recent_bookings = bookings_query.select_related('package', 'created_by')[:10]
     
     # Top packages
     top_packages = Package.objects.annotate(
-        booking_count=Count('booking')
+        booking_count=Coalesce(Sum('booking_facts__booking_count'), 0)
     ).order_by('-booking_count')[:5]
     
     # Agent performance (for managers/admins)
     agent_performance = None
     if user.can_view_analytics():
+        recent = Q(booking_facts__day__gte=first_day)
         agent_performance = User.objects.filter(role='sales_agent').annotate(
-            total_bookings=Count('created_bookings', filter=Q(created_bookings__created_at__gte=start_date)),
-            total_revenue=Sum('created_bookings__total_amount', filter=Q(created_bookings__created_at__gte=start_date))
+            total_bookings=Coalesce(Sum('booking_facts__booking_count', filter=recent), 0),
+            total_revenue=Sum('booking_facts__total_amount', filter=recent)
         ).order_by('-total_revenue')[:10]
     
     context = {
-        'total_sales': total_sales,
-        'total_revenue': total_revenue,
+        'summary': summary,
         'pending_validations': pending_validations,
         'monthly_sales': monthly_sales,
         'recent_bookings': recent_bookings,
@@ -89,73 +130,83 @@ def dashboard(request):
 def sales_report(request):
     """Detailed sales report."""
     # Date filters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    
-    if start_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d')
-    else:
-        start_date = timezone.now() - timedelta(days=30)
-    
-    if end_date:
-        end_date = datetime.strptime(end_date, '%Y-%m-%d')
-    else:
-        end_date = timezone.now()
+    start_date, end_date = _report_days(
+        request, timezone.localdate() - timedelta(days=30)
+    )
     
     # Filter bookings
-    bookings = Booking.objects.filter(
-        created_at__gte=start_date,
-        created_at__lte=end_date
-    ).select_related('package', 'created_by')
+    bookings = _bookings_between(start_date, end_date).select_related('package', 'created_by')
+    facts = facts_between(start_date, end_date)
     
     # Filter by package
     package_id = request.GET.get('package')
     if package_id:
         bookings = bookings.filter(package_id=package_id)
+        facts = facts.filter(package_id=package_id)
     
     # Filter by destination
-    destination = request.GET.get('destination')
+    destination = request.GET.get('destination', '').strip()
     if destination:
         bookings = bookings.filter(package__destination__icontains=destination)
-    
-    # Summary statistics
-    total_bookings = bookings.count()
-    total_revenue = bookings.aggregate(total=Sum('total_amount'))['total'] or 0
-    total_tax = bookings.aggregate(total=Sum('tax_amount'))['total'] or 0
-    total_commission = bookings.aggregate(total=Sum('commission_amount'))['total'] or 0
-    approved_bookings = bookings.filter(status='approved').count()
-    rejected_bookings = bookings.filter(status='rejected').count()
-    
-    # Sales by package
-    sales_by_package = bookings.values('package__name').annotate(
-        count=Count('id'),
-        revenue=Sum('total_amount')
-    ).order_by('-revenue')
-    
-    # Sales by destination
-    sales_by_destination = bookings.values('package__destination').annotate(
-        count=Count('id'),
-        revenue=Sum('total_amount')
-    ).order_by('-revenue')
+        facts = facts.filter(package__destination__icontains=destination)
+    
+    # CSV/XLSX export of every matching booking
+    export_format = request.GET.get('format')
+    if export_format in EXPORT_FORMATS:
+        rows = bookings.order_by('created_at', 'id').values_list(
+            'booking_number', 'created_at', 'customer_name', 'package__name',
+            'package__destination', 'created_by__username', 'status',
+            'subtotal', 'tax_amount', 'commission_amount', 'total_amount'
+        ).iterator(chunk_size=CHUNK_SIZE)
+        return export_response(export_format, f'sales_report_{start_date}_{end_date}', [
+            'Booking #', 'Created', 'Customer', 'Package', 'Destination', 'Agent',
+            'Status', 'Subtotal', 'Tax', 'Commission', 'Total'
+        ], rows, 'Sales')
+    
+    interval = _trend_period(request, start_date, end_date)
+    
+    def build():
+        return {
+            # Summary statistics
+            'summary': build_summary(facts),
+            # Sales trend
+            'sales_trend': bucket_series(
+                facts, interval, start_date, end_date, field='day',
+                count=Sum('booking_count'),
+                revenue=Sum('total_amount')
+            ),
+            # Sales by package
+            'sales_by_package': list(facts.values('package__name').annotate(
+                count=Sum('booking_count'),
+                revenue=Sum('total_amount')
+            ).order_by('-revenue')),
+            # Sales by destination
+            'sales_by_destination': list(facts.values('package__destination').annotate(
+                count=Sum('booking_count'),
+                revenue=Sum('total_amount')
+            ).order_by('-revenue')),
+        }
+    
+    report = cached_report('sales', request.user, {
+        'start_date': start_date,
+        'end_date': end_date,
+        'interval': interval,
+        'package': package_id,
+        'destination': destination,
+    }, start_date, end_date, build)
     
     # Get all packages for filter
     packages = Package.objects.all()
     
     context = {
-        'bookings': bookings,
+        'bookings': bookings[:100],  # Limit for display; exports carry every row
         'start_date': start_date,
         'end_date': end_date,
-        'total_bookings': total_bookings,
-        'total_revenue': total_revenue,
-        'total_tax': total_tax,
-        'total_commission': total_commission,
-        'approved_bookings': approved_bookings,
-        'rejected_bookings': rejected_bookings,
-        'sales_by_package': sales_by_package,
-        'sales_by_destination': sales_by_destination,
+        'interval': interval,
         'packages': packages,
         'package_id': package_id,
         'destination': destination,
+        **report,
     }
     
     return render(request, 'analytics/sales_report.html', context)
@@ -165,60 +216,73 @@ def sales_report(request):
 @accountant_required
 def financial_report(request):
     """Financial and GST report."""
-    # Date filters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    
-    if start_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d')
-    else:
-        start_date = timezone.now().replace(day=1)  # Start of current month
-    
-    if end_date:
-        end_date = datetime.strptime(end_date, '%Y-%m-%d')
-    else:
-        end_date = timezone.now()
+    # Date filters (default: start of current month)
+    start_date, end_date = _report_days(
+        request, timezone.localdate().replace(day=1)
+    )
     
     # Filter bookings
-    bookings = Booking.objects.filter(
-        created_at__gte=start_date,
-        created_at__lte=end_date,
+    bookings = _bookings_between(start_date, end_date).filter(
         status='approved'
     ).select_related('package')
-    
-    # Financial summary
-    total_revenue = bookings.aggregate(total=Sum('total_amount'))['total'] or 0
-    total_subtotal = bookings.aggregate(total=Sum('subtotal'))['total'] or 0
-    total_tax = bookings.aggregate(total=Sum('tax_amount'))['total'] or 0
-    total_commission = bookings.aggregate(total=Sum('commission_amount'))['total'] or 0
-    total_discount = bookings.aggregate(total=Sum('discount_amount'))['total'] or 0
-    
-    # GST breakdown by rate
-    gst_breakdown = bookings.values('package__tax_percentage').annotate(
-        count=Count('id'),
-        subtotal=Sum('subtotal'),
-        tax_amount=Sum('tax_amount')
-    ).order_by('package__tax_percentage')
-    
-    # Payment summary
-    payments = Payment.objects.filter(
-        booking__in=bookings
-    )
-    total_paid = payments.aggregate(total=Sum('amount_paid'))['total'] or 0
-    pending_payments = total_revenue - total_paid
+    facts = facts_between(start_date, end_date).filter(status='approved')
+    
+    # CSV/XLSX export of every approved booking
+    export_format = request.GET.get('format')
+    if export_format in EXPORT_FORMATS:
+        rows = bookings.order_by('created_at', 'id').values_list(
+            'booking_number', 'created_at', 'package__name', 'package__tax_percentage',
+            'subtotal', 'discount_amount', 'tax_amount', 'commission_amount',
+            'total_amount', 'payment__amount_paid', 'payment__payment_status'
+        ).iterator(chunk_size=CHUNK_SIZE)
+        return export_response(export_format, f'financial_report_{start_date}_{end_date}', [
+            'Booking #', 'Created', 'Package', 'GST Rate (%)', 'Subtotal', 'Discount',
+            'GST', 'Commission', 'Total', 'Amount Paid', 'Payment Status'
+        ], rows, 'Financial')
+    
+    interval = _trend_period(request, start_date, end_date)
+    
+    def build():
+        # Financial summary
+        summary = build_summary(facts)
+        
+        # Payment summary
+        payments = Payment.objects.filter(
+            booking__in=bookings
+        )
+        total_paid = payments.aggregate(total=Sum('amount_paid'))['total'] or 0
+        
+        return {
+            'summary': summary,
+            # Revenue and GST trend
+            'revenue_trend': bucket_series(
+                facts, interval, start_date, end_date, field='day',
+                count=Sum('booking_count'),
+                revenue=Sum('total_amount'),
+                tax=Sum('tax_amount')
+            ),
+            # GST breakdown by rate
+            'gst_breakdown': list(facts.values('package__tax_percentage').annotate(
+                count=Sum('booking_count'),
+                subtotal=Sum('subtotal'),
+                tax_amount=Sum('tax_amount')
+            ).order_by('package__tax_percentage')),
+            'total_paid': total_paid,
+            'pending_payments': summary.total_revenue - total_paid,
+        }
+    
+    report = cached_report('financial', request.user, {
+        'start_date': start_date,
+        'end_date': end_date,
+        'interval': interval,
+    }, start_date, end_date, build)
     
     context = {
         'start_date': start_date,
         'end_date': end_date,
-        'total_revenue': total_revenue,
-        'total_subtotal': total_subtotal,
-        'total_tax': total_tax,
-        'total_commission': total_commission,
-        'total_discount': total_discount,
-        'gst_breakdown': gst_breakdown,
-        'total_paid': total_paid,
-        'pending_payments': pending_payments,
+        'interval': interval,
         'bookings': bookings[:50],  # Limit for display
+        **report,
     }
     
     return render(request, 'analytics/financial_report.html', context)
@@ -229,50 +293,84 @@ def financial_report(request):
 def agent_performance(request):
     """Agent performance report."""
     # Date filters
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
+    start_date, end_date = _report_days(
+        request, timezone.localdate() - timedelta(days=30)
+    )
     
-    if start_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d')
-    else:
-        start_date = timezone.now() - timedelta(days=30)
+    interval = _trend_period(request, start_date, end_date)
     
-    if end_date:
-        end_date = datetime.strptime(end_date, '%Y-%m-%d')
-    else:
-        end_date = timezone.now()
-    
-    # Agent statistics
-    agents = User.objects.filter(role='sales_agent').annotate(
-        total_bookings=Count('created_bookings', filter=Q(
-            created_bookings__created_at__gte=start_date,
-            created_bookings__created_at__lte=end_date
-        )),
-        approved_bookings=Count('created_bookings', filter=Q(
-            created_bookings__status='approved',
-            created_bookings__created_at__gte=start_date,
-            created_bookings__created_at__lte=end_date
-        )),
-        rejected_bookings=Count('created_bookings', filter=Q(
-            created_bookings__status='rejected',
-            created_bookings__created_at__gte=start_date,
-            created_bookings__created_at__lte=end_date
-        )),
-        total_revenue=Sum('created_bookings__total_amount', filter=Q(
-            created_bookings__created_at__gte=start_date,
-            created_bookings__created_at__lte=end_date
-        )),
-        avg_booking_value=Avg('created_bookings__total_amount', filter=Q(
-            created_bookings__created_at__gte=start_date,
-            created_bookings__created_at__lte=end_date
-        ))
-    ).order_by('-total_revenue')
+    def build():
+        # Agent statistics
+        in_range = Q(
+            booking_facts__day__gte=start_date,
+            booking_facts__day__lte=end_date
+        )
+        agents = list(User.objects.filter(role='sales_agent').annotate(
+            total_bookings=Sum('booking_facts__booking_count', filter=in_range),
+            approved_bookings=Sum('booking_facts__booking_count', filter=in_range & Q(
+                booking_facts__status='approved'
+            )),
+            rejected_bookings=Sum('booking_facts__booking_count', filter=in_range & Q(
+                booking_facts__status='rejected'
+            )),
+            total_revenue=Sum('booking_facts__total_amount', filter=in_range)
+        ).order_by('-total_revenue'))
+        
+        for agent in agents:
+            if agent.total_bookings:
+                agent.avg_booking_value = agent.total_revenue / agent.total_bookings
+            else:
+                agent.avg_booking_value = None
+        
+        return {
+            'agents': agents,
+            # Agent sales trend
+            'agent_trend': bucket_series(
+                facts_between(start_date, end_date).filter(agent__role='sales_agent'),
+                interval, start_date, end_date, field='day',
+                count=Sum('booking_count'),
+                revenue=Sum('total_amount')
+            ),
+        }
+    
+    report = cached_report('agents', request.user, {
+        'start_date': start_date,
+        'end_date': end_date,
+        'interval': interval,
+    }, start_date, end_date, build)
+    
+    # CSV/XLSX export of the agent table
+    export_format = request.GET.get('format')
+    if export_format in EXPORT_FORMATS:
+        rows = (
+            [
+                agent.get_full_name() or agent.username,
+                agent.total_bookings or 0,
+                agent.approved_bookings or 0,
+                agent.rejected_bookings or 0,
+                agent.total_revenue or 0,
+                round(agent.avg_booking_value or 0, 2),
+            ]
+            for agent in report['agents']
+        )
+        return export_response(export_format, f'agent_performance_{start_date}_{end_date}', [
+            'Agent', 'Total Bookings', 'Approved', 'Rejected', 'Total Revenue', 'Avg Booking Value'
+        ], rows, 'Agents')
     
     context = {
-        'agents': agents,
         'start_date': start_date,
         'end_date': end_date,
+        'interval': interval,
+        **report,
     }
     
     return render(request, 'analytics/agent_performance.html', context)
 
+
+@login_required
+@admin_required
+def report_cache_stats(request):
+    """Report cache hit/miss/eviction counters (admin only). POST clears the cache."""
+    if request.method == 'POST':
+        cache.clear()
+    return JsonResponse(cache.get_stats())
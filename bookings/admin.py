@@ -1,4 +1,5 @@
 from django.contrib import admin
+from payments import tasks
 from .models import Booking, AuditLog
 
 
@@ -7,11 +8,13 @@ class BookingAdmin(admin.ModelAdmin):
     list_display = ['booking_number', 'customer_name', 'package', 'total_amount', 
                     'status', 'created_at', 'created_by']
     list_filter = ['status', 'travel_date', 'created_at', 'price_mismatch_flag', 
-                   'excess_discount_flag', 'duplicate_booking_flag']
+                   'excess_discount_flag', 'duplicate_booking_flag', 'near_duplicate_flag']
     search_fields = ['booking_number', 'customer_name', 'customer_email', 'customer_phone']
     readonly_fields = ['booking_number', 'created_at', 'updated_at', 'validated_at',
-                       'price_mismatch_flag', 'excess_discount_flag', 'duplicate_booking_flag']
+                       'price_mismatch_flag', 'excess_discount_flag', 'duplicate_booking_flag',
+                       'near_duplicate_flag']
     date_hierarchy = 'created_at'
+    actions = ['generate_invoices']
     
     fieldsets = (
         ('Booking Information', {
@@ -31,7 +34,8 @@ class BookingAdmin(admin.ModelAdmin):
             'fields': ('validated_by', 'validated_at', 'validation_notes')
         }),
         ('Flags', {
-            'fields': ('price_mismatch_flag', 'excess_discount_flag', 'duplicate_booking_flag'),
+            'fields': ('price_mismatch_flag', 'excess_discount_flag', 'duplicate_booking_flag',
+                      'near_duplicate_flag'),
             'classes': ('collapse',)
         }),
         ('Metadata', {
@@ -39,14 +43,24 @@ class BookingAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    @admin.action(description='Generate invoices for selected approved bookings')
+    def generate_invoices(self, request, queryset):
+        # Only the rows are created here; the invoice worker renders the PDFs
+        queued = tasks.enqueue_uninvoiced(queryset, user=request.user)
+        self.message_user(
+            request, f'Queued {queued} invoices; their PDFs are being generated in the background.'
+        )
 
 
 @admin.register(AuditLog)
 class AuditLogAdmin(admin.ModelAdmin):
     list_display = ['model_name', 'object_id', 'action', 'user', 'timestamp']
-    list_filter = ['action', 'model_name', 'timestamp']
-    search_fields = ['model_name', 'notes']
+    # No notes search or date hierarchy: both scan the whole table. The
+    # auditor's audit trail view filters on indexed fields instead.
+    list_filter = ['action', 'timestamp']
+    list_select_related = ['user']
+    show_full_result_count = False
     readonly_fields = ['model_name', 'object_id', 'action', 'user', 'changes', 
                       'ip_address', 'timestamp', 'notes']
-    date_hierarchy = 'timestamp'
 
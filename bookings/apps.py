@@ -5,3 +5,5 @@ class BookingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookings'
 
+    def ready(self):
+        from . import signals  # noqa: F401
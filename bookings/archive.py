@@ -0,0 +1,208 @@
+"""
+Cold storage for old audit log entries.
+
+``archive`` moves ``AuditLog`` rows older than the retention window out of
+the ``audit_logs`` table into one gzip-compressed JSON Lines file per
+month under ``settings.AUDIT_ARCHIVE['ROOT']``, so the table and its
+indexes stay small and inserts stay cheap.
+
+Each run appends its rows to a month file as gzip members of at most
+``MEMBER_SIZE`` rows; a multi-member file is still an ordinary ``.gz``
+file. Next to it a small JSON sidecar index records each member's byte
+range and, for every ``model_name:object_id``, the members holding that
+object's entries, so ``search_archive`` only decompresses the members it
+needs. The audit trail shows an object's archived entries with it.
+
+A run loads each month's index once and rewrites it every
+``INDEX_EVERY`` members and at the end, not after every member. Rows are
+deleted from the table only after their members are synced and an index
+listing them is on disk. A run interrupted in between leaves the rows in
+both places (and possibly unindexed bytes at the end of a month file);
+the next run archives them again, and readers drop the duplicates by id.
+Only one archival run may write to a root at a time.
+"""
+import gzip
+import json
+import os
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import AuditLog
+
+
+DEFAULTS = {
+    'ROOT': os.path.join(settings.BASE_DIR, 'archive', 'audit_logs'),
+    'RETENTION_DAYS': 180,
+}
+
+# Rows per gzip member, the unit a lookup decompresses
+MEMBER_SIZE = 1000
+
+# Members appended between index writes (and deletes from the table)
+INDEX_EVERY = 50
+
+FIELDS = ('id', 'model_name', 'object_id', 'action', 'user_id', 'changes',
+          'ip_address', 'timestamp', 'notes')
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'AUDIT_ARCHIVE', {}))
+    return config
+
+
+def _paths(root, month):
+    return os.path.join(root, f'{month}.jsonl.gz'), os.path.join(root, f'{month}.index.json')
+
+
+def object_key(model_name, object_id):
+    return f'{model_name}:{object_id}'
+
+
+def _load_index(path):
+    try:
+        with open(path) as index_file:
+            return json.load(index_file)
+    except FileNotFoundError:
+        return {'members': [], 'keys': {}}
+
+
+def _save_index(path, index):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as index_file:
+        json.dump(index, index_file, separators=(',', ':'))
+        index_file.flush()
+        os.fsync(index_file.fileno())
+    os.replace(tmp, path)
+
+
+def _serialize(row):
+    row = dict(zip(FIELDS, row))
+    row['timestamp'] = row['timestamp'].isoformat()
+    return json.dumps(row, separators=(',', ':'), default=str)
+
+
+def append_month(root, month, rows, index):
+    """
+    Append ``FIELDS`` tuples of one month to its archive as one gzip member
+    and record it in ``index``, the month's sidecar index in memory.
+    """
+    os.makedirs(root, exist_ok=True)
+    data_path, _ = _paths(root, month)
+    payload = ''.join(_serialize(row) + '\n' for row in rows).encode()
+    member = gzip.compress(payload, compresslevel=6, mtime=0)
+
+    with open(data_path, 'ab') as data_file:
+        offset = data_file.tell()
+        data_file.write(member)
+        data_file.flush()
+        # On disk before any index that points at it
+        os.fsync(data_file.fileno())
+
+    number = len(index['members'])
+    index['members'].append([offset, len(member), len(rows)])
+    for key in {object_key(row[1], row[2]) for row in rows}:
+        index['keys'].setdefault(key, []).append(number)
+    return len(member)
+
+
+def archive(before=None, batch_size=MEMBER_SIZE, root=None, dry_run=False):
+    """
+    Move audit rows with a timestamp before ``before`` (default: the
+    retention window) to the monthly archives. Returns ``(rows, months,
+    bytes written)``.
+    """
+    config = get_config()
+    root = root or config['ROOT']
+    if before is None:
+        before = timezone.now() - timedelta(days=config['RETENTION_DAYS'])
+
+    old = AuditLog.objects.filter(timestamp__lt=before)
+    if dry_run:
+        return old.count(), len(old.dates('timestamp', 'month')), 0
+
+    archived, months, written = 0, set(), 0
+    # Indexes of the months written since the last checkpoint, and the rows
+    # those writes moved
+    indexes, unsaved, archived_pks = {}, 0, []
+
+    def checkpoint():
+        for month, index in sorted(indexes.items()):
+            _save_index(_paths(root, month)[1], index)
+        with transaction.atomic():
+            for start in range(0, len(archived_pks), batch_size):
+                AuditLog.objects.filter(pk__in=archived_pks[start:start + batch_size]).delete()
+        indexes.clear()
+        archived_pks.clear()
+
+    last_pk = 0
+    while True:
+        rows = list(old.filter(pk__gt=last_pk).order_by('pk').values_list(*FIELDS)[:batch_size])
+        if not rows:
+            checkpoint()
+            return archived, len(months), written
+        last_pk = rows[-1][0]
+
+        by_month = {}
+        for row in rows:
+            month = timezone.localtime(row[7]).strftime('%Y-%m')
+            by_month.setdefault(month, []).append(row)
+        for month, month_rows in sorted(by_month.items()):
+            if month not in indexes:
+                indexes[month] = _load_index(_paths(root, month)[1])
+            written += append_month(root, month, month_rows, indexes[month])
+            months.add(month)
+            unsaved += 1
+
+        archived_pks.extend(row[0] for row in rows)
+        archived += len(rows)
+        if unsaved >= INDEX_EVERY:
+            checkpoint()
+            unsaved = 0
+
+
+def _read_member(data_file, offset, length):
+    data_file.seek(offset)
+    text = zlib.decompress(data_file.read(length), wbits=31).decode()
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+def _entry(row):
+    row = dict(row)
+    row['timestamp'] = parse_datetime(row['timestamp'])
+    return AuditLog(**row)
+
+
+def archived_months(root=None):
+    root = root or get_config()['ROOT']
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len('.index.json')] for name in names if name.endswith('.index.json'))
+
+
+def search_archive(model_name, object_id, root=None):
+    """Archived entries of one object as unsaved ``AuditLog`` instances."""
+    root = root or get_config()['ROOT']
+    object_id = int(object_id)
+    key = object_key(model_name, object_id)
+    # By id: a run interrupted before deleting its rows archives them twice
+    entries = {}
+    for month in archived_months(root):
+        data_path, index_path = _paths(root, month)
+        index = _load_index(index_path)
+        members = index['keys'].get(key)
+        if not members:
+            continue
+        with open(data_path, 'rb') as data_file:
+            for number in members:
+                offset, length, _ = index['members'][number]
+                entries.update(
+                    (row['id'], _entry(row)) for row in _read_member(data_file, offset, length)
+                    if row['model_name'] == model_name and row['object_id'] == object_id
+                )
+    return list(entries.values())
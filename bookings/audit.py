@@ -0,0 +1,229 @@
+"""
+Buffered audit log writer.
+
+``log`` records an ``AuditLog`` entry without an ``INSERT`` in the request
+path; ``record`` does the same for entries built with ``entry``, such as
+one per row of a bulk change. Entries are stamped when they are built
+and, once the surrounding transaction commits (so a rolled back action
+leaves no entry), put on a bounded in-process queue. A background thread
+writes them with ``bulk_create`` whenever ``BATCH_SIZE`` entries are
+waiting or the oldest waiting entry is ``FLUSH_INTERVAL`` seconds old, and
+drains the queue when the process exits.
+
+When the queue is full the entry is written synchronously instead, so
+entries are never dropped for lack of space; only a batch that fails to
+write even row by row loses entries, which are counted and logged. With
+``settings.AUDIT_LOG['BACKGROUND']`` False every entry is written
+synchronously (e.g. for tests against an in-memory database).
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import AuditLog
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKGROUND': True,
+    'MAX_QUEUE': 10000,  # entries waiting before writes fall back to synchronous
+    'BATCH_SIZE': 200,  # entries per bulk_create
+    'FLUSH_INTERVAL': 1.0,  # seconds an entry may wait for a full batch
+    'LATE_AFTER': 5.0,  # seconds after which a write counts as late
+}
+
+# Put on the queue to stop the flusher
+_STOP = object()
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'AUDIT_LOG', {}))
+    return config
+
+
+class AuditWriter:
+    """Bounded queue of pending ``AuditLog`` rows and the thread that writes them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.dropped = 0
+        self.late = 0
+        self.max_delay = 0.0
+
+    def _start(self, config):
+        """Start the flusher, again in a forked worker whose parent had one."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=config['MAX_QUEUE'])
+            self._thread = threading.Thread(
+                target=self._run, args=(self._queue, config), daemon=True, name='audit-log-writer'
+            )
+            self._thread.start()
+
+    def put(self, entry):
+        config = get_config()
+        if not config['BACKGROUND']:
+            self._write_now([entry])
+            return
+        self._start(config)
+        try:
+            self._queue.put_nowait(entry)
+            self.enqueued += 1
+        except queue.Full:
+            self._write_now([entry])
+
+    def put_many(self, entries):
+        if not get_config()['BACKGROUND']:
+            self._write_now(entries)
+            return
+        for entry in entries:
+            self.put(entry)
+
+    def _write_now(self, entries):
+        self.sync_writes += len(entries)
+        self._write(entries, get_config())
+
+    def _run(self, entries, config):
+        stop = False
+        while not stop:
+            first = entries.get()
+            if first is _STOP:
+                entries.task_done()
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + config['FLUSH_INTERVAL']
+            while len(batch) < config['BATCH_SIZE']:
+                timeout = deadline - time.monotonic()
+                try:
+                    entry = entries.get(timeout=timeout) if timeout > 0 else entries.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    entries.task_done()
+                    stop = True
+                    break
+                batch.append(entry)
+
+            close_old_connections()
+            self._write(batch, config)
+            for _ in batch:
+                entries.task_done()
+        close_old_connections()
+
+    def _write(self, batch, config):
+        try:
+            AuditLog.objects.bulk_create(batch)
+        except Exception:
+            # Isolate the rows that cannot be written
+            logger.exception('Writing %d audit log entries failed; retrying one by one', len(batch))
+            written = []
+            for entry in batch:
+                try:
+                    entry.save(force_insert=True)
+                    written.append(entry)
+                except Exception:
+                    self.dropped += 1
+                    logger.exception('Dropped audit log entry %s %s #%s',
+                                     entry.action, entry.model_name, entry.object_id)
+            batch = written
+
+        now = timezone.now()
+        self.written += len(batch)
+        self.batches += 1
+        for entry in batch:
+            delay = (now - entry.timestamp).total_seconds()
+            self.max_delay = max(self.max_delay, delay)
+            if delay > config['LATE_AFTER']:
+                self.late += 1
+
+    def flush(self, timeout=None):
+        """Wait until every queued entry is written. Returns False on timeout."""
+        thread, entries = self._thread, self._queue
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while entries.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout=10):
+        """Write what is queued and stop the flusher."""
+        thread, entries = self._thread, self._queue
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        entries.put(_STOP)
+        thread.join(timeout)
+
+    def get_stats(self):
+        entries = self._queue if self._pid == os.getpid() else None
+        return {
+            'queue_depth': entries.qsize() if entries is not None else 0,
+            'max_queue': get_config()['MAX_QUEUE'],
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'batches': self.batches,
+            'sync_writes': self.sync_writes,
+            'dropped': self.dropped,
+            'late': self.late,
+            'max_delay': round(self.max_delay, 3),
+            'background': get_config()['BACKGROUND'],
+            'pid': os.getpid(),
+        }
+
+
+writer = AuditWriter()
+atexit.register(writer.stop)
+
+
+def entry(model_name, object_id, action, user, changes=None, notes='', ip_address=None):
+    """An unsaved ``AuditLog`` entry stamped now, for ``record``."""
+    return AuditLog(
+        model_name=model_name,
+        object_id=object_id,
+        action=action,
+        user=user,
+        changes=changes or {},
+        notes=notes,
+        ip_address=ip_address,
+        timestamp=timezone.now(),
+    )
+
+
+def record(entries, using=None):
+    """Record ``entries`` once the current transaction on ``using`` commits."""
+    entries = list(entries)
+    if entries:
+        transaction.on_commit(lambda: writer.put_many(entries), using=using)
+
+
+def log(model_name, object_id, action, user, changes=None, notes='', ip_address=None):
+    """Record an audit log entry once the current transaction commits."""
+    record([entry(model_name, object_id, action, user, changes, notes, ip_address)])
+
+
+def flush(timeout=None):
+    return writer.flush(timeout)
+
+
+def get_stats():
+    """Queue depth and write counters of this worker's audit writer."""
+    return writer.get_stats()
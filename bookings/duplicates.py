@@ -0,0 +1,110 @@
+"""
+Duplicate booking detection.
+
+A booking is a duplicate when another pending or approved booking exists
+for the same customer email, package and travel date. Those three values
+are normalized and hashed into ``Booking.duplicate_fingerprint``, which is
+indexed together with ``status`` so the check is a single index lookup.
+
+``check_and_save`` runs the check and the insert in one transaction while
+holding a lock on the package row, so two agents submitting the same
+booking at the same moment cannot both get through unflagged.
+"""
+import hashlib
+from django.db import connections, router, transaction
+from django.db.models import F
+
+
+# Statuses that make a later booking with the same fingerprint a duplicate
+DUPLICATE_STATUSES = ('pending', 'approved')
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def fingerprint(email, package_id, travel_date):
+    """Stable 40 character key for the (email, package, travel date) triple."""
+    travel_day = travel_date.isoformat() if hasattr(travel_date, 'isoformat') else str(travel_date or '')
+    key = f'{normalize_email(email)}|{package_id or ""}|{travel_day}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def lock_package(package_model, package_id, using='default'):
+    """
+    Serialize duplicate checks for one package until the transaction ends.
+
+    Databases with row locks take ``SELECT ... FOR UPDATE`` on the package.
+    SQLite has none, so a no-op UPDATE takes its database write lock instead.
+    """
+    if connections[using].features.has_select_for_update:
+        list(package_model.objects.using(using).select_for_update().filter(
+            pk=package_id
+        ).values_list('pk', flat=True))
+    else:
+        package_model.objects.using(using).filter(pk=package_id).update(id=F('id'))
+
+
+def check_and_save(booking):
+    """
+    Flag ``booking`` if it duplicates or nearly duplicates an existing one
+    and save it, atomically. Returns True if either flag was set.
+    """
+    model = type(booking)
+    using = router.db_for_write(model, instance=booking)
+    package_model = model._meta.get_field('package').related_model
+    with transaction.atomic(using=using):
+        lock_package(package_model, booking.package_id, using)
+        booking.check_duplicate()
+        booking.check_near_duplicate()
+        booking.save(using=using)
+    return booking.duplicate_booking_flag or booking.near_duplicate_flag
+
+
+def backfill_fingerprints(queryset, batch_size=2000):
+    """Fill in missing fingerprints, e.g. for rows written with ``bulk_create``."""
+    model = queryset.model
+    updated = 0
+    rows = queryset.filter(duplicate_fingerprint='').order_by().values_list(
+        'pk', 'customer_email', 'package_id', 'travel_date'
+    ).iterator(chunk_size=batch_size)
+    batch = []
+    for pk, email, package_id, travel_date in rows:
+        batch.append(model(pk=pk, duplicate_fingerprint=fingerprint(email, package_id, travel_date)))
+        if len(batch) >= batch_size:
+            model.objects.bulk_update(batch, ['duplicate_fingerprint'])
+            updated += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, ['duplicate_fingerprint'])
+        updated += len(batch)
+    return updated
+
+
+def scan(queryset, batch_size=2000):
+    """
+    Recompute ``duplicate_booking_flag`` for every booking in one sorted pass.
+
+    Rows are streamed ordered by ``(duplicate_fingerprint, created_at, id)``.
+    Within a fingerprint group a booking is a duplicate when an earlier one
+    is still pending or approved, which is what ``check_duplicate`` saw when
+    the later booking was created. Yields ``(pk, flag)`` for each booking
+    whose stored flag is wrong.
+    """
+    rows = queryset.exclude(duplicate_fingerprint='').order_by(
+        'duplicate_fingerprint', 'created_at', 'id'
+    ).values_list(
+        'pk', 'duplicate_fingerprint', 'status', 'duplicate_booking_flag'
+    ).iterator(chunk_size=batch_size)
+
+    current = None
+    seen_active = False
+    for pk, key, status, flagged in rows:
+        if key != current:
+            current = key
+            seen_active = False
+        expected = seen_active
+        if expected != flagged:
+            yield pk, expected
+        if status in DUPLICATE_STATUSES:
+            seen_active = True
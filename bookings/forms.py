@@ -1,16 +1,54 @@
 from django import forms
 from django.core.validators import RegexValidator
-from .models import Booking
+from .models import AuditLog, Booking
+from .validation import MAX_BULK_VALIDATE
+from accounts.models import User
+from packages import catalog
 from packages.models import Package
 from decimal import Decimal
 import re
 
 
+class CatalogChoiceIterator(forms.models.ModelChoiceIterator):
+    """Package choices read from the catalog each time the widget renders."""
+    
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for package in catalog.active_packages():
+            yield self.choice(package)
+    
+    def __len__(self):
+        return len(catalog.active_packages()) + (self.field.empty_label is not None)
+    
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(catalog.active_packages())
+
+
+class PackageChoiceField(forms.ModelChoiceField):
+    """Active package choice served from the in-process catalog instead of a query."""
+    
+    iterator = CatalogChoiceIterator
+    
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Package.objects.filter(is_active=True), **kwargs)
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            package = catalog.get_package(int(value))
+        except (TypeError, ValueError):
+            package = None
+        if package is None or not package.is_active:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return package
+
+
 class BookingForm(forms.ModelForm):
     """Form for creating/editing bookings."""
     
-    package = forms.ModelChoiceField(
-        queryset=Package.objects.filter(is_active=True),
+    package = PackageChoiceField(
         widget=forms.Select(attrs={'class': 'form-control', 'id': 'id_package'}),
         empty_label="Select a package"
     )
@@ -75,6 +113,13 @@ class BookingForm(forms.ModelForm):
             }),
         }
     
+    def _get_validation_exclusions(self):
+        # The package field already checked the choice against the catalog;
+        # model validation would look it up again with a query
+        exclude = super()._get_validation_exclusions()
+        exclude.add('package')
+        return exclude
+    
     def clean_discount_percentage(self):
         """Validate discount percentage."""
         discount = self.cleaned_data.get('discount_percentage')
@@ -187,3 +232,84 @@ class BookingValidationForm(forms.Form):
         
         return cleaned_data
 
+
+
+class BookingImportForm(forms.Form):
+    """Form for uploading a CSV or JSON file of bookings."""
+    
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.json'}),
+        help_text="CSV with a header row, or a JSON list of objects, using the booking form field names"
+    )
+    
+    def clean_file(self):
+        """Validate the file extension."""
+        upload = self.cleaned_data.get('file')
+        if upload and not upload.name.lower().endswith(('.csv', '.json')):
+            raise forms.ValidationError('Only .csv and .json files can be imported.')
+        return upload
+
+
+class BulkValidationForm(BookingValidationForm):
+    """Form for approving or rejecting many pending bookings at once."""
+    
+    booking_ids = forms.Field(widget=forms.MultipleHiddenInput)
+    
+    def clean_booking_ids(self):
+        """Validate the selection: a non-empty, bounded list of ids."""
+        try:
+            ids = sorted({int(value) for value in self.cleaned_data.get('booking_ids') or []})
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Invalid booking selection.')
+        if not ids:
+            raise forms.ValidationError('Select at least one booking.')
+        if len(ids) > MAX_BULK_VALIDATE:
+            raise forms.ValidationError(f'Select at most {MAX_BULK_VALIDATE} bookings at a time.')
+        return ids
+
+
+class AuditTrailForm(forms.Form):
+    """Filters of the auditor's audit trail view; every field is optional."""
+    
+    user = forms.ModelChoiceField(
+        queryset=User.objects.order_by('username'),
+        required=False,
+        empty_label='All users',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    action = forms.ChoiceField(
+        choices=[('', 'All actions')] + AuditLog.ACTION_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    model_name = forms.CharField(
+        max_length=100,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Model, e.g. Booking'})
+    )
+    object_id = forms.IntegerField(
+        min_value=0,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Object ID'})
+    )
+    start = forms.DateTimeField(
+        required=False,
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'})
+    )
+    end = forms.DateTimeField(
+        required=False,
+        widget=forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'})
+    )
+    
+    def clean_model_name(self):
+        return self.cleaned_data.get('model_name', '').strip()
+    
+    def clean(self):
+        """An object ID needs its model; the range must not end before it starts."""
+        cleaned_data = super().clean()
+        if cleaned_data.get('object_id') is not None and not cleaned_data.get('model_name'):
+            raise forms.ValidationError({'model_name': 'Enter the model of the object.'})
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and end < start:
+            raise forms.ValidationError({'end': 'The end must not be before the start.'})
+        return cleaned_data
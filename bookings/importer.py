@@ -0,0 +1,235 @@
+"""
+Bulk booking import from CSV or JSON.
+
+Rows use the ``BookingForm`` field names (``package`` is the package id)
+and are validated with the same rules. Valid rows are priced in memory,
+checked for exact and near duplicates against one batched lookup per
+chunk, and written with ``bulk_create``, one transaction per chunk; their
+audit log entries are recorded through ``audit`` once the chunk commits.
+Invalid rows are skipped and reported with their row number.
+"""
+import csv
+import json
+import time
+import uuid
+from django import forms
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from packages import catalog
+from packages.models import Package
+from . import audit
+from .duplicates import DUPLICATE_STATUSES, lock_package
+from .forms import BookingForm
+from .matching import KEY_FIELDS, BlockIndex
+from .models import Booking
+from .signals import bookings_created
+
+
+IMPORT_FORMATS = ('csv', 'json')
+
+# Rows validated and written per transaction
+CHUNK_SIZE = 1000
+
+REPORT_HEADER = ['row', 'field', 'error']
+
+
+class PackageField(forms.Field):
+    """Package by id, looked up in a prefetched dict instead of a query per row."""
+
+    default_error_messages = {
+        'invalid_choice': 'Select a valid package. That choice is not one of the available choices.',
+    }
+
+    def __init__(self, packages, **kwargs):
+        self.packages = packages
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.packages[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+class ImportBookingForm(BookingForm):
+    """
+    ``BookingForm`` whose package choices come from a prefetched dict. It is
+    never rendered, so it leaves out the widget attributes a form built per
+    row would otherwise copy each time.
+    """
+
+    package = PackageField(packages={})
+
+    class Meta(BookingForm.Meta):
+        widgets = {}
+
+    def __init__(self, packages, data):
+        super().__init__(data)
+        self.fields['package'].packages = packages
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.flagged = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(source, import_format):
+    """
+    Yield ``(row_number, data)`` from a text file. CSV rows are numbered by
+    line (the header is line 1), JSON items from 1.
+    """
+    if import_format == 'json':
+        items = json.load(source)
+        if not isinstance(items, list):
+            raise ValueError('JSON import must be a list of booking objects.')
+        for number, item in enumerate(items, start=1):
+            yield number, item if isinstance(item, dict) else {}
+    else:
+        for number, row in enumerate(csv.DictReader(source), start=2):
+            yield number, {key.strip(): (value or '').strip() for key, value in row.items() if key}
+
+
+def _booking_number():
+    return f"BK{timezone.now().strftime('%Y%m%d')}{uuid.uuid4().hex[:10].upper()}"
+
+
+class DuplicateChecker:
+    """
+    Exact and near duplicate detection for one import, one batched lookup
+    per chunk. Rows of earlier chunks stay in the in-memory block index, so
+    the near-duplicate lookup only has to fetch bookings from outside the
+    import.
+    """
+
+    def __init__(self, user, started_at):
+        self.user = user
+        self.started_at = started_at
+        self.index = BlockIndex()
+        self.loaded = set()
+
+    def flag(self, bookings, using):
+        fingerprints = {booking.duplicate_fingerprint for booking in bookings}
+        active = set(Booking.objects.using(using).filter(
+            duplicate_fingerprint__in=fingerprints, status__in=DUPLICATE_STATUSES
+        ).values_list('duplicate_fingerprint', flat=True))
+        self._load_candidates(bookings, using)
+
+        for booking in bookings:
+            trip = (booking.package_id, booking.travel_date)
+            customer = (booking.customer_name, booking.customer_email, booking.customer_phone)
+            booking.duplicate_booking_flag = booking.duplicate_fingerprint in active
+            booking.near_duplicate_flag = self.index.is_near_duplicate(
+                trip, customer, booking.duplicate_fingerprint
+            )
+            booking.set_risk()
+            active.add(booking.duplicate_fingerprint)
+            self.index.add(trip, customer, booking.duplicate_fingerprint)
+
+    def _load_candidates(self, bookings, using):
+        keys = Q()
+        for field in KEY_FIELDS:
+            values = {getattr(booking, field) for booking in bookings} - {''}
+            if values:
+                keys |= Q(**{f'{field}__in': values})
+        if not keys:
+            return
+
+        candidates = Booking.objects.using(using).filter(
+            keys,
+            package_id__in={booking.package_id for booking in bookings},
+            travel_date__in={booking.travel_date for booking in bookings},
+            status__in=DUPLICATE_STATUSES,
+        ).exclude(
+            # Already in the index from earlier chunks
+            created_by=self.user, created_at__gte=self.started_at
+        ).order_by('created_at', 'id').values_list(
+            'pk', 'package_id', 'travel_date', 'customer_name', 'customer_email',
+            'customer_phone', 'duplicate_fingerprint'
+        )
+        for pk, package_id, travel_date, name, email, phone, fingerprint in candidates:
+            if pk not in self.loaded:
+                self.loaded.add(pk)
+                self.index.add((package_id, travel_date), (name, email, phone), fingerprint)
+
+
+def _write_chunk(bookings, user, ip_address, checker):
+    using = router.db_for_write(Booking)
+    with transaction.atomic(using=using):
+        # Same locks as check_and_save, in a fixed order to avoid deadlocks
+        for package_id in sorted({booking.package_id for booking in bookings}):
+            lock_package(Package, package_id, using)
+        checker.flag(bookings, using)
+        Booking.objects.using(using).bulk_create(bookings)
+        audit.record((
+            audit.entry('Booking', booking.pk, 'create', user, {'booking_number': booking.booking_number},
+                        'Bulk import', ip_address)
+            for booking in bookings
+        ), using=using)
+        bookings_created.send(sender=Booking, bookings=bookings)
+
+
+def import_bookings(rows, user, chunk_size=CHUNK_SIZE, ip_address=None):
+    """
+    Validate and create bookings from ``(row_number, data)`` pairs on behalf
+    of ``user``. Returns an ``ImportResult``; ``errors`` holds
+    ``(row_number, field, message)`` for every rejected row.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    packages = {package.pk: package for package in catalog.active_packages()}
+    checker = DuplicateChecker(user, timezone.now())
+
+    chunk = []
+    for number, data in rows:
+        result.rows += 1
+        form = ImportBookingForm(packages, data)
+        if not form.is_valid():
+            for field, messages in form.errors.items():
+                for message in messages:
+                    result.errors.append((number, field, message))
+            continue
+
+        booking = form.save(commit=False)
+        booking.created_by = user
+        booking.booking_number = _booking_number()
+        booking.calculate_totals()
+        booking.validate_pricing()
+        booking.set_derived_fields()
+        chunk.append(booking)
+
+        if len(chunk) >= chunk_size:
+            _write_chunk(chunk, user, ip_address, checker)
+            result.created += len(chunk)
+            result.flagged += sum(_is_flagged(booking) for booking in chunk)
+            chunk = []
+
+    if chunk:
+        _write_chunk(chunk, user, ip_address, checker)
+        result.created += len(chunk)
+        result.flagged += sum(_is_flagged(booking) for booking in chunk)
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def _is_flagged(booking):
+    return (booking.price_mismatch_flag or booking.excess_discount_flag or
+            booking.duplicate_booking_flag or booking.near_duplicate_flag)
+
+
+def write_report(errors, target):
+    """Write ``(row, field, error)`` rows as CSV to a text file object."""
+    writer = csv.writer(target)
+    writer.writerow(REPORT_HEADER)
+    writer.writerows(errors)
@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from bookings import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Move audit log entries older than the retention window out of the audit_logs '
+        'table into compressed monthly JSON Lines archives with a sidecar index.'
+    )
+
+    def add_arguments(self, parser):
+        config = archive.get_config()
+        parser.add_argument('--retention-days', type=int, default=config['RETENTION_DAYS'],
+                            help='Keep entries newer than this many days in the table.')
+        parser.add_argument('--root', default=config['ROOT'], help='Archive directory.')
+        parser.add_argument('--batch-size', type=int, default=archive.MEMBER_SIZE,
+                            help='Entries moved per batch (and per compressed member).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be archived without moving anything.')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['retention_days'])
+        started = time.perf_counter()
+        rows, months, written = archive.archive(
+            before=before,
+            batch_size=options['batch_size'],
+            root=options['root'],
+            dry_run=options['dry_run'],
+        )
+        elapsed = time.perf_counter() - started
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Dry run: would archive {rows} entries older than {before:%Y-%m-%d} '
+                f'across {months} months.'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {rows} entries older than {before:%Y-%m-%d} into {months} monthly '
+            f'files ({written / 1024:.1f} KiB compressed) in {elapsed:.2f}s.'
+        ))
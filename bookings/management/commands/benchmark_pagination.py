@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from bookings.models import Booking
+from bookings.pagination import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = 'Compare OFFSET (Paginator) and keyset (CursorPaginator) latency for a deep booking list page.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--per-page', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        page, per_page, repeat = options['page'], options['per_page'], options['repeat']
+        queryset = Booking.objects.select_related('package', 'created_by', 'validated_by')
+
+        def offset_page():
+            page_obj = Paginator(queryset, per_page).get_page(page)
+            list(page_obj)
+            page_obj.paginator.num_pages
+
+        # Walk to the cursor for the requested page (not timed)
+        paginator = CursorPaginator(queryset, per_page)
+        cursor = None
+        for _ in range(page - 1):
+            cursor = paginator.get_page(cursor).next_cursor
+            if cursor is None:
+                break
+
+        def cursor_page():
+            page_paginator = CursorPaginator(queryset, per_page)
+            list(page_paginator.get_page(cursor))
+            page_paginator.count_label
+
+        for label, func in (('offset', offset_page), ('cursor', cursor_page)):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(
+                f'{label}: page={page} per_page={per_page} '
+                f'best={min(timings) * 1000:.1f}ms avg={sum(timings) / len(timings) * 1000:.1f}ms'
+            )
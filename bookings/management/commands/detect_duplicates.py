@@ -0,0 +1,48 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from bookings import duplicates, risk
+from bookings.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-scan all bookings for duplicates in one pass sorted by fingerprint '
+        'and correct duplicate_booking_flag where it is out of date.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the changes without writing them.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        filled = 0
+        if not options['dry_run']:
+            filled = duplicates.backfill_fingerprints(Booking.objects.all(), batch_size)
+
+        # Collect first: updating the table while the scan cursor is open is
+        # not safe on every backend. Only the changed ids are kept.
+        changes = {True: [], False: []}
+        for pk, flag in duplicates.scan(Booking.objects.all(), batch_size):
+            changes[flag].append(pk)
+
+        if not options['dry_run']:
+            for flag, ids in changes.items():
+                for start in range(0, len(ids), batch_size):
+                    with transaction.atomic():
+                        changed = Booking.objects.filter(pk__in=ids[start:start + batch_size])
+                        changed.update(duplicate_booking_flag=flag, updated_at=timezone.now())
+                        risk.refresh(changed)
+
+        elapsed = time.perf_counter() - started
+        prefix = 'Dry run: would update' if options['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {len(changes[True]) + len(changes[False])} bookings '
+            f'({len(changes[True])} flagged, {len(changes[False])} cleared, '
+            f'{filled} fingerprints filled in) in {elapsed:.2f}s.'
+        ))
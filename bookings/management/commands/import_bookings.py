@@ -0,0 +1,53 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from bookings.importer import CHUNK_SIZE, IMPORT_FORMATS, import_bookings, read_rows, write_report
+
+
+class Command(BaseCommand):
+    help = (
+        'Import bookings from a CSV or JSON file whose columns are the booking form '
+        'fields (package is the package id). Rejected rows are written to an error report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True,
+                            help='Username recorded as the creator of the bookings.')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Defaults to the file extension.')
+        parser.add_argument('--report',
+                            help='Error report path (default: <path>.errors.csv).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}; pass --format.')
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as source:
+                result = import_bookings(
+                    read_rows(source, import_format), user, chunk_size=options['chunk_size']
+                )
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            f'Read {result.rows} rows in {result.elapsed:.2f}s '
+            f'({result.rows_per_second:.0f} rows/s): {result.created} bookings created, '
+            f'{result.flagged} flagged for review.'
+        )
+        if result.errors:
+            report = options['report'] or f'{path}.errors.csv'
+            with open(report, 'w', newline='') as target:
+                write_report(result.errors, target)
+            rejected = len({row for row, _, _ in result.errors})
+            self.stdout.write(self.style.WARNING(f'{rejected} rows rejected, see {report}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All rows imported.'))
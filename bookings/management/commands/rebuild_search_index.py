@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from bookings import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the booking and payment full-text search index.'
+
+    def handle(self, *args, **options):
+        bookings, payments = search.rebuild()
+        backend = type(search.get_backend()).__name__
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {bookings} bookings and {payments} payments ({backend}).'
+        ))
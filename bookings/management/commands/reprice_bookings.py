@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from bookings import pricing
+from bookings.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute discount, subtotal, tax, total and commission of bookings with the '
+        'batch pricing engine and save the ones that changed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='pending',
+                            help='Only bookings with this status ("all" for every booking).')
+        parser.add_argument('--package', type=int, help='Only bookings of this package id.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if options['status'] != 'all':
+            bookings = bookings.filter(status=options['status'])
+        if options['package']:
+            bookings = bookings.filter(package_id=options['package'])
+
+        started = time.perf_counter()
+        changed = pricing.reprice(bookings, batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Repriced {changed} bookings in {elapsed:.2f}s.'))
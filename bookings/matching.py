@@ -0,0 +1,267 @@
+"""
+Near-duplicate booking detection.
+
+Exact duplicates share a fingerprint (see ``duplicates``). Near duplicates
+are the same customer typed slightly differently: a typo in the email, a
+different phone format, a name with other casing or spacing. Each booking
+stores three blocking keys, the normalized phone, the email local part and
+the soundex of the name, so candidates for a new booking come from an index
+lookup on the same trip (package and travel date) rather than from
+comparing every pair. Candidates are then scored and the booking gets
+``near_duplicate_flag`` when one scores at least ``THRESHOLD``.
+
+``scan_groups`` does the same over whole trips in memory; the
+``detect_near_duplicates`` command feeds it to a process pool.
+"""
+import re
+from difflib import SequenceMatcher
+from django.db.models import Case, Q, Value, When
+from .duplicates import DUPLICATE_STATUSES, normalize_email
+
+
+KEY_FIELDS = ('phone_key', 'email_key', 'name_key')
+
+# Score contributed by each signal when it matches perfectly
+WEIGHTS = {'phone': 0.4, 'email': 0.35, 'name': 0.25}
+
+# Minimum score for a candidate to count as a near duplicate
+THRESHOLD = 0.6
+
+# Candidates scored per booking
+MAX_CANDIDATES = 50
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def normalize_phone(phone):
+    """Last ten digits, so "+91 98765-43210" and "09876543210" match."""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= 7 else ''
+
+
+def email_local_part(email):
+    """Local part without dots or a ``+tag``."""
+    local = normalize_email(email).split('@', 1)[0]
+    return local.split('+', 1)[0].replace('.', '')
+
+
+def normalize_name(name):
+    """Lowercase letters only, so casing and spacing do not matter."""
+    return ''.join(char for char in (name or '').casefold() if char.isalpha())
+
+
+def soundex(text):
+    """American soundex code of ``text`` ("" when it has no letters)."""
+    letters = [char for char in text.lower() if 'a' <= char <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = _SOUNDEX_CODES.get(letters[0], '')
+    for char in letters[1:]:
+        digit = _SOUNDEX_CODES.get(char, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if char not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def blocking_keys(name, email, phone):
+    """``(phone_key, email_key, name_key)`` for a customer."""
+    return normalize_phone(phone), email_local_part(email), soundex(normalize_name(name))
+
+
+def normalize(customer):
+    """Comparable form of a ``(name, email, phone)`` customer."""
+    name, email, phone = customer
+    return normalize_name(name), email_local_part(email), normalize_phone(phone)
+
+
+class CustomerMatcher:
+    """
+    Scores many candidates against one normalized customer.
+
+    The customer's strings are set as difflib's second sequence once, so its
+    lookup tables are built once rather than per candidate, and the cheap
+    ``quick_ratio`` upper bound rules most pairs out before ``ratio``.
+    """
+
+    def __init__(self, normalized):
+        self.name, self.local, self.phone = normalized
+        self.name_matcher = SequenceMatcher(None, '', self.name)
+        self.local_matcher = SequenceMatcher(None, '', self.local)
+
+    @staticmethod
+    def _similarity(matcher, own, other, bound):
+        if not own or not other:
+            return 0.0
+        if own == other:
+            return 1.0
+        matcher.set_seq1(other)
+        return matcher.quick_ratio() if bound else matcher.ratio()
+
+    def score(self, other, bound=False):
+        name, local, phone = other
+        return (
+            (WEIGHTS['phone'] if self.phone and self.phone == phone else 0.0) +
+            WEIGHTS['email'] * self._similarity(self.local_matcher, self.local, local, bound) +
+            WEIGHTS['name'] * self._similarity(self.name_matcher, self.name, name, bound)
+        )
+
+    def matches(self, other, threshold=THRESHOLD):
+        return self.score(other, bound=True) >= threshold and self.score(other) >= threshold
+
+
+def score(a, b):
+    """
+    Likelihood in [0, 1] that two ``(name, email, phone)`` customers are the
+    same person.
+    """
+    return CustomerMatcher(normalize(a)).score(normalize(b))
+
+
+def find_near_duplicate(booking, threshold=THRESHOLD):
+    """
+    Best scoring pending or approved booking of the same trip whose customer
+    looks like ``booking``'s, as ``(pk, score)``, or None. Exact duplicates
+    are left to ``check_duplicate``.
+
+    Candidates are taken in the order ``BlockIndex`` uses, phone, email and
+    then name matches, most recent first, so the inline check and the
+    ``detect_near_duplicates`` scan score the same ``MAX_CANDIDATES``.
+    """
+    keys = Q()
+    blocks = []
+    for rank, (field, value) in enumerate(zip(KEY_FIELDS, blocking_keys(
+        booking.customer_name, booking.customer_email, booking.customer_phone
+    ))):
+        if value:
+            keys |= Q(**{field: value})
+            blocks.append(When(Q(**{field: value}), then=Value(rank)))
+    if not keys:
+        return None
+
+    candidates = type(booking).objects.filter(
+        keys,
+        package_id=booking.package_id,
+        travel_date=booking.travel_date,
+        status__in=DUPLICATE_STATUSES,
+    ).exclude(pk=booking.pk).exclude(
+        duplicate_fingerprint=booking.get_fingerprint()
+    ).order_by(
+        Case(*blocks, default=Value(len(KEY_FIELDS))), '-created_at', '-id'
+    ).values_list(
+        'pk', 'customer_name', 'customer_email', 'customer_phone'
+    )[:MAX_CANDIDATES]
+
+    matcher = CustomerMatcher(normalize(
+        (booking.customer_name, booking.customer_email, booking.customer_phone)
+    ))
+    best = None
+    for pk, *other in candidates:
+        value = matcher.score(normalize(other))
+        if value >= threshold and (best is None or value > best[1]):
+            best = (pk, value)
+    return best
+
+
+# Columns ``scan_groups`` expects, in order
+SCAN_FIELDS = (
+    'pk', 'customer_name', 'customer_email', 'customer_phone',
+    'duplicate_fingerprint', 'status', 'near_duplicate_flag',
+)
+
+
+class BlockIndex:
+    """
+    In-memory blocking index of existing customers, for checking many
+    bookings without a query each. Entries are kept per trip, any hashable
+    such as ``(package_id, travel_date)``.
+
+    A booking is scored against at most ``MAX_CANDIDATES`` of the most
+    recent entries sharing a key, phone and email blocks first, so a
+    common name soundex in a large group booking cannot make the check
+    quadratic.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+
+    def _blocks(self, trip, customer):
+        return [(trip, i, key) for i, key in enumerate(blocking_keys(*customer)) if key]
+
+    def add(self, trip, customer, fingerprint):
+        """Add a pending or approved ``(name, email, phone)`` customer."""
+        entry = (normalize(customer), fingerprint)
+        for block in self._blocks(trip, customer):
+            self.blocks.setdefault(block, []).append(entry)
+
+    def is_near_duplicate(self, trip, customer, fingerprint, threshold=THRESHOLD):
+        """True if an indexed customer of ``trip`` scores at least ``threshold``."""
+        candidates = {}
+        for block in self._blocks(trip, customer):
+            entries = self.blocks.get(block, ())
+            for entry in entries[:-MAX_CANDIDATES - 1:-1]:
+                candidates[id(entry)] = entry
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        matcher = CustomerMatcher(normalize(customer))
+        return any(
+            other_fingerprint != fingerprint and matcher.matches(other, threshold)
+            for other, other_fingerprint in candidates.values()
+        )
+
+
+def scan_groups(groups, threshold=THRESHOLD):
+    """
+    Recompute ``near_duplicate_flag`` for bookings grouped by trip.
+
+    Each group holds ``SCAN_FIELDS`` rows of one package and travel date,
+    oldest first. A booking is a near duplicate when an earlier pending or
+    approved booking in the group shares a blocking key, has a different
+    fingerprint and scores at least ``threshold``. Returns ``(pk, flag)``
+    for every booking whose stored flag is wrong. Pure Python, so it can
+    run in a worker process.
+    """
+    changes = []
+    for rows in groups:
+        index = BlockIndex()
+        for pk, name, email, phone, fingerprint, status, flagged in rows:
+            customer = (name, email, phone)
+            expected = index.is_near_duplicate(None, customer, fingerprint, threshold)
+            if expected != flagged:
+                changes.append((pk, expected))
+            if status in DUPLICATE_STATUSES:
+                index.add(None, customer, fingerprint)
+    return changes
+
+
+def backfill_keys(queryset, batch_size=2000):
+    """Fill in missing blocking keys, e.g. for rows written with ``bulk_create``."""
+    model = queryset.model
+    updated = 0
+    rows = queryset.filter(phone_key='', email_key='', name_key='').order_by().values_list(
+        'pk', 'customer_name', 'customer_email', 'customer_phone'
+    ).iterator(chunk_size=batch_size)
+    batch = []
+    for pk, name, email, phone in rows:
+        batch.append(model(pk=pk, **dict(zip(KEY_FIELDS, blocking_keys(name, email, phone)))))
+        if len(batch) >= batch_size:
+            model.objects.bulk_update(batch, KEY_FIELDS)
+            updated += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, KEY_FIELDS)
+        updated += len(batch)
+    return updated
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from bookings import search
+
+    alias = schema_editor.connection.alias
+    search.get_backend(alias).create_table(schema_editor)
+    search.rebuild(
+        using=alias,
+        booking_model=apps.get_model('bookings', 'Booking'),
+        payment_model=apps.get_model('payments', 'Payment'),
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    from bookings import search
+
+    search.get_backend(schema_editor.connection.alias).drop_table(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_booking_bookings_created_4f33ac_idx_and_more'),
+        ('payments', '0002_payment_payments_created_d7f01e_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:05
+
+import hashlib
+from django.db import migrations, models
+
+
+def populate_fingerprints(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    rows = Booking.objects.order_by().values_list(
+        'pk', 'customer_email', 'package_id', 'travel_date'
+    ).iterator(chunk_size=2000)
+    batch = []
+    for pk, email, package_id, travel_date in rows:
+        key = f'{(email or "").strip().lower()}|{package_id or ""}|{travel_date.isoformat()}'
+        batch.append(Booking(pk=pk, duplicate_fingerprint=hashlib.sha1(key.encode()).hexdigest()))
+        if len(batch) >= 2000:
+            Booking.objects.bulk_update(batch, ['duplicate_fingerprint'])
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, ['duplicate_fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='duplicate_fingerprint',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of normalized email, package and travel date', max_length=40),
+        ),
+        migrations.RunPython(populate_fingerprints, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['duplicate_fingerprint', 'status'], name='bookings_duplica_af6315_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:07
+
+from django.db import migrations, models
+from bookings.matching import KEY_FIELDS, blocking_keys
+
+
+def populate_blocking_keys(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    rows = Booking.objects.order_by().values_list(
+        'pk', 'customer_name', 'customer_email', 'customer_phone'
+    ).iterator(chunk_size=2000)
+    batch = []
+    for pk, name, email, phone in rows:
+        batch.append(Booking(pk=pk, **dict(zip(KEY_FIELDS, blocking_keys(name, email, phone)))))
+        if len(batch) >= 2000:
+            Booking.objects.bulk_update(batch, KEY_FIELDS)
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, KEY_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_duplicate_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='email_key',
+            field=models.CharField(blank=True, editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, max_length=4),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='near_duplicate_flag',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='phone_key',
+            field=models.CharField(blank=True, editable=False, max_length=10),
+        ),
+        migrations.RunPython(populate_blocking_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['phone_key', 'travel_date'], name='bookings_phone_k_ff5d8a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['email_key', 'travel_date'], name='bookings_email_k_ed94c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['name_key', 'travel_date'], name='bookings_name_ke_f82be8_idx'),
+        ),
+    ]
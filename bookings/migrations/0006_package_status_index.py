@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['package', 'status'], name='bookings_package_f39005_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:36
+
+from django.db import migrations, models
+from bookings import risk
+
+
+def populate_risk(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    risk.refresh(Booking.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_validation_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='risk_flags',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='risk_score',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', '-risk_score', 'created_at', 'id'], name='bookings_status_a86016_idx'),
+        ),
+        migrations.RunPython(populate_risk, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_audit_log_timestamp'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='auditlog',
+            name='audit_logs_model_n_656046_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='auditlog',
+            name='audit_logs_user_id_73c422_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='auditlog',
+            name='audit_logs_timesta_423be6_idx',
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_name', 'object_id', 'timestamp', 'id'], name='audit_logs_model_n_920a58_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_name', 'timestamp', 'id'], name='audit_logs_model_n_9e7917_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='audit_logs_user_id_2c47eb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='audit_logs_action_6db124_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['timestamp', 'id'], name='audit_logs_timesta_b1eb6c_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def rebuild_search_index(apps, schema_editor):
+    from bookings import search
+
+    # Documents now carry the booking number and transaction id suffixes
+    search.rebuild(
+        using=schema_editor.connection.alias,
+        booking_model=apps.get_model('bookings', 'Booking'),
+        payment_model=apps.get_model('payments', 'Payment'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_audit_trail_indexes'),
+        ('payments', '0002_payment_payments_created_d7f01e_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:17
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_search_booking_number_substrings'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='auditlog',
+            name='audit_logs_action_6db124_idx',
+        ),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from django.utils import timezone
+from . import risk
+from .duplicates import DUPLICATE_STATUSES, fingerprint
+from .matching import KEY_FIELDS, blocking_keys, find_near_duplicate
 
 
 class Booking(models.Model):
@@ -54,10 +57,36 @@ class Booking(models.Model):
     )
     validated_at = models.DateTimeField(null=True, blank=True)
     
+    # Validation queue lease (see bookings.queue)
+    claimed_by = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='claimed_bookings'
+    )
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
+    
     # Flags for suspicious activity
     price_mismatch_flag = models.BooleanField(default=False)
     excess_discount_flag = models.BooleanField(default=False)
     duplicate_booking_flag = models.BooleanField(default=False)
+    duplicate_fingerprint = models.CharField(
+        max_length=40,
+        blank=True,
+        editable=False,
+        help_text="Hash of normalized email, package and travel date"
+    )
+    near_duplicate_flag = models.BooleanField(default=False)
+    
+    # Bitmask and weighted score of the flags above (see bookings.risk)
+    risk_flags = models.PositiveSmallIntegerField(default=0, editable=False)
+    risk_score = models.PositiveSmallIntegerField(default=0, editable=False)
+    
+    # Blocking keys for near-duplicate matching
+    phone_key = models.CharField(max_length=10, blank=True, editable=False)
+    email_key = models.CharField(max_length=254, blank=True, editable=False)
+    name_key = models.CharField(max_length=4, blank=True, editable=False)
     
     # Metadata
     created_by = models.ForeignKey(
@@ -76,11 +105,46 @@ class Booking(models.Model):
             models.Index(fields=['booking_number']),
             models.Index(fields=['status']),
             models.Index(fields=['travel_date']),
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['duplicate_fingerprint', 'status']),
+            models.Index(fields=['phone_key', 'travel_date']),
+            models.Index(fields=['email_key', 'travel_date']),
+            models.Index(fields=['name_key', 'travel_date']),
+            models.Index(fields=['package', 'status']),
+            models.Index(fields=['claimed_by', 'status']),
+            models.Index(fields=['status', '-risk_score', 'created_at', 'id']),
         ]
     
     def __str__(self):
         return f"Booking #{self.booking_number} - {self.customer_name}"
     
+    # Columns derived from the customer fields and flags on every save
+    DERIVED_FIELDS = ('duplicate_fingerprint',) + KEY_FIELDS + ('risk_flags', 'risk_score')
+    
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.DERIVED_FIELDS)
+        super().save(*args, **kwargs)
+    
+    def set_derived_fields(self):
+        """Fill the fingerprint, blocking keys and risk; ``bulk_create`` callers must call this."""
+        self.duplicate_fingerprint = self.get_fingerprint()
+        self.phone_key, self.email_key, self.name_key = blocking_keys(
+            self.customer_name, self.customer_email, self.customer_phone
+        )
+        self.set_risk()
+    
+    def set_risk(self):
+        """Recompute the risk bitmask and score from the flags."""
+        self.risk_flags = risk.flags_of(self)
+        self.risk_score = risk.score_of(self.risk_flags)
+    
+    def get_fingerprint(self):
+        return fingerprint(self.customer_email, self.package_id, self.travel_date)
+    
     def calculate_totals(self):
         """Calculate all pricing totals."""
         # Calculate discount
@@ -131,23 +195,31 @@ class Booking(models.Model):
         else:
             self.excess_discount_flag = False
         
+        self.set_risk()
         return errors
     
     def check_duplicate(self):
-        """Check for duplicate bookings."""
+        """
+        Check for duplicate bookings.
+        
+        Only race-free inside ``duplicates.check_and_save``, which holds the
+        package lock until the booking is inserted.
+        """
+        self.duplicate_fingerprint = self.get_fingerprint()
         duplicates = Booking.objects.filter(
-            customer_email=self.customer_email,
-            package=self.package,
-            travel_date=self.travel_date,
-            status__in=['pending', 'approved']
+            duplicate_fingerprint=self.duplicate_fingerprint,
+            status__in=DUPLICATE_STATUSES
         ).exclude(pk=self.pk)
         
-        if duplicates.exists():
-            self.duplicate_booking_flag = True
-            return True
-        else:
-            self.duplicate_booking_flag = False
-            return False
+        self.duplicate_booking_flag = duplicates.exists()
+        self.set_risk()
+        return self.duplicate_booking_flag
+    
+    def check_near_duplicate(self):
+        """Check for bookings of the same trip by a customer that looks the same."""
+        self.near_duplicate_flag = find_near_duplicate(self) is not None
+        self.set_risk()
+        return self.near_duplicate_flag
     
     def approve(self, user, notes=''):
         """Approve the booking."""
@@ -185,16 +257,20 @@ class AuditLog(models.Model):
     user = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True)
     changes = models.JSONField(default=dict, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is logged, not when the buffered writer saves it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     notes = models.TextField(blank=True)
     
     class Meta:
         db_table = 'audit_logs'
         ordering = ['-timestamp']
+        # One per audit trail filter, each ending in the (timestamp, id)
+        # keyset the trail is paged and exported on
         indexes = [
-            models.Index(fields=['model_name', 'object_id']),
-            models.Index(fields=['user']),
-            models.Index(fields=['timestamp']),
+            models.Index(fields=['model_name', 'object_id', 'timestamp', 'id']),
+            models.Index(fields=['model_name', 'timestamp', 'id']),
+            models.Index(fields=['user', 'timestamp', 'id']),
+            models.Index(fields=['timestamp', 'id']),
         ]
     
     def __str__(self):
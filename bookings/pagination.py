@@ -0,0 +1,235 @@
+"""
+Keyset (cursor) pagination.
+
+``CursorPaginator`` pages through a queryset ordered on ``(created_at, id)``,
+or on any other unique ordering ending in ``id``, by remembering the last
+row seen instead of an offset, so every page costs the same index range
+scan no matter how deep it is. Cursors are opaque URL-safe tokens. Totals
+are estimated rather than counted exactly.
+"""
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+# Above this many rows the total is reported as "N+" instead of counted
+COUNT_LIMIT = 1000
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(values, direction)`` for a cursor token, or ``(None, 'n')`` if invalid."""
+    if not token:
+        return None, 'n'
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = payload['v']
+        direction = payload['d'] if payload['d'] in ('n', 'p') else 'n'
+    except (ValueError, TypeError, KeyError, IndexError):
+        return None, 'n'
+    if not isinstance(values, list):
+        return None, 'n'
+    return values, direction
+
+
+def _cursor_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def estimate_count(queryset, limit=COUNT_LIMIT):
+    """
+    Cheap row count for display.
+
+    On PostgreSQL the planner's row estimate is used. Elsewhere the count is
+    exact but stops at ``limit``. Returns ``(count, is_exact)``.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), False
+
+    count = queryset.order_by()[:limit + 1].count()
+    return min(count, limit), count <= limit
+
+
+class CursorPage:
+    """One page of results with opaque next/previous cursors."""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset on ``(created_at, id)`` in either direction.
+
+    ``descending=True`` shows the newest rows first. ``ordering`` replaces
+    the default with other field names, e.g. ``('-risk_score',
+    'created_at', 'id')``; it must end in a unique field and be backed by
+    an index in the same order.
+    """
+
+    def __init__(self, queryset, per_page, descending=True, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.descending = descending
+        if ordering is None:
+            ordering = ('-created_at', '-id') if descending else ('created_at', 'id')
+        self.ordering = tuple(ordering)
+        self._count = None
+
+    @property
+    def fields(self):
+        """``(name, descending)`` for each ordering field."""
+        return [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def _decode(self, values):
+        """Cursor values converted to field values, or None if they do not fit."""
+        if len(values) != len(self.ordering):
+            return None
+        model = self.queryset.model
+        try:
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (ValidationError, LookupError, TypeError, ValueError):
+            return None
+
+    def _after(self, values, forward):
+        """Rows strictly after the cursor in the walking direction."""
+        def lookup(name, descending, strict=True):
+            later = forward != descending
+            return f"{name}__{'gt' if later else 'lt'}{'' if strict else 'e'}"
+
+        fields = self.fields
+        after, ties = Q(), Q()
+        for (name, descending), value in zip(fields, values):
+            after |= ties & Q(**{lookup(name, descending): value})
+            ties &= Q(**{name: value})
+        # The leading non-strict bound lets the index serve the range; the
+        # OR only breaks ties within one value of the leading field.
+        name, descending = fields[0]
+        return Q(**{lookup(name, descending, strict=False): values[0]}) & after
+
+    def _cursor(self, row, direction):
+        return encode_cursor(
+            [_cursor_value(getattr(row, name)) for name, _ in self.fields], direction
+        )
+
+    def get_page(self, cursor):
+        values, direction = decode_cursor(cursor)
+        position = self._decode(values) if values is not None else None
+        forward = direction == 'n'
+
+        queryset = self.queryset
+        if position is not None:
+            queryset = queryset.filter(self._after(position, forward=forward))
+
+        if forward:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            queryset = queryset.order_by(*[
+                field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering
+            ])
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            first, last = rows[0], rows[-1]
+            if has_more or not forward:
+                next_cursor = self._cursor(last, 'n')
+            if position is not None and (forward or has_more):
+                previous_cursor = self._cursor(first, 'p')
+
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    def iterate(self, batch_size=None):
+        """
+        Yield every row in order, fetching ``batch_size`` rows (default
+        ``per_page``) per keyset query, for exports of any size.
+        """
+        batch_size = batch_size or self.per_page
+        queryset = self.queryset.order_by(*self.ordering)
+        position = None
+        while True:
+            batch = queryset
+            if position is not None:
+                batch = batch.filter(self._after(position, forward=True))
+            rows = list(batch[:batch_size])
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            position = [getattr(rows[-1], name) for name, _ in self.fields]
+
+    def _estimate(self):
+        if self._count is None:
+            self._count = estimate_count(self.queryset)
+        return self._count
+
+    @property
+    def count(self):
+        """Estimated number of rows (see ``estimate_count``)."""
+        return self._estimate()[0]
+
+    @property
+    def count_is_exact(self):
+        return self._estimate()[1]
+
+    @property
+    def count_label(self):
+        """Human readable total: exact, capped ("1000+") or estimated ("~12000")."""
+        count, exact = self._estimate()
+        if exact:
+            return str(count)
+        if connections[self.queryset.db].vendor == 'postgresql':
+            return f'~{count}'
+        return f'{count}+'
+
+
+def paginate(request, queryset, per_page, descending=True, ordering=None):
+    """
+    Return the cursor page requested by ``?cursor=`` and the current query
+    string without the cursor, for building next/previous links.
+    """
+    paginator = CursorPaginator(queryset, per_page, descending=descending, ordering=ordering)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    return page_obj, params.urlencode()
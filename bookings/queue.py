@@ -0,0 +1,130 @@
+"""
+Lease-based validation queue.
+
+Managers claim pending bookings before validating them, so two managers
+never work on the same booking. A claim is a lease: ``claimed_by`` plus
+``claim_expires_at``. Nobody else can claim or validate the booking until
+the lease expires, after which it is free again without any clean-up job.
+
+``claim_next`` takes the riskiest unclaimed bookings, oldest first among
+equal risk. Where the database supports it, candidates are locked with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so concurrent managers are handed
+disjoint bookings without waiting on each other. Elsewhere (SQLite) writes are serialized by the
+database anyway; the claim is a guarded ``UPDATE`` that only takes rows
+that are still free, read back by the lease stamp, and bookings a
+concurrent manager got first are simply replaced by the next ones.
+"""
+from datetime import timedelta
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Booking
+
+
+# Order in which pending bookings are worked, served by the
+# (status, -risk_score, created_at, id) index
+ORDERING = ('-risk_score', 'created_at', 'id')
+
+# How long a claim lasts without being renewed
+LEASE_DURATION = timedelta(minutes=15)
+
+# Bookings claimed per request by default, and at most
+CLAIM_SIZE = 10
+MAX_CLAIM_SIZE = 100
+
+# Guarded UPDATE rounds on backends without SKIP LOCKED
+MAX_CLAIM_ATTEMPTS = 3
+
+
+def free(user, now=None):
+    """Q for bookings ``user`` may claim or validate: unclaimed, expired or their own."""
+    now = now or timezone.now()
+    return (
+        Q(claimed_by__isnull=True) |
+        Q(claim_expires_at__lte=now) |
+        Q(claimed_by=user)
+    )
+
+
+def _unclaimed(now):
+    return Q(claimed_by__isnull=True) | Q(claim_expires_at__lte=now)
+
+
+def claim_next(user, count=CLAIM_SIZE):
+    """
+    Claim up to ``count`` of the riskiest unclaimed pending bookings for
+    ``user`` and renew the user's existing claims. Returns the ids newly
+    claimed.
+    """
+    now = timezone.now()
+    expires_at = now + LEASE_DURATION
+    using = router.db_for_write(Booking)
+    available = Booking.objects.using(using).filter(_unclaimed(now), status='pending').order_by(
+        *ORDERING
+    )
+
+    with transaction.atomic(using=using):
+        renew(user, expires_at)
+        if connections[using].features.has_select_for_update_skip_locked:
+            ids = list(available.select_for_update(skip_locked=True, of=('self',)).values_list(
+                'pk', flat=True
+            )[:count])
+            Booking.objects.using(using).filter(pk__in=ids).update(
+                claimed_by=user, claim_expires_at=expires_at
+            )
+            return ids
+
+        claimed = []
+        for _ in range(MAX_CLAIM_ATTEMPTS):
+            ids = list(available.exclude(pk__in=claimed).values_list('pk', flat=True)[:count - len(claimed)])
+            if not ids:
+                break
+            Booking.objects.using(using).filter(_unclaimed(now), pk__in=ids, status='pending').update(
+                claimed_by=user, claim_expires_at=expires_at
+            )
+            claimed += Booking.objects.using(using).filter(
+                pk__in=ids, claimed_by=user, claim_expires_at=expires_at
+            ).values_list('pk', flat=True)
+            if len(claimed) >= count:
+                break
+        return claimed
+
+
+def claim(booking, user):
+    """
+    Claim one booking, e.g. when a manager opens it directly. Returns False
+    when it is no longer pending or another manager holds a live claim.
+    """
+    now = timezone.now()
+    claimed = Booking.objects.filter(free(user, now), pk=booking.pk, status='pending').update(
+        claimed_by=user, claim_expires_at=now + LEASE_DURATION
+    )
+    return bool(claimed)
+
+
+def renew(user, expires_at=None):
+    """Extend all of ``user``'s live claims. Returns the number renewed."""
+    now = timezone.now()
+    return my_claims(user, now).update(claim_expires_at=expires_at or now + LEASE_DURATION)
+
+
+def release(user, ids=None):
+    """Give up ``user``'s claims (on ``ids`` only, if given). Returns the number released."""
+    claims = Booking.objects.filter(claimed_by=user)
+    if ids is not None:
+        claims = claims.filter(pk__in=ids)
+    return claims.update(claimed_by=None, claim_expires_at=None)
+
+
+def my_claims(user, now=None):
+    """Pending bookings ``user`` holds a live claim on."""
+    return Booking.objects.filter(
+        claimed_by=user, status='pending', claim_expires_at__gt=now or timezone.now()
+    )
+
+
+def holder(booking, now=None):
+    """The user holding a live claim on ``booking``, or None."""
+    if booking.claimed_by_id and booking.claim_expires_at and booking.claim_expires_at > (now or timezone.now()):
+        return booking.claimed_by
+    return None
@@ -0,0 +1,139 @@
+"""
+Re-validation of pending bookings after a package's pricing changes.
+
+``validate_pricing`` only runs when a booking is saved, so changing a
+package's base or seasonal price or its discount limit leaves the price
+mismatch and excess discount flags of its pending bookings stale until
+someone opens them. ``revalidate_package`` recomputes those flags for every
+pending booking of the package from one indexed query, writes the ones that
+changed with one ``UPDATE`` per outcome and records a single audit entry for
+the whole run. A tax or commission change reprices the bookings instead.
+
+``schedule`` runs it in a background thread once the package change has
+committed, so saving the package stays fast.
+"""
+import logging
+import threading
+from decimal import Decimal
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from . import audit, pricing, risk
+from .models import Booking
+
+
+logger = logging.getLogger(__name__)
+
+# Package fields that feed validate_pricing
+FLAG_FIELDS = ('base_price', 'seasonal_price', 'max_discount_percentage')
+
+# Package fields that feed the booking totals
+RATE_FIELDS = ('tax_percentage', 'commission_percentage')
+
+# Bookings per UPDATE
+BATCH_SIZE = 1000
+
+
+def expected_flags(package, package_price, number_of_travelers, discount_percentage):
+    """``(price_mismatch_flag, excess_discount_flag)`` as set by ``validate_pricing``."""
+    expected_price = package.get_current_price() * number_of_travelers
+    return (
+        abs(package_price - expected_price) > Decimal('0.01'),
+        discount_percentage > package.max_discount_percentage,
+    )
+
+
+def reflag(package):
+    """
+    Correct the pricing flags of the package's pending bookings. Returns
+    ``{(price_mismatch_flag, excess_discount_flag): [pk, ...]}`` for the
+    bookings that changed.
+    """
+    changes = {}
+    with transaction.atomic():
+        # Lock the rows so a booking edited meanwhile cannot get flags
+        # computed from its old price
+        rows = Booking.objects.select_for_update().filter(
+            package=package, status='pending'
+        ).order_by().values_list(
+            'pk', 'package_price', 'number_of_travelers', 'discount_percentage',
+            'price_mismatch_flag', 'excess_discount_flag',
+        )
+        for pk, price, travelers, discount, *current in rows:
+            flags = expected_flags(package, price, travelers, discount)
+            if flags != tuple(current):
+                changes.setdefault(flags, []).append(pk)
+
+        for (price_flag, discount_flag), ids in changes.items():
+            for start in range(0, len(ids), BATCH_SIZE):
+                changed = Booking.objects.filter(pk__in=ids[start:start + BATCH_SIZE])
+                changed.update(
+                    price_mismatch_flag=price_flag, excess_discount_flag=discount_flag, updated_at=timezone.now()
+                )
+                risk.refresh(changed)
+    return changes
+
+
+def revalidate_package(package, fields, user=None):
+    """
+    Bring the package's pending bookings up to date after ``fields`` of it
+    changed. Returns the number of bookings re-flagged.
+    """
+    changes = {}
+    if set(fields) & set(FLAG_FIELDS):
+        changes = reflag(package)
+
+    repriced = 0
+    if set(fields) & set(RATE_FIELDS):
+        repriced = pricing.reprice(Booking.objects.filter(package=package, status='pending'))
+
+    reflagged = sum(len(ids) for ids in changes.values())
+    if reflagged or repriced:
+        audit.log(
+            'Package',
+            package.pk,
+            'update',
+            user,
+            {
+                'fields': sorted(fields),
+                'price_mismatch': sorted(pk for (flag, _), ids in changes.items() if flag for pk in ids),
+                'excess_discount': sorted(pk for (_, flag), ids in changes.items() if flag for pk in ids),
+                'cleared': sorted(changes.get((False, False), [])),
+                'repriced': repriced,
+            },
+            notes=f'Pending bookings re-validated after a package change ({reflagged} re-flagged)',
+        )
+    return reflagged
+
+
+def _run(package_id, fields, user_id):
+    from accounts.models import User
+    from packages.models import Package
+
+    try:
+        package = Package.objects.filter(pk=package_id).first()
+        if package is not None:
+            user = User.objects.filter(pk=user_id).first() if user_id else None
+            revalidate_package(package, fields, user)
+    except Exception:
+        logger.exception('Re-validating bookings of package %s failed', package_id)
+    finally:
+        connections.close_all()
+
+
+def schedule(package, fields, user=None):
+    """
+    Re-validate the package's pending bookings after the current transaction
+    commits, in a background thread unless
+    ``settings.PACKAGE_REVALIDATION_BACKGROUND`` is False.
+    """
+    args = (package.pk, tuple(fields), user.pk if user else None)
+
+    def start():
+        if getattr(settings, 'PACKAGE_REVALIDATION_BACKGROUND', True):
+            threading.Thread(target=_run, args=args, daemon=True,
+                             name=f'revalidate-package-{package.pk}').start()
+        else:
+            revalidate_package(package, fields, user)
+
+    transaction.on_commit(start)
@@ -0,0 +1,425 @@
+"""
+Full-text search index for bookings and payments.
+
+Documents are kept in a ``search_index`` table next to the data: an FTS5
+virtual table on SQLite, a table with a ``tsvector`` column and GIN indexes
+on PostgreSQL. Both backends expose the same interface, prefix-match the
+last query word and return ids ranked best match first. Other databases
+fall back to the old ``icontains`` scan. Documents also hold every suffix
+of the booking number (and of a payment's transaction id), so a prefix
+match on them finds any part of the number, as ``icontains`` did.
+
+Matches are ranked only among the rows of the caller's filtered queryset
+(a sales agent's own bookings, one status, ...) and paged with a keyset on
+``(score, object_id)``, so filters never hide matches behind a result limit
+and every page of a query costs the same.
+
+The index is updated from ``post_save``/``post_delete`` signals and can be
+rebuilt with ``manage.py rebuild_search_index``.
+"""
+import re
+from numbers import Real
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from .pagination import COUNT_LIMIT, CursorPage, decode_cursor, encode_cursor
+
+
+TABLE = 'search_index'
+
+# Shortest reference number suffix indexed for substring matches
+MIN_SUFFIX = 2
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def query_tokens(text):
+    return _TOKEN.findall((text or '').lower())
+
+
+def number_suffixes(number):
+    """Proper suffixes of each word of a reference number ("bk0042" -> "k0042", "0042", ...)."""
+    return [
+        token[start:]
+        for token in query_tokens(number)
+        for start in range(1, len(token) - MIN_SUFFIX + 1)
+    ]
+
+
+def booking_document(booking_number, customer_name, customer_email):
+    return ' '.join([booking_number, customer_name, customer_email, *number_suffixes(booking_number)])
+
+
+def payment_document(booking_number, transaction_id, customer_name):
+    return ' '.join([
+        booking_number, transaction_id, customer_name,
+        *number_suffixes(booking_number), *number_suffixes(transaction_id),
+    ])
+
+
+class BaseSearchBackend:
+    """Interface shared by the search backends."""
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def create_table(self, schema_editor):
+        raise NotImplementedError
+
+    def drop_table(self, schema_editor):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+    def _delete_sql(self):
+        return f'DELETE FROM {TABLE} WHERE kind = %s AND object_id = %s'
+
+    def _insert_sql(self):
+        return f'INSERT INTO {TABLE} (kind, object_id, body) VALUES (%s, %s, %s)'
+
+    def index(self, kind, object_id, body):
+        with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+            cursor.execute(self._delete_sql(), [kind, object_id])
+            cursor.execute(self._insert_sql(), [kind, object_id, body])
+
+    def remove(self, kind, object_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(self._delete_sql(), [kind, object_id])
+
+    def index_many(self, kind, rows):
+        """Add or replace ``(object_id, body)`` documents in batches."""
+        with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= 1000:
+                    self._write_batch(cursor, kind, batch)
+                    batch = []
+            if batch:
+                self._write_batch(cursor, kind, batch)
+
+    def _write_batch(self, cursor, kind, batch):
+        ids = [object_id for object_id, _ in batch]
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE kind = %s AND object_id IN ({placeholders})', [kind, *ids]
+        )
+        cursor.executemany(self._insert_sql(), [[kind, object_id, body] for object_id, body in batch])
+
+    def bulk_index(self, kind, rows):
+        """Replace every document of ``kind`` with ``(object_id, body)`` rows."""
+        with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE kind = %s', [kind])
+            batch = []
+            for object_id, body in rows:
+                batch.append([kind, object_id, body])
+                if len(batch) >= 1000:
+                    cursor.executemany(self._insert_sql(), batch)
+                    batch = []
+            if batch:
+                cursor.executemany(self._insert_sql(), batch)
+
+    # Number of score columns ranked ascending before object_id
+    score_columns = 1
+
+    def _ranked_sql(self, kind, tokens):
+        """
+        SQL and params selecting ``object_id, s0[, s1...]`` of the ``kind``
+        documents matching every token; it must end in its WHERE clause.
+        """
+        raise NotImplementedError
+
+    def _matches(self, kind, text, within):
+        tokens = query_tokens(text)
+        if not tokens:
+            return None
+        sql, params = self._ranked_sql(kind, tokens)
+        if within is not None:
+            within_sql, within_params = within.order_by().values('pk').query.sql_with_params()
+            sql = f'{sql} AND object_id IN ({within_sql})'
+            params = [*params, *within_params]
+        return sql, params
+
+    def ranked(self, kind, text, within=None, after=None, limit=20, backwards=False):
+        """
+        ``(object_id, key)`` of ``kind`` documents matching every token of
+        ``text``, best first, where ``key`` is the row's keyset position.
+
+        The last token is matched as a prefix (search-as-you-type); earlier
+        tokens must match whole words, which keeps common words from
+        expanding into huge prefix scans. ``within`` is a queryset of the
+        same kind the matches are restricted to before ranking; ``after`` a
+        key the rows must follow (precede, with ``backwards``).
+        """
+        matches = self._matches(kind, text, within)
+        if matches is None:
+            return []
+        sql, params = matches
+        columns = [f's{column}' for column in range(self.score_columns)] + ['object_id']
+        query = f'SELECT {", ".join(columns)} FROM ({sql}) ranked'
+        if after is not None:
+            query += (
+                f' WHERE ({", ".join(columns)}) {"<" if backwards else ">"} '
+                f'({", ".join(["%s"] * len(columns))})'
+            )
+            params = [*params, *after]
+        order = 'DESC' if backwards else 'ASC'
+        query += f' ORDER BY {", ".join(f"{column} {order}" for column in columns)} LIMIT %s'
+        with self.connection.cursor() as cursor:
+            cursor.execute(query, [*params, limit])
+            return [(int(row[-1]), list(row)) for row in cursor.fetchall()]
+
+    def count(self, kind, text, within=None, limit=COUNT_LIMIT):
+        """Number of matches, counted up to ``limit + 1``."""
+        matches = self._matches(kind, text, within)
+        if matches is None:
+            return 0
+        sql, params = matches
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM ({sql} LIMIT %s) matches', [*params, limit + 1])
+            return cursor.fetchone()[0]
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """FTS5 virtual table ranked by bm25."""
+
+    def create_table(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            f"kind UNINDEXED, object_id UNINDEXED, body, "
+            f"tokenize = 'unicode61', prefix = '2 3', detail = column)"
+        )
+
+    def _ranked_sql(self, kind, tokens):
+        # bm25() is lower for better matches
+        match = ' '.join(f'"{token}"' for token in tokens) + '*'
+        return (
+            f'SELECT bm25({TABLE}) AS s0, object_id FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s AND kind = %s',
+            [match, kind]
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector prefix queries ranked by ts_rank, ties broken by trigram similarity."""
+
+    def create_table(self, schema_editor):
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            f"kind varchar(20) NOT NULL, "
+            f"object_id bigint NOT NULL, "
+            f"body text NOT NULL, "
+            f"document tsvector GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED, "
+            f"PRIMARY KEY (kind, object_id))"
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING GIN (document)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {TABLE}_body_trgm_idx ON {TABLE} USING GIN (body gin_trgm_ops)'
+        )
+
+    score_columns = 2
+
+    def _ranked_sql(self, kind, tokens):
+        # Negated so that the best match sorts first in ascending order
+        return (
+            f"SELECT -ts_rank(document, query) AS s0, -similarity(body, %s) AS s1, object_id "
+            f"FROM {TABLE}, to_tsquery('simple', %s) AS query "
+            f"WHERE kind = %s AND document @@ query",
+            [' '.join(tokens), ' & '.join(tokens) + ':*', kind]
+        )
+
+
+class ScanSearchBackend(BaseSearchBackend):
+    """No index: the original ``icontains`` filters, for other databases."""
+
+    def create_table(self, schema_editor):
+        pass
+
+    def drop_table(self, schema_editor):
+        pass
+
+    def index(self, kind, object_id, body):
+        pass
+
+    def remove(self, kind, object_id):
+        pass
+
+    def index_many(self, kind, rows):
+        pass
+
+    def bulk_index(self, kind, rows):
+        pass
+
+    score_columns = 0
+
+    def _matches(self, kind, text, within):
+        from payments.models import Payment
+        from .models import Booking
+
+        if kind == 'booking':
+            queryset = Booking.objects.all() if within is None else within
+            return queryset.filter(
+                Q(booking_number__icontains=text) |
+                Q(customer_name__icontains=text) |
+                Q(customer_email__icontains=text)
+            )
+        queryset = Payment.objects.all() if within is None else within
+        return queryset.filter(
+            Q(booking__booking_number__icontains=text) |
+            Q(transaction_id__icontains=text) |
+            Q(booking__customer_name__icontains=text)
+        )
+
+    def ranked(self, kind, text, within=None, after=None, limit=20, backwards=False):
+        matches = self._matches(kind, text, within)
+        if after is not None:
+            matches = matches.filter(pk__lt=after[-1]) if backwards else matches.filter(pk__gt=after[-1])
+        ids = matches.order_by('-pk' if backwards else 'pk').values_list('pk', flat=True)[:limit]
+        return [(pk, [pk]) for pk in ids]
+
+    def count(self, kind, text, within=None, limit=COUNT_LIMIT):
+        return self._matches(kind, text, within).order_by()[:limit + 1].count()
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using='default'):
+    """Search backend from ``settings.SEARCH_BACKEND`` or the database vendor."""
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)(using)
+    backend_class = BACKENDS.get(connections[using].vendor, ScanSearchBackend)
+    return backend_class(using)
+
+
+def index_booking(booking):
+    get_backend().index('booking', booking.pk, booking_document(
+        booking.booking_number, booking.customer_name, booking.customer_email
+    ))
+
+
+def index_bookings(bookings):
+    get_backend().index_many('booking', (
+        (booking.pk, booking_document(booking.booking_number, booking.customer_name, booking.customer_email))
+        for booking in bookings
+    ))
+
+
+def index_payment(payment):
+    booking = payment.booking
+    get_backend().index('payment', payment.pk, payment_document(
+        booking.booking_number, payment.transaction_id, booking.customer_name
+    ))
+
+
+def order_by_rank(queryset, ranked_ids):
+    """Evaluate ``queryset`` restricted to ``ranked_ids`` and keep their order."""
+    position = {pk: i for i, pk in enumerate(ranked_ids)}
+    rows = list(queryset.filter(pk__in=ranked_ids))
+    rows.sort(key=lambda row: position[row.pk])
+    return rows
+
+
+class SearchPaginator:
+    """
+    Keyset pages of the rows of ``queryset`` whose ``kind`` document
+    matches ``text``, best match first; the interface of
+    ``CursorPaginator`` for the list templates.
+    """
+
+    def __init__(self, kind, text, queryset, per_page, using='default'):
+        self.kind = kind
+        self.text = text
+        self.queryset = queryset
+        self.per_page = per_page
+        self.backend = get_backend(using)
+        self._count = None
+
+    def _decode(self, values):
+        """A cursor key of the backend's shape, or None."""
+        if len(values) != self.backend.score_columns + 1:
+            return None
+        if not all(isinstance(value, Real) and not isinstance(value, bool) for value in values):
+            return None
+        return values
+
+    def get_page(self, cursor):
+        values, direction = decode_cursor(cursor)
+        position = self._decode(values) if values is not None else None
+        forward = direction == 'n'
+
+        hits = self.backend.ranked(
+            self.kind, self.text, within=self.queryset, after=position,
+            limit=self.per_page + 1, backwards=not forward
+        )
+        has_more = len(hits) > self.per_page
+        hits = hits[:self.per_page]
+        if not forward:
+            hits.reverse()
+        rows = order_by_rank(self.queryset, [pk for pk, _ in hits])
+
+        next_cursor = previous_cursor = None
+        if hits:
+            if has_more or not forward:
+                next_cursor = encode_cursor(hits[-1][1], 'n')
+            if position is not None and (forward or has_more):
+                previous_cursor = encode_cursor(hits[0][1], 'p')
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.kind, self.text, within=self.queryset)
+        return min(self._count, COUNT_LIMIT)
+
+    @property
+    def count_label(self):
+        """Exact number of matches, or "1000+" above ``COUNT_LIMIT``."""
+        count = self.count
+        return f'{count}+' if self._count > COUNT_LIMIT else str(count)
+
+
+def paginate(request, kind, text, queryset, per_page):
+    """The requested page of search results and the query string without the cursor."""
+    paginator = SearchPaginator(kind, text, queryset, per_page, using=queryset.db)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return page_obj, params.urlencode()
+
+
+def rebuild(using='default', booking_model=None, payment_model=None):
+    """Reindex every booking and payment. Returns ``(bookings, payments)`` counts."""
+    if booking_model is None:
+        from .models import Booking as booking_model
+    if payment_model is None:
+        from payments.models import Payment as payment_model
+
+    backend = get_backend(using)
+    counts = {'booking': 0, 'payment': 0}
+
+    def documents(kind, make_document, rows):
+        for pk, *parts in rows:
+            counts[kind] += 1
+            yield pk, make_document(*parts)
+
+    bookings = booking_model.objects.using(using).order_by().values_list(
+        'pk', 'booking_number', 'customer_name', 'customer_email'
+    ).iterator(chunk_size=2000)
+    payments = payment_model.objects.using(using).order_by().values_list(
+        'pk', 'booking__booking_number', 'transaction_id', 'booking__customer_name'
+    ).iterator(chunk_size=2000)
+
+    backend.bulk_index('booking', documents('booking', booking_document, bookings))
+    backend.bulk_index('payment', documents('payment', payment_document, payments))
+    return counts['booking'], counts['payment']
@@ -0,0 +1,68 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import Signal, receiver
+from packages.models import Package
+from payments.models import Payment
+from . import revalidation, search
+from .models import Booking
+
+
+# Sent with ``bookings=[...]`` after bookings are written with bulk_create,
+# which skips post_save
+bookings_created = Signal()
+
+# Sent with ``bookings=[...]`` and ``previous={pk: {field: old value}}`` after
+# bookings are changed with bulk_update or queryset.update(), which skip
+# post_save
+bookings_updated = Signal()
+
+
+@receiver(post_save, sender=Booking)
+def index_booking(sender, instance, raw=False, **kwargs):
+    """Keep the booking's search document current."""
+    if not raw:
+        search.index_booking(instance)
+
+
+@receiver(bookings_created, sender=Booking)
+def index_bulk_bookings(sender, bookings, **kwargs):
+    search.index_bookings(bookings)
+
+
+@receiver(post_save, sender=Payment)
+def index_payment(sender, instance, raw=False, **kwargs):
+    """Keep the payment's search document current."""
+    if not raw:
+        search.index_payment(instance)
+
+
+@receiver(post_delete, sender=Booking)
+def unindex_booking(sender, instance, **kwargs):
+    search.get_backend().remove('booking', instance.pk)
+
+
+@receiver(post_delete, sender=Payment)
+def unindex_payment(sender, instance, **kwargs):
+    search.get_backend().remove('payment', instance.pk)
+
+
+@receiver(pre_save, sender=Package)
+def remember_package_pricing(sender, instance, raw=False, **kwargs):
+    """Capture the pricing of a package before it changes."""
+    instance._previous_pricing = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_pricing = Package.objects.filter(pk=instance.pk).values(
+        *revalidation.FLAG_FIELDS, *revalidation.RATE_FIELDS
+    ).first()
+
+
+@receiver(post_save, sender=Package)
+def revalidate_pending_bookings(sender, instance, created=False, raw=False, **kwargs):
+    """Re-validate pending bookings in the background when the pricing changed."""
+    previous = getattr(instance, '_previous_pricing', None)
+    if raw or created or not previous:
+        return
+    changed = [field for field, value in previous.items() if getattr(instance, field) != value]
+    if changed:
+        # Set by package_edit and the admin to the user making the change
+        revalidation.schedule(instance, changed, getattr(instance, '_changed_by', None))
@@ -0,0 +1,597 @@
+import random
+import shutil
+import tempfile
+import threading
+from decimal import Decimal
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from packages.models import Package
+from . import archive, audit, duplicates, matching, pricing, queue, revalidation, risk, trail
+from .importer import import_bookings
+from .models import AuditLog, Booking
+from .validation import bulk_validate
+
+
+class BookingTestCase(TestCase):
+    """Users, a package and a helper to create priced bookings."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', role='admin')
+        cls.agent = User.objects.create_user('agent', password='x', role='sales_agent')
+        cls.other_agent = User.objects.create_user('other', password='x', role='sales_agent')
+        cls.manager = User.objects.create_user('manager', password='x', role='manager')
+        cls.package = Package.objects.create(
+            name='Goa Trip', destination='Goa', base_price=Decimal('10000'), created_by=cls.admin
+        )
+
+    def make_booking(self, number, name, created_by=None, status='pending'):
+        booking = Booking(
+            package=self.package,
+            customer_name=name,
+            customer_email=f'{number.lower()}@example.com',
+            customer_phone='9999999999',
+            travel_date=timezone.localdate(),
+            number_of_travelers=2,
+            package_price=self.package.get_current_price() * 2,
+            discount_percentage=Decimal('5'),
+            booking_number=number,
+            created_by=created_by or self.agent,
+            status=status,
+        )
+        booking.calculate_totals()
+        booking.save()
+        return booking
+
+
+class BookingSearchTests(BookingTestCase):
+
+    def setUp(self):
+        self.client.force_login(self.agent)
+
+    def search(self, text, **params):
+        response = self.client.get(reverse('bookings:list'), {'search': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_own_booking_found_among_many_other_agents_matches(self):
+        for i in range(150):
+            self.make_booking(f'BKO{i:05d}', f'Customer Other {i}', created_by=self.other_agent)
+        mine = self.make_booking('BK900001', 'Customer Gamma')
+
+        response = self.search('customer')
+        self.assertEqual([booking.pk for booking in response.context['page_obj']], [mine.pk])
+
+    def test_status_filter_applies_before_ranking(self):
+        for i in range(150):
+            self.make_booking(f'BKP{i:05d}', f'Customer Pending {i}')
+        approved = self.make_booking('BK900002', 'Customer Approved', status='approved')
+
+        response = self.search('customer', status='approved')
+        self.assertEqual([booking.pk for booking in response.context['page_obj']], [approved.pk])
+
+    def test_pages_cover_every_match_once(self):
+        bookings = {self.make_booking(f'BKQ{i:05d}', f'Customer {i}').pk for i in range(45)}
+
+        seen, cursor = [], None
+        while True:
+            response = self.search('customer', **({'cursor': cursor} if cursor else {}))
+            page_obj = response.context['page_obj']
+            seen += [booking.pk for booking in page_obj]
+            if not page_obj.has_next():
+                break
+            cursor = page_obj.next_cursor
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(set(seen), bookings)
+        self.assertEqual(response.context['page_obj'].paginator.count_label, '45')
+
+        # And back again from the last page
+        previous = self.search('customer', cursor=page_obj.previous_cursor).context['page_obj']
+        self.assertEqual([booking.pk for booking in previous], seen[20:40])
+
+    def test_part_of_booking_number_matches(self):
+        booking = self.make_booking('BK20240917', 'Customer Delta')
+        self.make_booking('BK20250101', 'Customer Echo')
+
+        response = self.search('0917')
+        self.assertEqual([row.pk for row in response.context['page_obj']], [booking.pk])
+
+
+class PricingEngineTests(SimpleTestCase):
+    """The integer-paise engine prices exactly like ``Booking.calculate_totals``."""
+
+    def assert_same_prices(self, cases):
+        packages, bookings = [], []
+        for price, travelers, discount, tax, commission in cases:
+            package = Package(pk=len(packages) + 1, tax_percentage=tax, commission_percentage=commission)
+            packages.append(package)
+            bookings.append(Booking(
+                package=package, package_price=price * travelers,
+                number_of_travelers=travelers, discount_percentage=discount,
+            ))
+
+        pricing.price_bookings(bookings)
+        for booking in bookings:
+            expected = Booking(
+                package=booking.package, package_price=booking.package_price,
+                discount_percentage=booking.discount_percentage,
+            )
+            expected.calculate_totals()
+            for field in pricing.PRICE_FIELDS:
+                with self.subTest(price=booking.package_price, discount=booking.discount_percentage,
+                                  tax=booking.package.tax_percentage,
+                                  commission=booking.package.commission_percentage, field=field):
+                    self.assertEqual(getattr(booking, field), getattr(expected, field))
+
+    def test_random_bookings(self):
+        rng = random.Random(20241017)
+
+        def amount(high):
+            return Decimal(rng.randint(0, high * 100)).scaleb(-2)
+
+        self.assert_same_prices([
+            (amount(500000), rng.randint(1, 50), amount(100), amount(30), amount(25))
+            for _ in range(3000)
+        ])
+
+    def test_rounding_edge_cases(self):
+        self.assert_same_prices([
+            # Half a paisa rounds to even, both ways
+            (Decimal('0.50'), 1, Decimal('1.00'), Decimal('0'), Decimal('0')),
+            (Decimal('1.50'), 1, Decimal('1.00'), Decimal('0'), Decimal('0')),
+            (Decimal('2.50'), 1, Decimal('0'), Decimal('1.00'), Decimal('1.00')),
+            (Decimal('3.50'), 1, Decimal('0'), Decimal('1.00'), Decimal('1.00')),
+            # Just either side of half a paisa
+            (Decimal('0.49'), 1, Decimal('1.01'), Decimal('1.01'), Decimal('1.01')),
+            (Decimal('0.51'), 1, Decimal('0.99'), Decimal('0.99'), Decimal('0.99')),
+            # No discount, full discount, zero price, large amounts
+            (Decimal('9999.99'), 3, Decimal('0'), Decimal('18.00'), Decimal('10.00')),
+            (Decimal('12345.67'), 2, Decimal('100.00'), Decimal('5.00'), Decimal('10.00')),
+            (Decimal('0'), 4, Decimal('15.00'), Decimal('5.00'), Decimal('10.00')),
+            (Decimal('99999999.99'), 99, Decimal('33.33'), Decimal('28.00'), Decimal('12.50')),
+        ])
+
+
+@override_settings(AUDIT_LOG={'BACKGROUND': False})
+class BulkAuditTests(BookingTestCase):
+
+    def test_bulk_validate_records_through_audit_writer(self):
+        bookings = [self.make_booking(f'BK80000{i}', f'Customer {i}') for i in range(3)]
+        written = audit.writer.written
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            changed = bulk_validate([booking.pk for booking in bookings], 'approve', self.manager, 'ok')
+            self.assertFalse(AuditLog.objects.filter(action='approve').exists())
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(audit.writer.written - written, 3)
+        entries = AuditLog.objects.filter(action='approve').order_by('object_id')
+        self.assertEqual([entry.object_id for entry in entries], [booking.pk for booking in changed])
+        self.assertTrue(all(entry.changes == {'status': 'approved'} and entry.notes == 'ok' for entry in entries))
+
+    def test_bulk_validate_stamps_updated_at(self):
+        booking = self.make_booking('BK800010', 'Customer Stamp')
+        Booking.objects.filter(pk=booking.pk).update(updated_at=timezone.now() - timedelta(days=1))
+
+        changed = bulk_validate([booking.pk], 'reject', self.manager, 'Wrong dates')
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.updated_at, changed[0].validated_at)
+
+    def test_import_validates_each_row_on_its_own(self):
+        travel_date = (timezone.localdate() + timedelta(days=30)).isoformat()
+        valid = {
+            'package': self.package.pk,
+            'customer_name': 'Asha',
+            'customer_email': 'asha@example.com',
+            'customer_phone': '9876543210',
+            'travel_date': travel_date,
+            'number_of_travelers': 2,
+            'package_price': '20000',
+            'discount_percentage': '0',
+        }
+        rows = [
+            (2, valid),
+            (3, {**valid, 'customer_name': 'Bina 2', 'package': 999}),
+            (4, {**valid, 'customer_name': 'Chitra', 'customer_email': 'chitra@example.com'}),
+        ]
+
+        result = import_bookings(rows, self.agent)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(sorted((number, field) for number, field, _ in result.errors), [
+            (3, 'customer_name'), (3, 'package'),
+        ])
+        self.assertEqual(
+            sorted(Booking.objects.filter(created_by=self.agent).values_list('customer_name', flat=True)),
+            ['Asha', 'Chitra'],
+        )
+
+    def test_import_records_one_entry_per_booking(self):
+        rows = [
+            (number, {
+                'package': self.package.pk,
+                'customer_name': f'Imported {name}',
+                'customer_email': f'imported{number}@example.com',
+                'customer_phone': f'98765432{number:02d}',
+                'travel_date': (timezone.localdate() + timedelta(days=30)).isoformat(),
+                'number_of_travelers': 2,
+                'package_price': '20000',
+                'discount_percentage': '0',
+            })
+            for number, name in enumerate(['Asha', 'Bina', 'Chitra', 'Devi'], start=2)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_bookings(rows, self.agent, chunk_size=2)
+
+        self.assertEqual((result.created, result.errors), (4, []))
+        entries = AuditLog.objects.filter(action='create', notes='Bulk import')
+        self.assertEqual(
+            sorted(entry.changes['booking_number'] for entry in entries),
+            sorted(Booking.objects.filter(created_by=self.agent).values_list('booking_number', flat=True)),
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class AuditTrailPlanTests(BookingTestCase):
+
+    def plan(self, entries):
+        sql, params = entries.order_by(*trail.ORDERING)[:50].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_every_filter_pages_from_an_index_without_sorting(self):
+        now = timezone.now()
+        for filters in [
+            {},
+            {'user': self.agent},
+            {'action': 'update'},
+            {'model_name': 'Booking'},
+            {'model_name': 'Booking', 'object_id': 1},
+            {'start': now - timedelta(days=7), 'end': now},
+            {'user': self.agent, 'action': 'update', 'start': now - timedelta(days=7)},
+        ]:
+            with self.subTest(filters=filters):
+                steps = [step for step in self.plan(trail.filter_entries(filters)) if 'audit_logs' in step
+                         or 'TEMP B-TREE' in step]
+                self.assertEqual(len(steps), 1, steps)
+                self.assertIn('USING INDEX audit_logs_', steps[0])
+
+
+class LeaseQueueTests(BookingTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_manager = User.objects.create_user('manager2', password='x', role='manager')
+
+    def setUp(self):
+        self.bookings = [self.make_booking(f'BK70000{i}', f'Customer {i}') for i in range(5)]
+
+    def test_managers_claim_disjoint_bookings(self):
+        mine = queue.claim_next(self.manager, 3)
+        theirs = queue.claim_next(self.other_manager, 3)
+
+        self.assertEqual(len(mine), 3)
+        self.assertEqual(len(theirs), 2)
+        self.assertFalse(set(mine) & set(theirs))
+        self.assertEqual(queue.claim_next(self.other_manager, 3), [])
+
+    def test_riskiest_bookings_first(self):
+        Booking.objects.filter(pk=self.bookings[3].pk).update(risk_score=90)
+        Booking.objects.filter(pk=self.bookings[1].pk).update(risk_score=50)
+
+        self.assertEqual(queue.claim_next(self.manager, 2), [self.bookings[3].pk, self.bookings[1].pk])
+
+    def test_expired_lease_is_free_again(self):
+        booking = self.bookings[0]
+        self.assertTrue(queue.claim(booking, self.manager))
+        self.assertFalse(queue.claim(booking, self.other_manager))
+
+        Booking.objects.filter(pk=booking.pk).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(queue.claim(booking, self.other_manager))
+        booking.refresh_from_db()
+        self.assertEqual(queue.holder(booking), self.other_manager)
+
+    def test_claim_next_renews_own_claims(self):
+        claimed = queue.claim_next(self.manager, 1)
+        Booking.objects.filter(pk__in=claimed).update(claim_expires_at=timezone.now() + timedelta(seconds=5))
+
+        queue.claim_next(self.manager, 1)
+        expires_at = Booking.objects.get(pk=claimed[0]).claim_expires_at
+        self.assertGreater(expires_at, timezone.now() + queue.LEASE_DURATION - timedelta(minutes=1))
+
+    def test_bulk_validate_skips_bookings_claimed_by_another_manager(self):
+        claimed = self.bookings[0]
+        queue.claim(claimed, self.other_manager)
+
+        changed = bulk_validate([booking.pk for booking in self.bookings[:2]], 'approve', self.manager)
+
+        self.assertEqual([booking.pk for booking in changed], [self.bookings[1].pk])
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, 'pending')
+
+    def test_release_frees_claims(self):
+        claimed = queue.claim_next(self.manager, 2)
+
+        self.assertEqual(queue.release(self.manager, claimed[:1]), 1)
+        self.assertEqual(list(queue.my_claims(self.manager).values_list('pk', flat=True)), claimed[1:])
+        self.assertEqual(
+            set(queue.claim_next(self.other_manager, 10)),
+            {booking.pk for booking in self.bookings} - set(claimed[1:]),
+        )
+
+
+class AuditArchiveTests(BookingTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        now = timezone.now()
+        self.old = now - timedelta(days=400)
+        AuditLog.objects.bulk_create([
+            AuditLog(model_name='Booking', object_id=number % 3, action='update', user=self.agent,
+                     changes={'number': number}, notes=f'Entry {number}', timestamp=self.old + timedelta(days=number))
+            for number in range(40)
+        ] + [AuditLog(model_name='Booking', object_id=1, action='approve', user=self.manager, timestamp=now)])
+
+    def archive(self, **kwargs):
+        return archive.archive(before=timezone.now() - timedelta(days=180), root=self.root, **kwargs)
+
+    def test_round_trip(self):
+        archived_rows = {
+            entry.pk: entry for entry in AuditLog.objects.filter(timestamp__lt=timezone.now() - timedelta(days=180))
+        }
+
+        rows, months, _ = self.archive(batch_size=4)
+
+        self.assertEqual(rows, 40)
+        self.assertEqual(months, len(archive.archived_months(self.root)))
+        self.assertFalse(AuditLog.objects.filter(pk__in=archived_rows).exists())
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+        restored = [entry for object_id in range(3) for entry in archive.search_archive('Booking', object_id, self.root)]
+        self.assertEqual(sorted(entry.pk for entry in restored), sorted(archived_rows))
+        for entry in restored:
+            original = archived_rows[entry.pk]
+            self.assertEqual(
+                (entry.object_id, entry.action, entry.user_id, entry.changes, entry.notes, entry.timestamp),
+                (original.object_id, original.action, original.user_id, original.changes, original.notes,
+                 original.timestamp),
+            )
+
+    def test_index_written_once_per_checkpoint(self):
+        with mock.patch.object(archive, '_save_index', wraps=archive._save_index) as save_index:
+            self.archive(batch_size=1)
+        # One write per month touched, not one per member
+        self.assertEqual(save_index.call_count, len(archive.archived_months(self.root)))
+
+        with mock.patch.object(archive, 'INDEX_EVERY', 3), \
+                mock.patch.object(archive, '_save_index', wraps=archive._save_index) as save_index:
+            AuditLog.objects.filter(action='approve').update(timestamp=self.old)
+            self.assertEqual(self.archive(batch_size=1)[0], 1)
+        self.assertEqual(save_index.call_count, 1)
+        self.assertEqual(len(archive.search_archive('Booking', 1, self.root)), 14)
+
+    def test_unindexed_rows_stay_in_the_table(self):
+        with mock.patch.object(archive, '_save_index', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.archive()
+        self.assertEqual(AuditLog.objects.count(), 41)
+
+        self.archive()
+        self.assertEqual(AuditLog.objects.count(), 1)
+        self.assertEqual(len(archive.search_archive('Booking', 2, self.root)), 13)
+
+    def test_audit_trail_lists_an_objects_archived_entries(self):
+        self.archive()
+        self.client.force_login(self.admin)
+
+        with override_settings(AUDIT_ARCHIVE={'ROOT': self.root}):
+            response = self.client.get(reverse('bookings:audit_trail'), {'model_name': 'Booking', 'object_id': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry.action for entry in response.context['page_obj']], ['approve'])
+        archived = response.context['archived']
+        self.assertEqual(len(archived), 13)
+        self.assertEqual([entry.timestamp for entry in archived], sorted(
+            (entry.timestamp for entry in archived), reverse=True
+        ))
+        self.assertContains(response, 'Archived entries')
+
+
+class BulkWriterUpdatedAtTests(BookingTestCase):
+
+    def setUp(self):
+        self.booking = self.make_booking('BK500001', 'Customer Stale')
+        self.stale = timezone.now() - timedelta(days=1)
+        Booking.objects.filter(pk=self.booking.pk).update(updated_at=self.stale)
+
+    def assertTouched(self):
+        self.booking.refresh_from_db()
+        self.assertGreater(self.booking.updated_at, self.stale + timedelta(hours=1))
+
+    def test_reflagging_after_a_discount_limit_change(self):
+        Package.objects.filter(pk=self.package.pk).update(max_discount_percentage=Decimal('2'))
+        revalidation.revalidate_package(Package.objects.get(pk=self.package.pk), ['max_discount_percentage'])
+        self.booking.refresh_from_db()
+        self.assertTrue(self.booking.excess_discount_flag)
+        self.assertTouched()
+
+    def test_repricing_after_a_tax_change(self):
+        Package.objects.filter(pk=self.package.pk).update(tax_percentage=Decimal('12'))
+        total = self.booking.total_amount
+        revalidation.revalidate_package(Package.objects.get(pk=self.package.pk), ['tax_percentage'])
+        self.booking.refresh_from_db()
+        self.assertNotEqual(self.booking.total_amount, total)
+        self.assertTouched()
+
+    def test_duplicate_scan(self):
+        Booking.objects.filter(pk=self.booking.pk).update(duplicate_booking_flag=True)
+        call_command('detect_duplicates', stdout=StringIO())
+        self.booking.refresh_from_db()
+        self.assertFalse(self.booking.duplicate_booking_flag)
+        self.assertTouched()
+
+
+@override_settings(PACKAGE_REVALIDATION_BACKGROUND=False, AUDIT_LOG={'BACKGROUND': False})
+class PackageRevalidationTests(BookingTestCase):
+
+    def test_audit_entry_credits_the_editing_user(self):
+        self.make_booking('BK400001', 'Customer Pending')
+        self.client.force_login(self.admin)
+        package = self.package
+        data = {
+            field: getattr(package, field) for field in (
+                'name', 'description', 'destination', 'duration_days', 'base_price', 'tax_percentage',
+                'commission_percentage', 'is_active',
+            )
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('packages:edit', args=[package.pk]), {
+                **data, 'seasonal_price': '', 'max_discount_percentage': '2',
+            })
+
+        self.assertEqual(response.status_code, 302)
+        entry = AuditLog.objects.get(model_name='Package', object_id=package.pk)
+        self.assertEqual(entry.user, self.admin)
+        self.assertEqual(entry.changes['fields'], ['max_discount_percentage'])
+        self.assertEqual(len(entry.changes['excess_discount']), 1)
+
+
+class NearDuplicateTests(BookingTestCase):
+
+    def customer(self, number, name, email, phone):
+        booking = self.make_booking(number, name)
+        booking.customer_email, booking.customer_phone = email, phone
+        booking.save()
+        return booking
+
+    def test_inline_check_scores_the_candidates_the_scan_does(self):
+        for i in range(matching.MAX_CANDIDATES + 5):
+            self.customer(f'BK5{i:05d}', 'Rahul Sharma', f'guest{i}@example.com', f'70000{i:05d}')
+        original = self.customer('BK509000', 'Rahul Sharma', 'rahul@gmail.com', '9876543210')
+        booking = self.customer('BK509999', 'Rahul Sharma', 'rahul.s@yahoo.com', '+91 98765 43210')
+
+        found = matching.find_near_duplicate(booking)
+
+        self.assertEqual(found[0], original.pk)
+        rows = Booking.objects.filter(package=self.package).order_by('created_at', 'id')
+        changes = dict(matching.scan_groups([list(rows.values_list(*matching.SCAN_FIELDS))]))
+        self.assertIs(changes[booking.pk], True)
+
+
+
+class RiskScoreTests(BookingTestCase):
+
+    def test_refresh_scores_flags_and_orders_the_pending_queue(self):
+        flags = {
+            'BK950001': {'near_duplicate_flag': True},
+            'BK950002': {'price_mismatch_flag': True, 'duplicate_booking_flag': True},
+            'BK950003': {},
+            'BK950004': {'excess_discount_flag': True},
+            'BK950005': {'price_mismatch_flag': True},
+            'BK950006': {'price_mismatch_flag': True},
+        }
+        for number, set_flags in flags.items():
+            booking = self.make_booking(number, f'Customer {number}')
+            # Changed behind the stored risk's back, as set-based writers do
+            Booking.objects.filter(pk=booking.pk).update(**set_flags)
+        approved = self.make_booking('BK950007', 'Customer Approved', status='approved')
+        Booking.objects.filter(pk=approved.pk).update(duplicate_booking_flag=True)
+
+        self.assertEqual(risk.refresh(Booking.objects.all()), 7)
+
+        stored = {
+            number: (bits, score)
+            for number, bits, score in Booking.objects.values_list('booking_number', 'risk_flags', 'risk_score')
+        }
+        self.assertEqual(stored, {
+            'BK950001': (risk.NEAR_DUPLICATE, 10),
+            'BK950002': (risk.PRICE_MISMATCH | risk.DUPLICATE, 70),
+            'BK950003': (0, 0),
+            'BK950004': (risk.EXCESS_DISCOUNT, 20),
+            'BK950005': (risk.PRICE_MISMATCH, 40),
+            'BK950006': (risk.PRICE_MISMATCH, 40),
+            'BK950007': (risk.DUPLICATE, 30),
+        })
+
+        self.client.force_login(self.manager)
+        for params, expected in (
+            ({}, ['BK950002', 'BK950005', 'BK950006', 'BK950004', 'BK950001', 'BK950003']),
+            ({'flagged': 'true'}, ['BK950002', 'BK950005', 'BK950006', 'BK950004', 'BK950001']),
+        ):
+            response = self.client.get(reverse('bookings:pending'), params)
+            self.assertEqual([booking.booking_number for booking in response.context['page_obj']], expected)
+
+
+def duplicate_submission(package, agent, number):
+    """An unsaved booking of the same customer and trip each time, as the booking form submits it."""
+    booking = Booking(
+        package=package, customer_name='Asha Rao', customer_email='asha@example.com',
+        customer_phone='9876543210', travel_date=timezone.localdate(), number_of_travelers=2,
+        package_price=Decimal('20000'), discount_percentage=Decimal('0'), booking_number=number,
+        created_by=agent,
+    )
+    booking.calculate_totals()
+    return booking
+
+
+class DuplicateCheckTests(BookingTestCase):
+
+    def test_duplicate_saved_while_waiting_for_the_lock_is_flagged(self):
+        lock_package = duplicates.lock_package
+        other = [duplicate_submission(self.package, self.agent, 'BK900001')]
+
+        def lock_after_the_other_agent(*args):
+            # The other submission gets the lock first and commits meanwhile
+            if other:
+                self.assertFalse(duplicates.check_and_save(other.pop()))
+            lock_package(*args)
+
+        with mock.patch.object(duplicates, 'lock_package', side_effect=lock_after_the_other_agent):
+            self.assertTrue(duplicates.check_and_save(duplicate_submission(self.package, self.agent, 'BK900002')))
+
+        flags = dict(Booking.objects.values_list('booking_number', 'duplicate_booking_flag'))
+        self.assertEqual(flags, {'BK900001': False, 'BK900002': True})
+
+
+class ConcurrentDuplicateCheckTests(TransactionTestCase):
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Connections to an in-memory SQLite database cannot wait for each other')
+        self.agent = User.objects.create_user('agent', password='x', role='sales_agent')
+        self.package = Package.objects.create(
+            name='Goa Trip', destination='Goa', base_price=Decimal('10000'), created_by=self.agent
+        )
+
+    def test_one_of_two_simultaneous_submissions_is_flagged(self):
+        barrier = threading.Barrier(2)
+        results = []
+
+        def submit(number):
+            try:
+                booking = duplicate_submission(self.package, self.agent, number)
+                barrier.wait()
+                results.append(duplicates.check_and_save(booking))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit, args=(f'BK90001{i}',)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False, True])
+        self.assertEqual(Booking.objects.filter(duplicate_booking_flag=True).count(), 1)
@@ -6,8 +6,15 @@ app_name = 'bookings'
 urlpatterns = [
     path('bookings/', views.booking_list, name='list'),
     path('bookings/create/', views.booking_create, name='create'),
+    path('bookings/import/', views.booking_import, name='import'),
     path('bookings/<int:pk>/', views.booking_detail, name='detail'),
     path('bookings/<int:pk>/validate/', views.booking_validate, name='validate'),
     path('bookings/pending/', views.pending_validations, name='pending'),
+    path('bookings/pending/validate/', views.bulk_validate_bookings, name='bulk_validate'),
+    path('bookings/queue/', views.validation_queue, name='queue'),
+    path('bookings/queue/claim/', views.queue_claim, name='queue_claim'),
+    path('bookings/queue/release/', views.queue_release, name='queue_release'),
+    path('bookings/audit/', views.audit_trail, name='audit_trail'),
+    path('bookings/audit/stats/', views.audit_stats, name='audit_stats'),
 ]
 
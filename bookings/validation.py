@@ -0,0 +1,66 @@
+"""
+Bulk approval and rejection of pending bookings.
+
+``bulk_validate`` changes a whole selection with one ``UPDATE`` guarded by
+``status = 'pending'``, so a booking another manager validated in the
+meantime, or that another manager holds a live claim on (see ``queue``),
+is skipped rather than overwritten. The rows written are stamped
+with the validating user and one ``validated_at`` value and read back by
+that stamp, which tells exactly which bookings this call changed on any
+database backend.
+"""
+from django.db import transaction
+from django.utils import timezone
+from . import audit, queue
+from .models import Booking
+from .signals import bookings_updated
+
+
+# Validation action -> booking status (the action doubles as the audit action)
+ACTIONS = {
+    'approve': 'approved',
+    'reject': 'rejected',
+}
+
+# Bookings accepted per bulk request
+MAX_BULK_VALIDATE = 500
+
+
+def bulk_validate(ids, action, user, notes='', ip_address=None):
+    """
+    Approve or reject the bookings among ``ids`` that are still pending, on
+    behalf of ``user``. Returns the changed bookings ordered by id; the
+    other ids were not pending any more, or are claimed by another
+    manager, and are left untouched.
+    """
+    status = ACTIONS[action]
+    validated_at = timezone.now()
+    fields = {
+        'status': status,
+        'validated_by': user,
+        'validated_at': validated_at,
+        'claimed_by': None,
+        'claim_expires_at': None,
+        # update() skips auto_now
+        'updated_at': validated_at,
+    }
+    if notes or action == 'reject':
+        # Same as Booking.approve, which keeps existing notes when none are given
+        fields['validation_notes'] = notes
+
+    with transaction.atomic():
+        Booking.objects.filter(
+            queue.free(user, validated_at), pk__in=ids, status='pending'
+        ).update(**fields)
+        changed = list(Booking.objects.filter(
+            pk__in=ids, status=status, validated_by=user, validated_at=validated_at
+        ).order_by('pk'))
+
+        audit.record(
+            audit.entry('Booking', booking.pk, action, user, {'status': status}, notes, ip_address)
+            for booking in changed
+        )
+        bookings_updated.send(sender=Booking, bookings=changed, previous={
+            booking.pk: {'status': 'pending'} for booking in changed
+        })
+    return changed
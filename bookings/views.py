@@ -1,28 +1,26 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q, Sum, Count
+from django.http import JsonResponse
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.utils import timezone
-from .models import Booking, AuditLog
-from .forms import BookingForm, BookingValidationForm
-from accounts.decorators import sales_agent_required, manager_required
+from django.utils.http import url_has_allowed_host_and_scheme
+from .models import AuditLog, Booking
+from .forms import (
+    AuditTrailForm, BookingForm, BookingImportForm, BookingValidationForm, BulkValidationForm
+)
+from .pagination import paginate
+from . import audit, queue, search as search_index, trail
+from .duplicates import check_and_save
+from .importer import import_bookings, read_rows, write_report
+from .validation import bulk_validate
+from accounts.decorators import admin_required, auditor_required, sales_agent_required, manager_required
+import io
 import uuid
 
 
-def create_audit_log(model_name, object_id, action, user, changes=None, notes='', ip_address=None):
-    """Helper function to create audit logs."""
-    AuditLog.objects.create(
-        model_name=model_name,
-        object_id=object_id,
-        action=action,
-        user=user,
-        changes=changes or {},
-        notes=notes,
-        ip_address=ip_address
-    )
-
-
 @login_required
 @sales_agent_required
 def booking_create(request):
@@ -37,14 +35,12 @@ def booking_create(request):
             # Calculate totals
             booking.calculate_totals()
             
-            # Validate pricing and check for duplicates
+            # Validate pricing, then check for duplicates and insert atomically
             pricing_errors = booking.validate_pricing()
-            booking.check_duplicate()
-            
-            booking.save()
+            check_and_save(booking)
             
             # Create audit log
-            create_audit_log(
+            audit.log(
                 'Booking',
                 booking.id,
                 'create',
@@ -53,7 +49,7 @@ def booking_create(request):
                 ip_address=request.META.get('REMOTE_ADDR')
             )
             
-            if pricing_errors or booking.duplicate_booking_flag:
+            if pricing_errors or booking.duplicate_booking_flag or booking.near_duplicate_flag:
                 messages.warning(
                     request, 
                     f'Booking created but flagged for review: {"; ".join(pricing_errors)}'
@@ -68,6 +64,54 @@ def booking_create(request):
     return render(request, 'bookings/form.html', {'form': form, 'title': 'Create Booking'})
 
 
+@login_required
+@sales_agent_required
+def booking_import(request):
+    """Create bookings in bulk from an uploaded CSV or JSON file."""
+    result = None
+    report_url = None
+    
+    if request.method == 'POST':
+        form = BookingImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            import_format = 'json' if upload.name.lower().endswith('.json') else 'csv'
+            source = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_bookings(
+                    read_rows(source, import_format),
+                    request.user,
+                    ip_address=request.META.get('REMOTE_ADDR')
+                )
+            except ValueError as exc:
+                messages.error(request, f'Could not read {upload.name}: {exc}')
+                return redirect('bookings:import')
+            
+            if result.errors:
+                report = io.StringIO()
+                write_report(result.errors, report)
+                name = default_storage.save(
+                    f'import_reports/{timezone.now():%Y%m%d%H%M%S}_errors.csv',
+                    ContentFile(report.getvalue().encode())
+                )
+                report_url = default_storage.url(name)
+                messages.warning(
+                    request,
+                    f'{result.created} bookings imported, some rows were rejected.'
+                )
+            else:
+                messages.success(request, f'{result.created} bookings imported successfully.')
+    else:
+        form = BookingImportForm()
+    
+    return render(request, 'bookings/import.html', {
+        'form': form,
+        'result': result,
+        'errors': result.errors[:50] if result else [],
+        'report_url': report_url
+    })
+
+
 @login_required
 def booking_list(request):
     """List all bookings."""
@@ -82,30 +126,23 @@ def booking_list(request):
     if request.user.is_sales_agent() and not request.user.is_admin():
         bookings = bookings.filter(created_by=request.user)
     
-    # Search
-    search = request.GET.get('search')
-    if search:
-        bookings = bookings.filter(
-            Q(booking_number__icontains=search) |
-            Q(customer_name__icontains=search) |
-            Q(customer_email__icontains=search)
-        )
     
     # Filter by flags
     flagged = request.GET.get('flagged')
     if flagged == 'true':
-        bookings = bookings.filter(
-            Q(price_mismatch_flag=True) |
-            Q(excess_discount_flag=True) |
-            Q(duplicate_booking_flag=True)
-        )
+        # Any flag set means a positive risk score
+        bookings = bookings.filter(risk_score__gt=0)
     
-    paginator = Paginator(bookings, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Search (ranked matches from the search index, best first)
+    search = request.GET.get('search')
+    if search:
+        page_obj, query_string = search_index.paginate(request, 'booking', search, bookings, 20)
+    else:
+        page_obj, query_string = paginate(request, bookings, 20)
     
     return render(request, 'bookings/list.html', {
         'page_obj': page_obj,
+        'query_string': query_string,
         'status': status,
         'search': search,
         'flagged': flagged
@@ -136,35 +173,39 @@ def booking_validate(request, pk):
         messages.warning(request, 'This booking has already been validated.')
         return redirect('bookings:detail', pk=pk)
     
+    # Claim the booking so other managers do not work on it at the same time
+    if not queue.claim(booking, request.user):
+        booking.refresh_from_db()
+        holder = queue.holder(booking)
+        if booking.status != 'pending' or holder is None:
+            messages.warning(request, 'This booking has already been validated.')
+        else:
+            messages.warning(
+                request,
+                f'{holder.get_full_name() or holder.username} is validating this booking '
+                f'(claimed until {timezone.localtime(booking.claim_expires_at):%H:%M}).'
+            )
+        return redirect('bookings:detail', pk=pk)
+    
     if request.method == 'POST':
         form = BookingValidationForm(request.POST)
         if form.is_valid():
             action = form.cleaned_data['action']
             notes = form.cleaned_data['validation_notes']
             
-            if action == 'approve':
-                booking.approve(request.user, notes)
-                create_audit_log(
-                    'Booking',
-                    booking.id,
-                    'approve',
-                    request.user,
-                    {'status': 'approved'},
-                    notes=notes,
-                    ip_address=request.META.get('REMOTE_ADDR')
-                )
+            # Guarded update: a concurrent validation is never overwritten
+            changed = bulk_validate(
+                [booking.pk],
+                action,
+                request.user,
+                notes=notes,
+                ip_address=request.META.get('REMOTE_ADDR')
+            )
+            if not changed:
+                messages.warning(request, 'This booking has already been validated.')
+            elif action == 'approve':
                 messages.success(request, f'Booking #{booking.booking_number} approved successfully.')
             else:
-                booking.reject(request.user, notes)
-                create_audit_log(
-                    'Booking',
-                    booking.id,
-                    'reject',
-                    request.user,
-                    {'status': 'rejected'},
-                    notes=notes,
-                    ip_address=request.META.get('REMOTE_ADDR')
-                )
                 messages.success(request, f'Booking #{booking.booking_number} rejected.')
             
             return redirect('bookings:detail', pk=pk)
@@ -180,26 +221,161 @@ def booking_validate(request, pk):
 @login_required
 @manager_required
 def pending_validations(request):
-    """List all pending validations."""
+    """List all pending validations, riskiest first."""
     bookings = Booking.objects.filter(status='pending').select_related(
-        'package', 'created_by'
-    ).order_by('created_at')
+        'package', 'created_by', 'claimed_by'
+    )
     
     # Filter by flags
     flagged = request.GET.get('flagged')
     if flagged == 'true':
-        bookings = bookings.filter(
-            Q(price_mismatch_flag=True) |
-            Q(excess_discount_flag=True) |
-            Q(duplicate_booking_flag=True)
-        )
+        # Any flag set means a positive risk score
+        bookings = bookings.filter(risk_score__gt=0)
     
-    paginator = Paginator(bookings, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj, query_string = paginate(request, bookings, 20, ordering=queue.ORDERING)
     
     return render(request, 'bookings/pending.html', {
         'page_obj': page_obj,
-        'flagged': flagged
+        'query_string': query_string,
+        'flagged': flagged,
+        'now': timezone.now(),
+        'claimed_count': queue.my_claims(request.user).count()
     })
 
+
+@login_required
+@manager_required
+def validation_queue(request):
+    """The bookings the current manager has claimed for validation."""
+    bookings = queue.my_claims(request.user).select_related(
+        'package', 'created_by'
+    ).order_by(*queue.ORDERING)
+    
+    return render(request, 'bookings/queue.html', {
+        'bookings': bookings,
+        'claim_size': queue.CLAIM_SIZE,
+        'max_claim_size': queue.MAX_CLAIM_SIZE,
+        'lease_minutes': int(queue.LEASE_DURATION.total_seconds() // 60)
+    })
+
+
+@login_required
+@manager_required
+@require_POST
+def queue_claim(request):
+    """Claim the next riskiest unclaimed pending bookings."""
+    try:
+        count = int(request.POST.get('count', queue.CLAIM_SIZE))
+    except ValueError:
+        count = queue.CLAIM_SIZE
+    count = max(1, min(count, queue.MAX_CLAIM_SIZE))
+    
+    claimed = queue.claim_next(request.user, count)
+    if claimed:
+        messages.success(request, f'Claimed {len(claimed)} booking(s) for validation.')
+    else:
+        messages.info(request, 'There are no unclaimed pending bookings left.')
+    
+    return redirect('bookings:queue')
+
+
+@login_required
+@manager_required
+@require_POST
+def queue_release(request):
+    """Give up the selected claims."""
+    try:
+        ids = [int(pk) for pk in request.POST.getlist('booking_ids')]
+    except ValueError:
+        ids = []
+    
+    if ids:
+        released = queue.release(request.user, ids)
+        messages.success(request, f'Released {released} booking(s).')
+    else:
+        messages.error(request, 'Select at least one booking.')
+    
+    return redirect('bookings:queue')
+
+
+@login_required
+@manager_required
+@require_POST
+def bulk_validate_bookings(request):
+    """Approve or reject the bookings selected on the pending validations or queue page."""
+    form = BulkValidationForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return _redirect_back(request, 'bookings:pending')
+    
+    action = form.cleaned_data['action']
+    ids = form.cleaned_data['booking_ids']
+    changed = bulk_validate(
+        ids,
+        action,
+        request.user,
+        notes=form.cleaned_data['validation_notes'],
+        ip_address=request.META.get('REMOTE_ADDR')
+    )
+    
+    if changed:
+        numbers = ', '.join(f'#{booking.booking_number}' for booking in changed)
+        verb = 'Approved' if action == 'approve' else 'Rejected'
+        messages.success(request, f'{verb} {len(changed)} booking(s): {numbers}.')
+    
+    skipped = sorted(set(ids) - {booking.pk for booking in changed})
+    if skipped:
+        messages.warning(
+            request,
+            f'{len(skipped)} booking(s) were no longer pending or are claimed by another manager '
+            f'and were left unchanged (ids {", ".join(map(str, skipped))}).'
+        )
+    
+    return _redirect_back(request, 'bookings:pending')
+
+
+def _redirect_back(request, default):
+    """Redirect to the posted ``next`` URL when it is local, else to ``default``."""
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect(default)
+
+
+@login_required
+@admin_required
+def audit_stats(request):
+    """Audit log writer queue depth and write counters of this worker (admin only)."""
+    return JsonResponse(audit.get_stats())
+
+
+@login_required
+@auditor_required
+def audit_trail(request):
+    """Browse and export the audit log (auditors and admins)."""
+    form = AuditTrailForm(request.GET)
+    archived = []
+    if form.is_valid():
+        entries = trail.filter_entries(form.cleaned_data)
+    else:
+        entries = AuditLog.objects.none()
+    
+    # CSV/JSON Lines export of every matching entry
+    export_format = request.GET.get('format')
+    if export_format in trail.EXPORT_FORMATS and form.is_valid():
+        stamp = timezone.localtime().strftime('%Y%m%d_%H%M%S')
+        return trail.export_response(export_format, f'audit_trail_{stamp}', entries)
+    
+    page_obj, query_string = paginate(request, entries, 50, ordering=trail.ORDERING)
+    if form.is_valid() and not page_obj.has_next():
+        # An object's older entries, after its last page of live ones
+        archived = trail.archived_entries(form.cleaned_data)
+    
+    return render(request, 'bookings/audit_trail.html', {
+        'form': form,
+        'page_obj': page_obj,
+        'query_string': query_string,
+        'archived': archived
+    })
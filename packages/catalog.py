@@ -0,0 +1,138 @@
+"""
+In-process package catalog.
+
+Booking forms, ``booking_create`` and the package API need package prices,
+tax, commission and discount limits on almost every request, but the
+catalog only changes a few times a day. Each worker process keeps every
+``Package`` in memory and serves lookups from there.
+
+The version stamp of the catalog is read from the database itself: the
+latest ``updated_at`` and the number of packages, one aggregate over a
+small table. Every worker sees the same stamp, so a package saved or
+deleted in one worker is reloaded by all of them at their next check (at
+most every ``CHECK_INTERVAL`` seconds) without a shared cache. The saving
+worker drops its copy as soon as the change commits. Changes that leave
+the stamp alone, such as a ``queryset.update()`` without ``updated_at`` or
+a save committed after a later one, are picked up when a copy reaches
+``MAX_AGE`` seconds and is reloaded regardless.
+
+Cached packages are shared between requests and must not be modified.
+"""
+import os
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from .models import Package
+
+
+DEFAULTS = {
+    'CHECK_INTERVAL': 5,  # seconds between version checks
+    'MAX_AGE': 300,  # seconds after which a copy is reloaded even if the stamp is unchanged
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'PACKAGE_CATALOG', {}))
+    return config
+
+
+def current_version():
+    """``(latest updated_at, package count)``, the same in every worker."""
+    stamp = Package.objects.aggregate(updated=Max('updated_at'), count=Count('id'))
+    return stamp['updated'], stamp['count']
+
+
+def bump_version():
+    """Make this worker reload its catalog once the current transaction commits; others follow the stamp."""
+    transaction.on_commit(catalog.clear)
+
+
+class Catalog:
+    """All packages of one process, reloaded when the shared stamp changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (version, {pk: package}, [active packages]), replaced as a whole
+        self._snapshot = (None, {}, [])
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _load(self):
+        config = get_config()
+        snapshot = self._snapshot
+        now = time.monotonic()
+        expired = now - self._loaded_at >= config['MAX_AGE']
+        if snapshot[0] is not None and not expired and now - self._checked_at < config['CHECK_INTERVAL']:
+            self.hits += 1
+            return snapshot
+
+        version = current_version()
+        self._checked_at = time.monotonic()
+        if version == snapshot[0] and not expired:
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is snapshot or self._snapshot[0] != version:
+                # The stamp is read before the rows, so a change committed
+                # during the load moves it again and forces another reload
+                packages = list(Package.objects.all())
+                self._snapshot = (
+                    version,
+                    {package.pk: package for package in packages},
+                    [package for package in packages if package.is_active],
+                )
+                self._loaded_at = self._checked_at
+                self.reloads += 1
+            self.misses += 1
+            return self._snapshot
+
+    def get(self, pk):
+        """Package with primary key ``pk``, or None."""
+        return self._load()[1].get(pk)
+
+    def active(self):
+        """Active packages in the model's default order."""
+        return self._load()[2]
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = (None, {}, [])
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        version, packages, active = self._snapshot
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'reloads': self.reloads,
+            'packages': len(packages),
+            'active_packages': len(active),
+            'version': [value.isoformat() if hasattr(value, 'isoformat') else value
+                        for value in version] if version else None,
+            'pid': os.getpid(),
+        }
+
+
+catalog = Catalog()
+
+
+def get_package(pk):
+    """Package ``pk`` from the catalog, or None."""
+    return catalog.get(pk)
+
+
+def active_packages():
+    return catalog.active()
+
+
+def get_stats():
+    """Hit/miss/reload counters of this worker's catalog."""
+    return catalog.get_stats()
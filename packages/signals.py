@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import catalog
+from .models import Package
+
+
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Package)
+def invalidate_catalog(sender, raw=False, **kwargs):
+    """Make every worker reload its package catalog."""
+    if not raw:
+        catalog.bump_version()
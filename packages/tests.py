@@ -0,0 +1,77 @@
+from decimal import Decimal
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from . import catalog
+from .models import Package
+
+
+@override_settings(PACKAGE_CATALOG={'CHECK_INTERVAL': 0, 'MAX_AGE': 300})
+class CatalogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user('admin', password='x', role='admin')
+        cls.package = Package.objects.create(
+            name='Goa Trip', destination='Goa', base_price=Decimal('10000'), created_by=admin
+        )
+
+    def setUp(self):
+        catalog.catalog.clear()
+        self.addCleanup(catalog.catalog.clear)
+
+    def test_change_by_another_worker_is_seen(self):
+        self.assertEqual(catalog.get_package(self.package.pk).base_price, Decimal('10000'))
+        # No signal fires in this process, as if another worker had saved it
+        Package.objects.filter(pk=self.package.pk).update(base_price=Decimal('12000'), updated_at=timezone.now())
+        self.assertEqual(catalog.get_package(self.package.pk).base_price, Decimal('12000'))
+
+    def test_unstamped_change_is_seen_after_max_age(self):
+        catalog.get_package(self.package.pk)
+        Package.objects.filter(pk=self.package.pk).update(base_price=Decimal('12000'))
+        self.assertEqual(catalog.get_package(self.package.pk).base_price, Decimal('10000'))
+
+        catalog.catalog._loaded_at -= 301
+        self.assertEqual(catalog.get_package(self.package.pk).base_price, Decimal('12000'))
+
+    def test_deleted_package_disappears(self):
+        self.assertEqual(len(catalog.active_packages()), 1)
+        Package.objects.filter(pk=self.package.pk).delete()
+        self.assertIsNone(catalog.get_package(self.package.pk))
+
+
+@override_settings(PACKAGE_CATALOG={'CHECK_INTERVAL': 0, 'MAX_AGE': 300})
+class PackageApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = User.objects.create_user('agent', password='x', role='sales_agent')
+        cls.package = Package.objects.create(
+            name='Goa Trip', destination='Goa', base_price=Decimal('10000'), created_by=cls.agent
+        )
+
+    def setUp(self):
+        catalog.catalog.clear()
+        self.addCleanup(catalog.catalog.clear)
+        self.client.force_login(self.agent)
+
+    def get(self, **headers):
+        return self.client.get(reverse('packages:api', args=[self.package.pk]), headers=headers)
+
+    def test_etag_round_trip(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+        package = Package.objects.get(pk=self.package.pk)
+        package.base_price = Decimal('12000')
+        package.save()
+
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(Decimal(str(response.json()['base_price'])), Decimal('12000'))
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
@@ -9,5 +9,7 @@ urlpatterns = [
     path('packages/<int:pk>/', views.package_detail, name='detail'),
     path('packages/<int:pk>/edit/', views.package_edit, name='edit'),
     path('api/package/<int:pk>/', views.package_api, name='api'),
+    path('api/packages/', views.package_pricing_api, name='pricing_api'),
+    path('packages/catalog/stats/', views.catalog_stats, name='catalog_stats'),
 ]
 
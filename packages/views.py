@@ -1,9 +1,13 @@
+import hashlib
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db import models
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from . import catalog
 from .models import Package
 from .forms import PackageForm
 from accounts.decorators import admin_required
@@ -65,6 +69,8 @@ def package_edit(request, pk):
     if request.method == 'POST':
         form = PackageForm(request.POST, instance=package)
         if form.is_valid():
+            # Credited with the re-validation of pending bookings
+            package._changed_by = request.user
             form.save()
             messages.success(request, f'Package "{package.name}" updated successfully.')
             return redirect('packages:list')
@@ -86,14 +92,87 @@ def package_detail(request, pk):
     return render(request, 'packages/detail.html', {'package': package})
 
 
-@login_required
-def package_api(request, pk):
-    """API endpoint to get package data for booking form."""
-    package = get_object_or_404(Package, pk=pk)
-    return JsonResponse({
+def package_pricing(package):
+    """Pricing fields the booking form needs."""
+    return {
         'current_price': str(package.get_current_price()),
         'base_price': str(package.base_price),
         'seasonal_price': str(package.seasonal_price) if package.seasonal_price else None,
         'tax_percentage': str(package.tax_percentage),
         'max_discount_percentage': str(package.max_discount_percentage),
+    }
+
+
+def pricing_etag(packages):
+    """
+    Strong ETag of a pricing response: the response is fully determined by
+    which packages it holds and when the newest of them changed.
+    """
+    if not packages:
+        return None
+    newest = max(package.updated_at for package in packages)
+    ids = ','.join(str(package.pk) for package in packages)
+    return hashlib.sha1(f'{newest.isoformat()}:{ids}'.encode()).hexdigest()
+
+
+def pricing_last_modified(packages):
+    return max((package.updated_at for package in packages), default=None)
+
+
+def _requested_packages(request):
+    """
+    Active packages, or the packages listed in ``?ids=1,2,3``; None when
+    the ids are malformed.
+    """
+    ids = request.GET.get('ids')
+    if not ids:
+        return catalog.active_packages()
+    try:
+        ids = sorted({int(pk) for pk in ids.split(',') if pk.strip()})
+    except ValueError:
+        return None
+    packages = (catalog.get_package(pk) for pk in ids)
+    return [package for package in packages if package is not None]
+
+
+def _single_package(pk):
+    package = catalog.get_package(pk)
+    return [package] if package is not None else []
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(
+    etag_func=lambda request, pk: pricing_etag(_single_package(pk)),
+    last_modified_func=lambda request, pk: pricing_last_modified(_single_package(pk)),
+)
+def package_api(request, pk):
+    """API endpoint to get package data for booking form."""
+    package = catalog.get_package(pk)
+    if package is None:
+        raise Http404('No Package matches the given query.')
+    return JsonResponse(package_pricing(package))
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(
+    etag_func=lambda request: pricing_etag(_requested_packages(request)),
+    last_modified_func=lambda request: pricing_last_modified(_requested_packages(request) or []),
+)
+def package_pricing_api(request):
+    """Pricing of all active packages, or of ``?ids=1,2,3``, in one response."""
+    packages = _requested_packages(request)
+    if packages is None:
+        return JsonResponse({'error': 'ids must be a comma-separated list of package ids.'}, status=400)
+    
+    return JsonResponse({
+        'packages': {str(package.pk): package_pricing(package) for package in packages},
     })
+
+
+@login_required
+@admin_required
+def catalog_stats(request):
+    """Package catalog hit/miss/reload counters of this worker (admin only)."""
+    return JsonResponse(catalog.get_stats())
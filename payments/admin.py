@@ -14,9 +14,9 @@ class PaymentAdmin(admin.ModelAdmin):
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ['invoice_number', 'booking', 'invoice_date', 'due_date']
-    list_filter = ['invoice_date']
+    list_display = ['invoice_number', 'booking', 'invoice_date', 'due_date', 'status']
+    list_filter = ['status', 'invoice_date']
     search_fields = ['invoice_number', 'booking__booking_number']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['status', 'attempts', 'error', 'created_at', 'updated_at']
     date_hierarchy = 'invoice_date'
 
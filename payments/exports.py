@@ -0,0 +1,78 @@
+"""
+Streamed ZIP exports of invoice PDFs.
+
+``stream_zip`` writes the PDFs of a set of invoices into a ZIP archive on
+an unseekable sink and hands the bytes on as soon as they are produced, so
+an export of any size needs neither a temporary file nor the archive in
+memory. Invoices are read in keyset batches on ``(invoice_date, id)`` and
+each PDF is copied into the archive in blocks; what remains in memory is
+the archive's central directory, a few hundred bytes per entry.
+
+On an unseekable sink every entry's CRC and sizes follow its data in a
+data descriptor. Some unzip tools reject that for stored entries, whose
+end cannot be found otherwise, so entries are deflated.
+
+Invoices whose PDF is not rendered yet are queued for the invoice worker
+(``payments.tasks``) and listed in a ``MISSING.txt`` entry rather than
+failing the whole download or holding the response until they are ready;
+exporting again once the worker is done includes them.
+"""
+import zipfile
+from django.http import FileResponse, StreamingHttpResponse
+from analytics.exports import FLUSH_BYTES, ChunkSink
+from bookings.pagination import CursorPaginator
+from . import tasks
+from .invoices import file_name
+from .models import Invoice
+
+
+# Invoices read per keyset query
+BATCH_SIZE = 500
+
+FIELDS = ('id', 'invoice_number', 'invoice_date', 'status', 'pdf_file')
+
+MISSING_NAME = 'MISSING.txt'
+
+
+def invoices_between(start, end):
+    """Invoices dated from ``start`` to ``end``, both inclusive."""
+    return Invoice.objects.filter(invoice_date__gte=start, invoice_date__lte=end)
+
+
+def _add(archive, sink, invoice):
+    """Copy the invoice's PDF into the archive, yielding whenever enough bytes are buffered."""
+    entry = zipfile.ZipInfo(file_name(invoice.invoice_number), date_time=invoice.invoice_date.timetuple()[:6])
+    entry.compress_type = archive.compression
+    with invoice.pdf_file.open('rb') as source, archive.open(entry, 'w') as target:
+        while True:
+            block = source.read(FileResponse.block_size)
+            if not block:
+                break
+            target.write(block)
+            if sink.size >= FLUSH_BYTES:
+                yield from sink.drain()
+
+
+def stream_zip(invoices):
+    """Yield a ZIP archive of the PDFs of ``invoices``, queueing the unrendered ones."""
+    tasks.enqueue_unrendered(invoices)
+    sink = ChunkSink()
+    missing = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        rows = CursorPaginator(invoices.only(*FIELDS), BATCH_SIZE, ordering=('invoice_date', 'id'))
+        for invoice in rows.iterate():
+            if invoice.is_ready():
+                yield from _add(archive, sink, invoice)
+            else:
+                missing.append(f'{invoice.invoice_number}\t{invoice.get_status_display()}\n')
+
+        if missing:
+            archive.writestr(MISSING_NAME, ''.join(missing))
+    yield from sink.drain()
+
+
+def export_response(filename, invoices):
+    """Stream the PDFs of ``invoices`` as a ZIP download."""
+    response = StreamingHttpResponse(stream_zip(invoices), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+    return response
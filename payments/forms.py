@@ -63,3 +63,18 @@ class PaymentForm(forms.ModelForm):
         
         return cleaned_data
 
+
+
+class InvoiceExportForm(forms.Form):
+    """Date range of an invoice PDF export; both days are included."""
+    
+    start = forms.DateField(widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    end = forms.DateField(widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    
+    def clean(self):
+        """The range must not end before it starts."""
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and end < start:
+            raise forms.ValidationError({'end': 'The end must not be before the start.'})
+        return cleaned_data
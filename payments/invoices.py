@@ -0,0 +1,144 @@
+"""
+Batch invoice generation.
+
+``generate`` invoices approved bookings that have none yet, at month end
+typically thousands at a time. Bookings are read in primary key batches
+with their package in one query each, their PDFs are rendered in parallel
+by a ``ProcessPoolExecutor``, the files are written and the ``Invoice``
+rows of the batch are inserted with one ``bulk_create``.
+
+A row is only inserted after its file is on disk, so an interrupted run
+leaves no invoice without a PDF, and each batch is selected afresh from
+the bookings still without an invoice, so running again resumes where the
+last run stopped. Rows are inserted ignoring conflicts on the booking, so
+concurrent or repeated runs never invoice a booking twice; only the rows a
+run inserted itself are counted and audited.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from django.core.files.base import ContentFile
+from django.db import transaction
+from bookings import audit
+from bookings.models import Booking
+from .models import Invoice
+from .rendering import render_invoice
+
+
+# Bookings per query, render round and bulk_create
+BATCH_SIZE = 200
+
+
+def invoice_number(booking, invoice_date=None):
+    invoice_date = invoice_date or date.today()
+    return f"INV{invoice_date.strftime('%Y%m%d')}{booking.id:06d}"
+
+
+def file_name(number):
+    return f'invoice_{number}.pdf'
+
+
+def invoice_data(booking, number, invoice_date):
+    """The picklable fields ``render_invoice`` draws, for the booking and its package."""
+    package = booking.package
+    return {
+        'invoice_number': number,
+        'invoice_date': invoice_date,
+        'booking_number': booking.booking_number,
+        'travel_date': booking.travel_date,
+        'customer_name': booking.customer_name,
+        'customer_email': booking.customer_email,
+        'customer_phone': booking.customer_phone,
+        'customer_address': booking.customer_address,
+        'package_name': package.name,
+        'destination': package.destination,
+        'duration_days': package.duration_days,
+        'number_of_travelers': booking.number_of_travelers,
+        'package_price': booking.package_price,
+        'discount_amount': booking.discount_amount,
+        'subtotal': booking.subtotal,
+        'tax_percentage': package.tax_percentage,
+        'tax_amount': booking.tax_amount,
+        'total_amount': booking.total_amount,
+    }
+
+
+def uninvoiced(bookings=None):
+    """Approved bookings of ``bookings`` (default: all) without an invoice."""
+    if bookings is None:
+        bookings = Booking.objects.all()
+    return bookings.filter(status='approved', invoice__isnull=True).select_related('package')
+
+
+def save_file(number, pdf):
+    """Store the PDF, reusing the file of an identical render (e.g. one left by an interrupted run)."""
+    field = Invoice._meta.get_field('pdf_file')
+    return field.storage.save(field.generate_filename(None, file_name(number)), ContentFile(pdf))
+
+
+def _insert(batch, invoices):
+    """
+    Insert the invoices of a batch of bookings, skipping bookings invoiced
+    meanwhile. Returns ``(pk, invoice_number)`` of the rows inserted here.
+    """
+    booking_ids = [booking.pk for booking in batch]
+    # Concurrent runs and generate_invoice lock the booking before inserting
+    list(Booking.objects.select_for_update().filter(pk__in=booking_ids).values_list('pk', flat=True))
+    invoiced = Invoice.objects.filter(booking_id__in=booking_ids)
+    existing = set(invoiced.values_list('booking_id', flat=True))
+    Invoice.objects.bulk_create(invoices, ignore_conflicts=True)
+    return list(invoiced.exclude(booking_id__in=existing).values_list('pk', 'invoice_number'))
+
+
+def _executor(workers):
+    # Workers start from a fresh interpreter rather than a fork, so they
+    # inherit neither database connections nor the audit writer thread
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+
+
+def generate(bookings=None, workers=None, batch_size=BATCH_SIZE, user=None, progress=None):
+    """
+    Invoice every approved booking of ``bookings`` that has no invoice.
+    ``workers`` render processes are used (default: one per CPU; 1 renders
+    in this process). ``progress(created, elapsed)`` is called after each
+    batch. Returns ``(invoices created, seconds elapsed)``.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = uninvoiced(bookings).order_by('pk')
+    executor = _executor(workers) if workers > 1 else None
+    started = time.perf_counter()
+    created, last_pk = 0, 0
+    try:
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            invoice_date = date.today()
+            numbers = [invoice_number(booking, invoice_date) for booking in batch]
+            data = [invoice_data(booking, number, invoice_date) for booking, number in zip(batch, numbers)]
+            if executor is not None:
+                pdfs = executor.map(render_invoice, data, chunksize=max(1, len(data) // (workers * 4)))
+            else:
+                pdfs = map(render_invoice, data)
+
+            invoices = [
+                Invoice(invoice_number=number, booking=booking, status='ready',
+                        pdf_file=save_file(number, pdf))
+                for booking, number, pdf in zip(batch, numbers, pdfs)
+            ]
+            with transaction.atomic():
+                inserted = _insert(batch, invoices)
+                for pk, number in inserted:
+                    audit.log('Invoice', pk, 'create', user, {'invoice_number': number},
+                              notes='Generated in batch')
+            created += len(inserted)
+            if progress is not None:
+                progress(created, time.perf_counter() - started)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return created, time.perf_counter() - started
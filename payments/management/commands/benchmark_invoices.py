@@ -0,0 +1,52 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from bookings.models import Booking
+from payments import rendering
+from payments.invoices import invoice_data, invoice_number
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare time per invoice of the platypus and fast-path PDF renderers on real bookings '
+        'and check that both render identical bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help='Bookings to render.')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        today = date.today()
+        bookings = Booking.objects.select_related('package').order_by('pk')[:options['count']]
+        data = [invoice_data(booking, invoice_number(booking, today), today) for booking in bookings]
+        if not data:
+            raise CommandError('No bookings to render.')
+
+        different = [
+            item['booking_number'] for item in data
+            if rendering.render_invoice(item) != rendering.render_invoice_platypus(item)
+        ]
+        fallbacks = sum(rendering.fast_path_rows(item) is None for item in data)
+
+        results = {}
+        for label, render in (('platypus', rendering.render_invoice_platypus),
+                              ('fast', rendering.render_invoice)):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                for item in data:
+                    render(item)
+                timings.append((time.perf_counter() - started) / len(data))
+            results[label] = min(timings)
+            self.stdout.write(
+                f'{label}: {len(data)} invoices best={min(timings) * 1000:.2f}ms/invoice '
+                f'avg={sum(timings) / len(timings) * 1000:.2f}ms/invoice'
+            )
+
+        self.stdout.write(
+            f"speedup={results['platypus'] / results['fast']:.1f}x fallbacks={fallbacks} "
+            f'different={len(different)}'
+        )
+        if different:
+            raise CommandError(f'Fast path output differs for: {", ".join(different[:10])}')
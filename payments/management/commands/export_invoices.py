@@ -0,0 +1,42 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from payments import exports
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the PDFs of every invoice dated in a range into one ZIP archive, streamed '
+        'straight to the output. PDFs not rendered yet are queued and listed in MISSING.txt.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='First invoice date (YYYY-MM-DD).')
+        parser.add_argument('end', help='Last invoice date (YYYY-MM-DD), included.')
+        parser.add_argument('--output', '-o', default=None,
+                            help="Archive path (default: invoices_<start>_<end>.zip; '-' for stdout).")
+
+    def handle(self, *args, **options):
+        start, end = parse_date(options['start']), parse_date(options['end'])
+        if start is None or end is None:
+            raise CommandError('Dates must be given as YYYY-MM-DD.')
+        if end < start:
+            raise CommandError('The end must not be before the start.')
+        output = options['output'] or f'invoices_{start:%Y%m%d}_{end:%Y%m%d}.zip'
+
+        started = time.perf_counter()
+        chunks = exports.stream_zip(exports.invoices_between(start, end))
+        written = 0
+        if output == '-':
+            target = sys.stdout.buffer
+            for chunk in chunks:
+                written += target.write(chunk)
+            target.flush()
+            return
+        with open(output, 'wb') as target:
+            for chunk in chunks:
+                written += target.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {output} ({written / 1024:.1f} KiB) in {time.perf_counter() - started:.2f}s.'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from bookings.models import Booking
+from payments import invoices
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate invoice PDFs for approved bookings without an invoice, rendering them '
+        'in parallel worker processes. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Render processes (default: one per CPU; 1 renders in-process).')
+        parser.add_argument('--batch-size', type=int, default=invoices.BATCH_SIZE,
+                            help='Bookings rendered and inserted per batch.')
+        parser.add_argument('--package', type=int, help='Only bookings of this package id.')
+        parser.add_argument('--since', help='Only bookings validated on or after this date (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if options['package']:
+            bookings = bookings.filter(package_id=options['package'])
+        if options['since']:
+            bookings = bookings.filter(validated_at__date__gte=options['since'])
+
+        def progress(created, elapsed):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{created} invoices ({created / elapsed:.1f}/s)')
+
+        created, elapsed = invoices.generate(
+            bookings,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        rate = created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {created} invoices in {elapsed:.2f}s ({rate:.1f} invoices/s).'
+        ))
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from payments import tasks
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the PDFs of pending invoices queued by generate_invoice. Runs until the '
+        'queue is empty, or keeps polling it with --loop.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new jobs instead of exiting when the queue is empty.')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Claim at most this many invoices per pass.')
+
+    def handle(self, *args, **options):
+        interval = tasks.get_config()['POLL_INTERVAL']
+        while True:
+            started = time.perf_counter()
+            ready = tasks.work(limit=options['limit'])
+            if ready or options['verbosity'] > 1:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Rendered {ready} invoices in {time.perf_counter() - started:.2f}s.'
+                ))
+            if not options['loop']:
+                return
+            time.sleep(interval)
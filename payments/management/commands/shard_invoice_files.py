@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from payments.models import Invoice
+from payments.storage import is_content_addressed
+
+
+class Command(BaseCommand):
+    help = (
+        'Move invoice PDFs stored under their old flat invoices/ names into the '
+        'content-addressed, sharded layout. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Invoices read per query.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report how many files would move without moving them.')
+
+    def handle(self, *args, **options):
+        storage = Invoice._meta.get_field('pdf_file').storage
+        invoices = Invoice.objects.exclude(pdf_file='').exclude(pdf_file__isnull=True).order_by('pk')
+        moved = missing = 0
+        last_pk = 0
+        while True:
+            batch = list(invoices.filter(pk__gt=last_pk).values_list('pk', 'pdf_file')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            for pk, name in batch:
+                if is_content_addressed(name):
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    continue
+                moved += 1
+                if options['dry_run']:
+                    continue
+                with storage.open(name) as old_file:
+                    new_name = storage.save(name, old_file)
+                # The old file goes only once no invoice points at it
+                Invoice.objects.filter(pk=pk, pdf_file=name).update(pdf_file=new_name)
+                storage.delete(name)
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} invoice files into the sharded layout.'))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} invoices point at missing files.'))
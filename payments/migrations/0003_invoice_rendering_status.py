@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:51
+
+from django.db import migrations, models
+
+
+def mark_existing(apps, schema_editor):
+    # Invoices with a PDF are ready; rows left without one by a failed
+    # render are queued to be rendered again
+    Invoice = apps.get_model('payments', 'Invoice')
+    Invoice.objects.exclude(pdf_file='').exclude(pdf_file__isnull=True).update(status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_payment_payments_created_d7f01e_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='claim_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='invoices_status_94f605_idx'),
+        ),
+        migrations.RunPython(mark_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-16 23:55
+
+from django.db import migrations, models
+import payments.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_invoice_rendering_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='pdf_file',
+            field=models.FileField(blank=True, null=True, storage=payments.storage.invoice_storage, upload_to='invoices/'),
+        ),
+    ]
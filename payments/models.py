@@ -1,5 +1,6 @@
 from django.db import models
 from decimal import Decimal
+from .storage import invoice_storage
 
 
 class Payment(models.Model):
@@ -58,6 +59,9 @@ class Payment(models.Model):
     class Meta:
         db_table = 'payments'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Payment for {self.booking.booking_number} - {self.payment_status}"
@@ -80,6 +84,12 @@ class Payment(models.Model):
 class Invoice(models.Model):
     """Invoice model."""
     
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
     invoice_number = models.CharField(max_length=50, unique=True)
     booking = models.OneToOneField(
         'bookings.Booking',
@@ -88,7 +98,13 @@ class Invoice(models.Model):
     )
     invoice_date = models.DateField(auto_now_add=True)
     due_date = models.DateField(null=True, blank=True)
-    pdf_file = models.FileField(upload_to='invoices/', null=True, blank=True)
+    pdf_file = models.FileField(upload_to='invoices/', storage=invoice_storage, null=True, blank=True)
+    
+    # PDF rendering job (see payments.tasks)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    claim_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
+    error = models.TextField(blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -96,6 +112,13 @@ class Invoice(models.Model):
     class Meta:
         db_table = 'invoices'
         ordering = ['-invoice_date']
+        indexes = [
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['invoice_date', 'id']),
+        ]
+    
+    def is_ready(self):
+        return self.status == 'ready' and bool(self.pdf_file)
     
     def __str__(self):
         return f"Invoice #{self.invoice_number}"
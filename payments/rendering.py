@@ -0,0 +1,332 @@
+"""
+Invoice PDF rendering.
+
+``render_invoice`` works on a plain dict (see ``payments.invoices.invoice_data``)
+and imports nothing from Django, so it can run in worker processes that
+never set Django up or touch the database.
+
+The invoice has a fixed layout, so instead of building a style sheet,
+table styles and a platypus story and laying them out for every invoice,
+the fast path draws the same pages straight onto the canvas from
+coordinates and colours fixed once per process. The drawing operations
+mirror those platypus emits, so for any invoice the fast path accepts the
+PDF is byte for byte the one ``render_invoice_platypus`` produces. Values
+platypus would lay out differently (multi-line text, an overlong title)
+fall back to ``render_invoice_platypus``.
+
+PDFs are rendered in ReportLab's invariant mode, without a creation date
+or random document id, so the same invoice always renders to the same bytes.
+"""
+from io import BytesIO
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+
+
+INVARIANT = 1
+
+# Fixed layout: letter page, 1 inch margins, 6pt frame padding and the
+# 6 inch wide tables centred in the 456pt frame, as platypus places them
+FRAME_X = 78.0
+FRAME_WIDTH = 456.0
+TABLE_X = 90.0
+TABLE_WIDTH = 6*inch
+LABEL_WIDTH = 2*inch
+AMOUNT_X = 4*inch
+
+# Table rows: 10pt text on 12pt leading, 3pt top and 12pt bottom padding
+ROW_HEIGHT = 27
+BASELINE = 14
+PADDING = 6
+
+BOLD = ('Helvetica-Bold', 10, 12)
+REGULAR = ('Helvetica', 10, 12)
+
+# Label/value rows of the details tables: (label style, value style)
+PLAIN_ROW = ((BOLD, colors.black), (REGULAR, colors.black))
+SHADED_ROW = ((BOLD, colors.whitesmoke), (REGULAR, colors.black))
+
+
+def render_invoice_platypus(data):
+    """PDF bytes of one invoice, laid out by platypus."""
+    invoice_data, customer_data, package_data, pricing_data = table_rows(data)
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, invariant=INVARIANT)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Title
+    title = Paragraph(f"<b>INVOICE #{data['invoice_number']}</b>", styles['Title'])
+    elements.append(title)
+    elements.append(Spacer(1, 0.2*inch))
+
+    # Invoice details
+    invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
+    invoice_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(invoice_table)
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Customer details
+    customer_title = Paragraph("<b>Customer Details</b>", styles['Heading2'])
+    elements.append(customer_title)
+
+    customer_table = Table(customer_data, colWidths=[2*inch, 4*inch])
+    customer_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(customer_table)
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Package details
+    package_title = Paragraph("<b>Package Details</b>", styles['Heading2'])
+    elements.append(package_title)
+
+    package_table = Table(package_data, colWidths=[2*inch, 4*inch])
+    package_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(package_table)
+    elements.append(Spacer(1, 0.3*inch))
+
+    # Pricing details
+    pricing_title = Paragraph("<b>Pricing Details</b>", styles['Heading2'])
+    elements.append(pricing_title)
+
+    pricing_table = Table(pricing_data, colWidths=[4*inch, 2*inch])
+    pricing_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(pricing_table)
+
+    # Build PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def fast_path_rows(data):
+    """
+    Cell text of the invoice's tables if the fast path can draw it exactly
+    as platypus lays it out, else None.
+    """
+    if not str(data['invoice_number']).isalnum():
+        return None
+    if stringWidth(f"INVOICE #{data['invoice_number']}", 'Helvetica-Bold', 18) > FRAME_WIDTH:
+        return None
+    rows = table_rows(data)
+    if any('\n' in text for table in rows for row in table for text in row):
+        return None
+    return rows
+
+
+def _spacer(canvas, y):
+    # platypus leaves an empty translated group for every spacer
+    canvas.saveState()
+    canvas.translate(FRAME_X, y)
+    canvas.restoreState()
+
+
+def _heading(canvas, y, text, size, leading, offset=0):
+    canvas.saveState()
+    canvas.translate(FRAME_X, y)
+    canvas.saveState()
+    canvas.setFillColor(colors.black)
+    text_object = canvas.beginText(0, leading - size)
+    text_object.setFont('Helvetica-Bold', size, leading)
+    if offset:
+        text_object.moveCursor(offset, 0)
+    text_object.textLine(text)
+    if offset:
+        text_object.moveCursor(-offset, 0)
+    canvas.drawText(text_object)
+    canvas.restoreState()
+    canvas.restoreState()
+
+
+def _table(canvas, y, rows, styles, backgrounds, grid, right_x=None):
+    """
+    Draw one table (or the part of one on a page) with its bottom left
+    corner at ``(TABLE_X, y)``. ``styles`` holds a ``((font, colour),
+    (font, colour))`` pair per row; ``right_x``, if given, right-aligns the
+    second column at that x.
+    """
+    height = len(rows) * ROW_HEIGHT
+    canvas.saveState()
+    canvas.translate(TABLE_X, y)
+    canvas.saveState()
+    for colour, rect in backgrounds:
+        canvas.setFillColor(colour)
+        canvas.rect(*rect, stroke=0, fill=1)
+
+    current_colour = current_font = None
+    for number, (row, row_styles) in enumerate(zip(rows, styles)):
+        baseline = height - (number + 1) * ROW_HEIGHT + BASELINE
+        for column, (text, (font, colour)) in enumerate(zip(row, row_styles)):
+            if colour != current_colour:
+                canvas.setFillColor(colour)
+                current_colour = colour
+            if font != current_font:
+                canvas.setFont(*font)
+                current_font = font
+            if column == 0:
+                canvas.drawString(PADDING, baseline, text)
+            elif right_x is not None:
+                canvas.drawRightString(right_x, baseline, text)
+            else:
+                canvas.drawString(LABEL_WIDTH + PADDING, baseline, text)
+
+    canvas.saveState()
+    canvas.setLineCap(1)
+    canvas.setLineJoin(1)
+    canvas.setStrokeColor(colors.black)
+    canvas.setLineWidth(1)
+    for line in grid:
+        canvas.line(*line)
+    canvas.restoreState()
+    canvas.restoreState()
+    canvas.restoreState()
+
+
+def _grid(rows, column_x, order):
+    """
+    GRID lines of a ``rows`` high table in the order platypus draws them:
+    the outline edges named by ``order`` (top, bottom, left, right), the
+    inner rows from the top, then the column divider.
+    """
+    height = rows * ROW_HEIGHT
+    edges = {
+        'top': (0, height, TABLE_WIDTH, height),
+        'bottom': (0, 0, TABLE_WIDTH, 0),
+        'left': (0, 0, 0, height),
+        'right': (TABLE_WIDTH, 0, TABLE_WIDTH, height),
+    }
+    return (
+        [edges[edge] for edge in order] +
+        [(0, y, TABLE_WIDTH, y) for y in range(height - ROW_HEIGHT, 0, -ROW_HEIGHT)] +
+        [(column_x, 0, column_x, height)]
+    )
+
+
+# Grid lines of every table, fixed once per process
+DETAILS_GRID = _grid(3, LABEL_WIDTH, ('top', 'bottom', 'left', 'right'))
+PARTY_GRID = _grid(4, LABEL_WIDTH, ('top', 'bottom', 'left', 'right'))
+# The pricing table is split after its fourth row onto the second page
+PRICING_GRID = _grid(4, AMOUNT_X, ('top', 'left', 'right', 'bottom'))
+TOTALS_GRID = _grid(2, AMOUNT_X, ('left', 'right', 'bottom', 'top'))
+
+DETAILS_BACKGROUNDS = [
+    (colors.grey, (0, 3 * ROW_HEIGHT, LABEL_WIDTH, -3 * ROW_HEIGHT)),
+    (colors.beige, (LABEL_WIDTH, 3 * ROW_HEIGHT, TABLE_WIDTH - LABEL_WIDTH, -3 * ROW_HEIGHT)),
+]
+PRICING_BACKGROUNDS = [(colors.grey, (0, 4 * ROW_HEIGHT, TABLE_WIDTH, -ROW_HEIGHT))]
+TOTALS_BACKGROUNDS = [(colors.lightgrey, (0, ROW_HEIGHT, TABLE_WIDTH, -ROW_HEIGHT))]
+
+PRICING_STYLES = [((BOLD, colors.whitesmoke), (BOLD, colors.whitesmoke))] + [
+    ((REGULAR, colors.black), (REGULAR, colors.black))
+] * 3
+TOTALS_STYLES = [((REGULAR, colors.black), (REGULAR, colors.black))] * 2
+
+
+def render_invoice_fast(data, rows):
+    """PDF bytes of one invoice drawn straight onto the canvas; see the module docstring."""
+    details, customer, package, pricing = rows
+    buffer = BytesIO()
+    canvas = Canvas(buffer, pagesize=letter, invariant=INVARIANT)
+    canvas.setAuthor(None)
+    canvas.setTitle(None)
+    canvas.setSubject(None)
+    canvas.setCreator(None)
+    canvas.setProducer(None)
+    canvas.setKeywords([])
+
+    title = f"INVOICE #{data['invoice_number']}"
+    offset = (FRAME_WIDTH - stringWidth(title, 'Helvetica-Bold', 18)) / 2
+    _heading(canvas, 692, title, 18, 22, offset)
+    _spacer(canvas, 671.6)
+    _table(canvas, 590.6, details, [SHADED_ROW] * 3, DETAILS_BACKGROUNDS, DETAILS_GRID)
+    _spacer(canvas, 569.0)
+    _heading(canvas, 539.0, 'Customer Details', 14, 18)
+    _table(canvas, 425.0, customer, [PLAIN_ROW] * 4, [], PARTY_GRID)
+    _spacer(canvas, 403.4)
+    _heading(canvas, 373.4, 'Package Details', 14, 18)
+    _table(canvas, 259.4, package, [PLAIN_ROW] * 4, [], PARTY_GRID)
+    _spacer(canvas, 237.8)
+    _heading(canvas, 207.8, 'Pricing Details', 14, 18)
+    _table(canvas, 93.8, pricing[:4], PRICING_STYLES, PRICING_BACKGROUNDS, PRICING_GRID,
+           right_x=TABLE_WIDTH - PADDING)
+    canvas.setPageRotation(0)
+    canvas.showPage()
+
+    _table(canvas, 660.0, pricing[4:], TOTALS_STYLES, TOTALS_BACKGROUNDS, TOTALS_GRID,
+           right_x=TABLE_WIDTH - PADDING)
+    canvas.setPageRotation(0)
+    canvas.showPage()
+    canvas.save()
+    return buffer.getvalue()
+
+
+def table_rows(data):
+    """Cell text of the details, customer, package and pricing tables."""
+    return (
+        [
+            ['Invoice Date:', data['invoice_date'].strftime('%Y-%m-%d')],
+            ['Booking Number:', data['booking_number']],
+            ['Travel Date:', data['travel_date'].strftime('%Y-%m-%d')],
+        ],
+        [
+            ['Name:', data['customer_name']],
+            ['Email:', data['customer_email']],
+            ['Phone:', data['customer_phone']],
+            ['Address:', data['customer_address'] or 'N/A'],
+        ],
+        [
+            ['Package:', data['package_name']],
+            ['Destination:', data['destination']],
+            ['Duration:', f"{data['duration_days']} days"],
+            ['Travelers:', str(data['number_of_travelers'])],
+        ],
+        [
+            ['Description', 'Amount'],
+            ['Package Price', f"₹{data['package_price']:.2f}"],
+            ['Discount', f"-₹{data['discount_amount']:.2f}"],
+            ['Subtotal', f"₹{data['subtotal']:.2f}"],
+            [f"GST ({data['tax_percentage']}%)", f"₹{data['tax_amount']:.2f}"],
+            ['<b>TOTAL</b>', f"<b>₹{data['total_amount']:.2f}</b>"],
+        ],
+    )
+
+
+def render_invoice(data):
+    """PDF bytes of one invoice, by the fast path when the layout allows."""
+    rows = fast_path_rows(data)
+    if rows is None:
+        return render_invoice_platypus(data)
+    return render_invoice_fast(data, rows)
@@ -0,0 +1,201 @@
+"""
+Invoice PDF storage and serving.
+
+``InvoiceStorage`` files every PDF under the SHA-256 of its content,
+sharded two directory levels deep by the leading hex digits of the hash
+(``invoices/3f/a2/3fa2...pdf``), so no directory grows large however many
+invoices exist. Saving content that is already stored returns the existing
+name without writing it again, so identical renders (a retried job, a
+rerun batch) share one file; because files may be shared, nothing here
+deletes them. A file is written under a temporary name and renamed into
+place, so its final name never points at a partial file.
+
+``file_response`` answers a request for a stored file. With
+``settings.INVOICE_STORAGE['SENDFILE']`` set, the body is left to the
+front-end server through ``X-Sendfile`` or ``X-Accel-Redirect``;
+otherwise it is streamed from here, honouring a single byte range.
+Either way conditional requests are answered from the content hash and
+modification time, and responses may be cached privately for a long time.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+
+DEFAULTS = {
+    'ROOT': None,  # default: MEDIA_ROOT
+    'SENDFILE': None,  # 'x-sendfile' (Apache, lighttpd) or 'x-accel-redirect' (nginx)
+    'ACCEL_PREFIX': '/protected/',  # internal nginx location aliasing ROOT
+    'CACHE_MAX_AGE': 365 * 24 * 60 * 60,  # seconds
+}
+
+# Directory levels, and hex digits of the hash per level
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'INVOICE_STORAGE', {}))
+    return config
+
+
+class InvoiceStorage(FileSystemStorage):
+    """Content-addressed, sharded file system storage."""
+
+    def content_name(self, name, digest):
+        """Where content with this digest is stored, in the directory and with the extension of ``name``."""
+        shards = [digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH] for level in range(SHARD_DEPTH)]
+        parts = shards + [digest + os.path.splitext(name)[1]]
+        directory = os.path.dirname(name)
+        if directory:
+            parts.insert(0, directory)
+        return '/'.join(parts)
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = self.content_name(name, digest.hexdigest())
+        if not self.exists(name):
+            self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.', suffix='.part')
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                for chunk in content.chunks():
+                    output.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            # Two writers of the same content replace each other with identical bytes
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+def invoice_storage():
+    """The storage of ``Invoice.pdf_file``; a callable, so migrations do not freeze its settings."""
+    return InvoiceStorage(location=get_config()['ROOT'])
+
+
+def is_content_addressed(name):
+    return bool(DIGEST_RE.match(os.path.splitext(os.path.basename(name))[0]))
+
+
+def _etag(name, stat):
+    if is_content_addressed(name):
+        return quote_etag(os.path.splitext(os.path.basename(name))[0])
+    return quote_etag(f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+
+
+def _byte_range(request, size, etag, last_modified):
+    """
+    ``(first, last)`` byte of the requested range, False if it cannot be
+    satisfied, or None to send the whole file (no range, a stale
+    ``If-Range``, or several or malformed ranges).
+    """
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range not in (etag, http_date(last_modified)):
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if first:
+        first = int(first)
+        if last and int(last) < first:
+            return None
+        last = min(int(last), size - 1) if last else size - 1
+    else:
+        if not int(last):
+            return False
+        first, last = max(size - int(last), 0), size - 1
+    if first >= size:
+        return False
+    return first, last
+
+
+def _read(path, offset, length):
+    with open(path, 'rb') as source:
+        source.seek(offset)
+        while length > 0:
+            chunk = source.read(min(FileResponse.block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile(config, file, filename, content_type):
+    response = HttpResponse(content_type=content_type)
+    if config['SENDFILE'] == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(config['ACCEL_PREFIX'].rstrip('/') + '/' + file.name)
+    elif config['SENDFILE'] == 'x-sendfile':
+        response['X-Sendfile'] = file.path
+    else:
+        raise ImproperlyConfigured(
+            "INVOICE_STORAGE['SENDFILE'] must be None, 'x-sendfile' or 'x-accel-redirect'."
+        )
+    response['Content-Disposition'] = content_disposition_header(False, filename)
+    return response
+
+
+def file_response(request, file, filename, content_type='application/pdf'):
+    """Serve a stored ``FieldFile`` inline as ``filename``; 404 if the file is gone."""
+    config = get_config()
+    try:
+        stat = os.stat(file.path)
+    except FileNotFoundError:
+        raise Http404('Invoice file not found.')
+    etag, last_modified = _etag(file.name, stat), int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and config['SENDFILE']:
+        response = _sendfile(config, file, filename, content_type)
+    elif response is None:
+        byte_range = _byte_range(request, stat.st_size, etag, last_modified)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range is None:
+            response = FileResponse(open(file.path, 'rb'), content_type=content_type, filename=filename)
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                _read(file.path, first, last - first + 1), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {first}-{last}/{stat.st_size}'
+            response['Content-Length'] = last - first + 1
+            response['Content-Disposition'] = content_disposition_header(False, filename)
+        response['Accept-Ranges'] = 'bytes'
+
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Only for the signed-in user's browser, never a shared cache
+        patch_cache_control(response, private=True, max_age=config['CACHE_MAX_AGE'])
+    return response
@@ -0,0 +1,215 @@
+"""
+Database-backed invoice rendering queue.
+
+``generate_invoice`` no longer renders in the request. It creates the
+``Invoice`` row with status ``pending`` and returns; the row itself is the
+job. A worker claims pending invoices with a lease (``claim_expires_at``,
+as in ``bookings.queue``), renders the PDF, writes the file and only then
+marks the invoice ``ready``, so no invoice is ever shown as available
+without its PDF.
+
+A render that fails is retried after a growing ``RETRY_DELAY``, up to
+``MAX_ATTEMPTS`` times in all, before the invoice is marked ``failed``;
+requesting it again re-queues it. A worker that dies mid-render simply
+lets its lease expire and the job is picked up again, so every pending invoice is eventually rendered or failed.
+
+Each web process runs one worker thread, woken when a job is enqueued and
+otherwise polling every ``POLL_INTERVAL`` seconds for leases left behind by
+other processes. ``manage.py process_invoices`` drains the queue from a
+separate process. With ``settings.INVOICE_QUEUE['BACKGROUND']`` False jobs
+are rendered synchronously after the enqueueing transaction commits
+(e.g. for tests against an in-memory database).
+"""
+import logging
+import os
+import threading
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from bookings import audit
+from . import invoices
+from .models import Invoice
+from .rendering import render_invoice
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKGROUND': True,
+    'LEASE_SECONDS': 120,  # how long a worker may take to render one invoice
+    'MAX_ATTEMPTS': 3,  # renders tried before an invoice is marked failed
+    'RETRY_DELAY': 60,  # seconds before a failed render is retried, times the attempts so far
+    'POLL_INTERVAL': 30.0,  # seconds an idle worker thread waits between checks
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'INVOICE_QUEUE', {}))
+    return config
+
+
+def _claimable(now):
+    return Q(status='pending') & (Q(claim_expires_at__isnull=True) | Q(claim_expires_at__lte=now))
+
+
+def claim_next(config=None):
+    """
+    Claim the oldest pending invoice whose job is not leased. Returns the
+    invoice with its booking and package, or None when there is none.
+    """
+    config = config or get_config()
+    while True:
+        now = timezone.now()
+        pk = Invoice.objects.filter(_claimable(now)).order_by('created_at', 'id').values_list(
+            'pk', flat=True
+        ).first()
+        if pk is None:
+            return None
+        lease = now + timedelta(seconds=config['LEASE_SECONDS'])
+        # Guarded so that of two workers racing for it only one wins
+        if Invoice.objects.filter(_claimable(now), pk=pk).update(
+            claim_expires_at=lease, attempts=F('attempts') + 1
+        ):
+            return Invoice.objects.select_related('booking__package').get(pk=pk)
+
+
+def process(invoice, config=None):
+    """Render a claimed invoice and record the outcome. Returns True once it is ready."""
+    config = config or get_config()
+    # Only the holder of this lease may record the outcome
+    mine = Invoice.objects.filter(pk=invoice.pk, status='pending', claim_expires_at=invoice.claim_expires_at)
+    try:
+        pdf = render_invoice(invoices.invoice_data(invoice.booking, invoice.invoice_number, invoice.invoice_date))
+        name = invoices.save_file(invoice.invoice_number, pdf)
+    except Exception as error:
+        logger.exception('Rendering invoice %s failed (attempt %d)', invoice.invoice_number, invoice.attempts)
+        if invoice.attempts >= config['MAX_ATTEMPTS']:
+            status, retry_at = 'failed', None
+        else:
+            # Left leased until the retry is due
+            status, retry_at = 'pending', timezone.now() + timedelta(
+                seconds=config['RETRY_DELAY'] * invoice.attempts
+            )
+        mine.update(
+            status=status,
+            claim_expires_at=retry_at,
+            error=f'{type(error).__name__}: {error}',
+            updated_at=timezone.now(),
+        )
+        return False
+
+    return bool(mine.update(
+        status='ready', pdf_file=name, claim_expires_at=None, error='', updated_at=timezone.now()
+    ))
+
+
+def work(limit=None):
+    """Render pending invoices until none is left (or ``limit`` were claimed). Returns the number made ready."""
+    config = get_config()
+    ready = claimed = 0
+    while limit is None or claimed < limit:
+        invoice = claim_next(config)
+        if invoice is None:
+            break
+        claimed += 1
+        ready += process(invoice, config)
+    return ready
+
+
+class Worker:
+    """The invoice rendering thread of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, daemon=True, name='invoice-worker')
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(get_config()['POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                close_old_connections()
+                work()
+            except Exception:
+                logger.exception('Invoice worker failed; retrying on the next wake-up')
+            finally:
+                close_old_connections()
+
+
+worker = Worker()
+
+
+def _start():
+    if get_config()['BACKGROUND']:
+        worker.wake()
+    else:
+        work()
+
+
+def enqueue(invoice):
+    """Queue the invoice's PDF for rendering once the current transaction commits."""
+    transaction.on_commit(_start)
+
+
+def enqueue_unrendered(invoices):
+    """
+    Queue every invoice of ``invoices`` without a PDF, failed ones with
+    fresh attempts. Returns the number queued.
+    """
+    invoices.filter(status='failed').update(
+        status='pending', attempts=0, error='', claim_expires_at=None, updated_at=timezone.now()
+    )
+    queued = invoices.filter(status='pending').count()
+    if queued:
+        transaction.on_commit(_start)
+    return queued
+
+
+def enqueue_uninvoiced(bookings, user=None, batch_size=invoices.BATCH_SIZE):
+    """
+    Create a pending invoice for every approved booking of ``bookings``
+    without one and queue them for rendering. Bookings are locked and
+    inserted in batches as in ``invoices.generate``, so a concurrent run or
+    ``generate_invoice`` never invoices a booking twice. Returns the number
+    of invoices created.
+    """
+    pending = invoices.uninvoiced(bookings).order_by('pk')
+    created, last_pk = 0, 0
+    while True:
+        batch = list(pending.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        invoice_date = date.today()
+        with transaction.atomic():
+            inserted = invoices._insert(batch, [
+                Invoice(invoice_number=invoices.invoice_number(booking, invoice_date), booking=booking)
+                for booking in batch
+            ])
+            audit.record([
+                audit.entry('Invoice', pk, 'create', user, {'invoice_number': number}, notes='Queued in batch')
+                for pk, number in inserted
+            ])
+        created += len(inserted)
+    if created:
+        transaction.on_commit(_start)
+    return created
+
+
+def status(invoice_id):
+    """``(status, error)`` of an invoice, from one narrow query; None if it does not exist."""
+    return Invoice.objects.filter(pk=invoice_id).values_list('status', 'error').first()
@@ -0,0 +1,327 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date, timedelta
+from io import BytesIO
+from decimal import Decimal
+from unittest import mock
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from bookings.models import AuditLog
+from bookings.tests import BookingTestCase
+from . import exports, invoices, rendering, tasks
+from .models import Invoice
+
+
+TESTDATA = os.path.join(os.path.dirname(__file__), 'testdata')
+
+# Set to rewrite the golden files after an intended change to the layout
+UPDATE_GOLDEN = os.environ.get('UPDATE_INVOICE_GOLDEN') == '1'
+
+INVOICE = {
+    'invoice_number': 'INV20240115000042',
+    'invoice_date': date(2024, 1, 15),
+    'booking_number': 'BK000042',
+    'travel_date': date(2024, 3, 1),
+    'customer_name': 'Asha Rao',
+    'customer_email': 'asha.rao@example.com',
+    'customer_phone': '9876543210',
+    'customer_address': '12 MG Road, Bengaluru',
+    'package_name': 'Kerala Backwaters',
+    'destination': 'Kerala',
+    'duration_days': 5,
+    'number_of_travelers': 2,
+    'package_price': Decimal('24691.34'),
+    'discount_amount': Decimal('1234.57'),
+    'subtotal': Decimal('23456.77'),
+    'tax_percentage': Decimal('5.00'),
+    'tax_amount': Decimal('1172.84'),
+    'total_amount': Decimal('24629.61'),
+}
+
+
+class InvoiceRenderingGoldenTests(SimpleTestCase):
+    """Invoices render byte for byte like the checked-in golden PDFs."""
+
+    def assert_golden(self, pdf, name):
+        path = os.path.join(TESTDATA, name)
+        if UPDATE_GOLDEN:
+            with open(path, 'wb') as golden:
+                golden.write(pdf)
+        with open(path, 'rb') as golden:
+            self.assertEqual(pdf, golden.read(), f'{name} changed; see UPDATE_INVOICE_GOLDEN')
+
+    def test_fast_path_matches_golden(self):
+        self.assertIsNotNone(rendering.fast_path_rows(INVOICE))
+        self.assert_golden(rendering.render_invoice(INVOICE), 'invoice.pdf')
+
+    def test_platypus_matches_golden(self):
+        self.assert_golden(rendering.render_invoice_platypus(INVOICE), 'invoice.pdf')
+
+    def test_fallback_matches_golden(self):
+        data = dict(INVOICE, customer_address='12 MG Road\nIndiranagar\nBengaluru 560038')
+        self.assertIsNone(rendering.fast_path_rows(data))
+        self.assert_golden(rendering.render_invoice(data), 'invoice_multiline_address.pdf')
+
+
+class InvoiceFilesTestCase(BookingTestCase):
+    """Writes invoice files to a temporary media root and audit entries synchronously."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, AUDIT_LOG={'BACKGROUND': False})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def approved_bookings(self, count):
+        return [
+            self.make_booking(f'BK{number:06d}', f'Customer {number}', status='approved')
+            for number in range(1, count + 1)
+        ]
+
+
+class BatchGenerationTests(InvoiceFilesTestCase):
+
+    def audited(self):
+        return AuditLog.objects.filter(model_name='Invoice', action='create').count()
+
+    def test_invoices_every_approved_booking_once(self):
+        self.approved_bookings(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            created, _ = invoices.generate(workers=1, batch_size=2)
+        self.assertEqual(created, 5)
+        self.assertEqual(Invoice.objects.filter(status='ready').count(), 5)
+        self.assertEqual(self.audited(), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created, _ = invoices.generate(workers=1)
+        self.assertEqual(created, 0)
+        self.assertEqual(self.audited(), 5)
+
+    def test_invoice_created_meanwhile_is_not_counted(self):
+        bookings = self.approved_bookings(3)
+        save_file = invoices.save_file
+
+        def save_file_and_race(number, pdf):
+            # generate_invoice queues the same booking (and number) mid-batch
+            if not Invoice.objects.filter(booking=bookings[1]).exists():
+                Invoice.objects.create(booking=bookings[1], invoice_number=invoices.invoice_number(bookings[1]))
+            return save_file(number, pdf)
+
+        with mock.patch.object(invoices, 'save_file', save_file_and_race), \
+                self.captureOnCommitCallbacks(execute=True):
+            created, _ = invoices.generate(workers=1)
+        self.assertEqual(created, 2)
+        self.assertEqual(self.audited(), 2)
+        self.assertEqual(Invoice.objects.get(booking=bookings[1]).status, 'pending')
+
+
+@override_settings(INVOICE_QUEUE={'BACKGROUND': False, 'MAX_ATTEMPTS': 3, 'RETRY_DELAY': 60})
+class InvoiceQueueTests(InvoiceFilesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        booking = self.approved_bookings(1)[0]
+        self.invoice = Invoice.objects.create(booking=booking, invoice_number=invoices.invoice_number(booking))
+
+    def refresh(self):
+        self.invoice.refresh_from_db()
+        return self.invoice
+
+    def retry_now(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_pending_invoice_is_rendered_and_ready(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.enqueue(self.invoice)
+
+        invoice = self.refresh()
+        self.assertEqual((invoice.status, invoice.attempts, invoice.claim_expires_at), ('ready', 1, None))
+        self.assertTrue(invoice.pdf_file.storage.exists(invoice.pdf_file.name))
+        self.assertEqual(tasks.status(invoice.pk), ('ready', ''))
+
+    def test_failed_render_is_retried_then_marked_failed(self):
+        with mock.patch.object(tasks, 'render_invoice', side_effect=ValueError('no font')), \
+                self.assertLogs('payments.tasks', 'ERROR') as logs:
+            self.assertEqual(tasks.work(), 0)
+            invoice = self.refresh()
+            self.assertEqual((invoice.status, invoice.attempts), ('pending', 1))
+            # Leased until the retry is due
+            self.assertGreater(invoice.claim_expires_at, timezone.now() + timedelta(seconds=50))
+            self.assertIsNone(tasks.claim_next())
+
+            self.retry_now()
+            tasks.work()
+            invoice = self.refresh()
+            self.assertEqual((invoice.status, invoice.attempts), ('pending', 2))
+            self.assertGreater(invoice.claim_expires_at, timezone.now() + timedelta(seconds=110))
+
+            self.retry_now()
+            tasks.work()
+        self.assertEqual(len(logs.records), 3)
+        invoice = self.refresh()
+        self.assertEqual((invoice.status, invoice.attempts, invoice.claim_expires_at), ('failed', 3, None))
+        self.assertEqual(tasks.status(invoice.pk), ('failed', 'ValueError: no font'))
+        self.assertIsNone(tasks.claim_next())
+
+    def test_failed_invoice_requeued_with_fresh_attempts(self):
+        Invoice.objects.filter(pk=self.invoice.pk).update(status='failed', attempts=3, error='ValueError: no font')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            queued = tasks.enqueue_unrendered(Invoice.objects.all())
+
+        self.assertEqual(queued, 1)
+        invoice = self.refresh()
+        self.assertEqual((invoice.status, invoice.attempts, invoice.error), ('ready', 1, ''))
+
+    def test_only_the_lease_holder_records_the_outcome(self):
+        stale = tasks.claim_next()
+        # The first worker overran its lease and another one took the job
+        self.retry_now()
+        current = tasks.claim_next()
+        self.assertEqual(current.attempts, 2)
+
+        self.assertFalse(tasks.process(stale))
+        self.assertEqual(self.refresh().status, 'pending')
+        self.assertTrue(tasks.process(current))
+        self.assertEqual(self.refresh().status, 'ready')
+
+
+
+class AdminInvoiceActionTests(InvoiceFilesTestCase):
+
+    def generate(self, bookings):
+        self.client.force_login(User.objects.create_superuser('root', password='x'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:bookings_booking_changelist'), {
+                'action': 'generate_invoices', '_selected_action': [booking.pk for booking in bookings],
+            }, follow=True)
+        self.assertContains(response, f'Queued {len(bookings)} invoices')
+
+    def test_action_queues_invoices_without_rendering(self):
+        bookings = self.approved_bookings(3)
+
+        with mock.patch.object(tasks.worker, 'wake') as wake, \
+                mock.patch.object(tasks, 'render_invoice') as render:
+            self.generate(bookings)
+
+        wake.assert_called_once_with()
+        render.assert_not_called()
+        self.assertEqual(Invoice.objects.filter(status='pending').count(), 3)
+        self.assertEqual(AuditLog.objects.filter(model_name='Invoice', action='create').count(), 3)
+
+    @override_settings(INVOICE_QUEUE={'BACKGROUND': False})
+    def test_queued_invoices_are_rendered_by_the_worker(self):
+        self.generate(self.approved_bookings(2))
+
+        self.assertEqual(Invoice.objects.filter(status='ready').count(), 2)
+
+
+class InvoiceStorageTests(InvoiceFilesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.agent)
+        self.pdf = b'%PDF-1.4 ' + bytes(range(256)) * 8
+
+    def ready_invoice(self):
+        booking = self.approved_bookings(1)[0]
+        number = invoices.invoice_number(booking)
+        return Invoice.objects.create(
+            booking=booking, invoice_number=number, status='ready', pdf_file=invoices.save_file(number, self.pdf)
+        )
+
+    def get(self, invoice, **headers):
+        return self.client.get(reverse('payments:view_invoice', args=[invoice.pk]), headers=headers)
+
+    def test_identical_content_is_stored_once(self):
+        first = invoices.save_file('INV-1', self.pdf)
+        second = invoices.save_file('INV-2', self.pdf)
+        other = invoices.save_file('INV-3', self.pdf + b'\n')
+
+        digest = hashlib.sha256(self.pdf).hexdigest()
+        self.assertEqual(first, f'invoices/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        self.assertEqual(second, first)
+        self.assertNotEqual(other, first)
+        storage = Invoice._meta.get_field('pdf_file').storage
+        self.assertEqual(storage.listdir(os.path.dirname(first))[1], [os.path.basename(first)])
+        with storage.open(first) as stored:
+            self.assertEqual(stored.read(), self.pdf)
+
+    def test_serves_the_file_with_validators(self):
+        invoice = self.ready_invoice()
+
+        response = self.get(invoice)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.pdf)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.pdf).hexdigest()}"')
+        self.assertIn('private', response['Cache-Control'])
+
+        self.assertEqual(self.get(invoice, if_none_match=response['ETag']).status_code, 304)
+
+    def test_byte_ranges(self):
+        invoice = self.ready_invoice()
+
+        response = self.get(invoice, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.pdf[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.pdf)}')
+
+        response = self.get(invoice, range='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.pdf[-5:])
+
+        response = self.get(invoice, range=f'bytes={len(self.pdf)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_missing_file_is_not_found(self):
+        invoice = self.ready_invoice()
+        os.remove(invoice.pdf_file.path)
+
+        self.assertEqual(self.get(invoice).status_code, 404)
+
+
+class ZipExportTests(InvoiceFilesTestCase):
+
+    def test_archive_holds_every_ready_pdf_and_lists_the_missing(self):
+        bookings = self.approved_bookings(3)
+        pdfs = {}
+        for index, booking in enumerate(bookings[:2]):
+            number = invoices.invoice_number(booking)
+            pdfs[invoices.file_name(number)] = pdf = b'%PDF-1.4 ' + bytes([index]) * 5000
+            Invoice.objects.create(
+                booking=booking, invoice_number=number, status='ready', pdf_file=invoices.save_file(number, pdf)
+            )
+        pending = Invoice.objects.create(booking=bookings[2], invoice_number=invoices.invoice_number(bookings[2]))
+
+        data = b''.join(exports.stream_zip(Invoice.objects.all()))
+
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), list(pdfs) + [exports.MISSING_NAME])
+            for name, pdf in pdfs.items():
+                self.assertEqual(archive.read(name), pdf)
+            self.assertEqual(archive.read(exports.MISSING_NAME).decode(), f'{pending.invoice_number}\tPending\n')
+            # Stored entries with data descriptors are rejected by some unzip tools
+            self.assertEqual({entry.compress_type for entry in archive.infolist()}, {zipfile.ZIP_DEFLATED})
+            self.assertEqual(archive.getinfo(next(iter(pdfs))).date_time[:3], date.today().timetuple()[:3])
+
+    def test_unrendered_pdfs_are_queued_not_waited_for(self):
+        booking = self.approved_bookings(1)[0]
+        invoice = Invoice.objects.create(
+            booking=booking, invoice_number=invoices.invoice_number(booking), status='failed', attempts=3
+        )
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            data = b''.join(exports.stream_zip(Invoice.objects.all()))
+
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            self.assertEqual(archive.namelist(), [exports.MISSING_NAME])
+            self.assertEqual(archive.read(exports.MISSING_NAME).decode(), f'{invoice.invoice_number}\tPending\n')
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.status, invoice.attempts), ('pending', 0))
+        self.assertEqual(len(callbacks), 1)
@@ -9,6 +9,8 @@ urlpatterns = [
     path('bookings/<int:booking_id>/payment/create/', views.payment_create, name='create'),
     path('payments/<int:pk>/update/', views.payment_update, name='update'),
     path('bookings/<int:booking_id>/invoice/', views.generate_invoice, name='generate_invoice'),
+    path('invoices/export/', views.export_invoices, name='export_invoices'),
     path('invoices/<int:pk>/', views.view_invoice, name='view_invoice'),
+    path('invoices/<int:pk>/status/', views.invoice_status, name='invoice_status'),
 ]
 
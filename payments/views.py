@@ -1,32 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.cache import never_cache
 from django.utils import timezone
-from django.db.models import Q
+from django.db import transaction
 from datetime import datetime
 from .models import Payment, Invoice
-from .forms import PaymentForm
-from bookings.models import Booking, AuditLog
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-import os
-
-
-def create_audit_log(model_name, object_id, action, user, changes=None, notes='', ip_address=None):
-    """Helper function to create audit logs."""
-    AuditLog.objects.create(
-        model_name=model_name,
-        object_id=object_id,
-        action=action,
-        user=user,
-        changes=changes or {},
-        notes=notes,
-        ip_address=ip_address
-    )
+from .forms import InvoiceExportForm, PaymentForm
+from . import exports, tasks
+from .invoices import file_name, invoice_number
+from .storage import file_response
+from bookings.models import Booking
+from bookings.pagination import paginate
+from bookings import audit, search as search_index
+from accounts.decorators import accountant_required
 
 
 @login_required
@@ -39,22 +28,16 @@ def payment_list(request):
     if status:
         payments = payments.filter(payment_status=status)
     
-    # Search
+    # Search (ranked matches from the search index, best first)
     search = request.GET.get('search')
     if search:
-        payments = payments.filter(
-            Q(booking__booking_number__icontains=search) |
-            Q(transaction_id__icontains=search) |
-            Q(booking__customer_name__icontains=search)
-        )
-    
-    from django.core.paginator import Paginator
-    paginator = Paginator(payments, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        page_obj, query_string = search_index.paginate(request, 'payment', search, payments, 20)
+    else:
+        page_obj, query_string = paginate(request, payments, 20)
     
     return render(request, 'payments/list.html', {
         'page_obj': page_obj,
+        'query_string': query_string,
         'status': status,
         'search': search
     })
@@ -85,7 +68,7 @@ def payment_create(request, booking_id):
             payment.update_status()
             
             # Create audit log
-            create_audit_log(
+            audit.log(
                 'Payment',
                 payment.id,
                 'create',
@@ -118,7 +101,7 @@ def payment_update(request, pk):
             payment.update_status()
             
             # Create audit log
-            create_audit_log(
+            audit.log(
                 'Payment',
                 payment.id,
                 'update',
@@ -148,152 +131,62 @@ def payment_detail(request, pk):
 
 @login_required
 def generate_invoice(request, booking_id):
-    """Generate invoice PDF for a booking."""
+    """Queue the invoice PDF of a booking for rendering."""
     booking = get_object_or_404(Booking, pk=booking_id)
     
     # Check if invoice already exists
-    if hasattr(booking, 'invoice'):
-        invoice = booking.invoice
-        if invoice.pdf_file:
+    invoice = Invoice.objects.filter(booking=booking).first()
+    if invoice is not None:
+        if invoice.is_ready():
             messages.info(request, 'Invoice already generated.')
             return redirect('payments:view_invoice', pk=invoice.pk)
+        if invoice.status == 'failed':
+            # Try again from scratch
+            Invoice.objects.filter(pk=invoice.pk, status='failed').update(
+                status='pending', attempts=0, error='', updated_at=timezone.now()
+            )
+            tasks.enqueue(invoice)
+        messages.info(request, 'The invoice is being generated.')
+        return redirect('bookings:detail', pk=booking.pk)
+    
+    # Create invoice; the PDF is rendered by the invoice worker. The booking
+    # is locked as in batch generation, so only one of them creates it
+    with transaction.atomic():
+        list(Booking.objects.select_for_update().filter(pk=booking.pk).values_list('pk', flat=True))
+        invoice, created = Invoice.objects.get_or_create(
+            booking=booking,
+            defaults={'invoice_number': invoice_number(booking)}
+        )
+        if created:
+            tasks.enqueue(invoice)
+            
+            # Create audit log
+            audit.log(
+                'Invoice',
+                invoice.id,
+                'create',
+                request.user,
+                {'invoice_number': invoice.invoice_number},
+                ip_address=request.META.get('REMOTE_ADDR')
+            )
     
-    # Create invoice
-    invoice_number = f"INV{timezone.now().strftime('%Y%m%d')}{booking.id:06d}"
-    invoice = Invoice.objects.create(
-        invoice_number=invoice_number,
-        booking=booking
-    )
-    
-    # Generate PDF to buffer first
-    from io import BytesIO
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title = Paragraph(f"<b>INVOICE #{invoice_number}</b>", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Invoice details
-    invoice_data = [
-        ['Invoice Date:', invoice.invoice_date.strftime('%Y-%m-%d')],
-        ['Booking Number:', booking.booking_number],
-        ['Travel Date:', booking.travel_date.strftime('%Y-%m-%d')],
-    ]
-    
-    invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
-    invoice_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
-        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(invoice_table)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Customer details
-    customer_title = Paragraph("<b>Customer Details</b>", styles['Heading2'])
-    elements.append(customer_title)
-    
-    customer_data = [
-        ['Name:', booking.customer_name],
-        ['Email:', booking.customer_email],
-        ['Phone:', booking.customer_phone],
-        ['Address:', booking.customer_address or 'N/A'],
-    ]
-    
-    customer_table = Table(customer_data, colWidths=[2*inch, 4*inch])
-    customer_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(customer_table)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Package details
-    package_title = Paragraph("<b>Package Details</b>", styles['Heading2'])
-    elements.append(package_title)
-    
-    package_data = [
-        ['Package:', booking.package.name],
-        ['Destination:', booking.package.destination],
-        ['Duration:', f"{booking.package.duration_days} days"],
-        ['Travelers:', str(booking.number_of_travelers)],
-    ]
-    
-    package_table = Table(package_data, colWidths=[2*inch, 4*inch])
-    package_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(package_table)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Pricing details
-    pricing_title = Paragraph("<b>Pricing Details</b>", styles['Heading2'])
-    elements.append(pricing_title)
-    
-    pricing_data = [
-        ['Description', 'Amount'],
-        ['Package Price', f"₹{booking.package_price:.2f}"],
-        ['Discount', f"-₹{booking.discount_amount:.2f}"],
-        ['Subtotal', f"₹{booking.subtotal:.2f}"],
-        [f'GST ({booking.package.tax_percentage}%)', f"₹{booking.tax_amount:.2f}"],
-        ['<b>TOTAL</b>', f"<b>₹{booking.total_amount:.2f}</b>"],
-    ]
-    
-    pricing_table = Table(pricing_data, colWidths=[4*inch, 2*inch])
-    pricing_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(pricing_table)
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Save PDF to invoice
-    from django.core.files.base import ContentFile
-    buffer.seek(0)
-    invoice.pdf_file.save(f'invoice_{invoice_number}.pdf', ContentFile(buffer.getvalue()))
-    invoice.save()
-    
-    # Create response for download
-    response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="invoice_{invoice_number}.pdf"'
-    
-    # Create audit log
-    create_audit_log(
-        'Invoice',
-        invoice.id,
-        'create',
-        request.user,
-        {'invoice_number': invoice_number},
-        ip_address=request.META.get('REMOTE_ADDR')
-    )
-    
-    messages.success(request, 'Invoice generated successfully.')
-    return response
+    messages.success(request, 'The invoice is being generated.')
+    return redirect('bookings:detail', pk=booking.pk)
+
+
+@login_required
+@never_cache
+def invoice_status(request, pk):
+    """Rendering status of an invoice, polled while it is pending."""
+    found = tasks.status(pk)
+    if found is None:
+        return JsonResponse({'error': 'Invoice not found.'}, status=404)
+    status, error = found
+    return JsonResponse({
+        'status': status,
+        'url': reverse('payments:view_invoice', args=[pk]) if status == 'ready' else None,
+        'error': error if status == 'failed' else '',
+    })
 
 
 @login_required
@@ -301,10 +194,30 @@ def view_invoice(request, pk):
     """View invoice PDF."""
     invoice = get_object_or_404(Invoice, pk=pk)
     
-    if invoice.pdf_file:
-        from django.http import FileResponse
-        return FileResponse(open(invoice.pdf_file.path, 'rb'), content_type='application/pdf')
+    if invoice.is_ready():
+        return file_response(request, invoice.pdf_file, file_name(invoice.invoice_number))
+    elif invoice.status == 'pending':
+        messages.info(request, 'The invoice is still being generated.')
+        return redirect('bookings:detail', pk=invoice.booking_id)
     else:
         messages.error(request, 'Invoice PDF not found.')
-        return redirect('bookings:detail', pk=invoice.booking.pk)
+        return redirect('bookings:detail', pk=invoice.booking_id)
+
 
+@login_required
+@accountant_required
+def export_invoices(request):
+    """Download the invoice PDFs of a date range as one ZIP archive."""
+    form = InvoiceExportForm(request.GET or None)
+    
+    if form.is_valid():
+        start, end = form.cleaned_data['start'], form.cleaned_data['end']
+        return exports.export_response(
+            f'invoices_{start:%Y%m%d}_{end:%Y%m%d}',
+            exports.invoices_between(start, end)
+        )
+    
+    return render(request, 'payments/invoice_export.html', {
+        'form': form,
+        'missing_name': exports.MISSING_NAME
+    })
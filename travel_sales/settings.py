@@ -49,6 +49,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Report each request's database query count in an X-Query-Count header
+# (see analytics/middleware.py). Wraps every query, so off in production.
+QUERY_COUNT_HEADER = DEBUG
+
+if QUERY_COUNT_HEADER:
+    MIDDLEWARE.append('analytics.middleware.QueryCountMiddleware')
+
 ROOT_URLCONF = 'travel_sales.urls'
 
 TEMPLATES = [
@@ -93,6 +100,27 @@ DATABASES = {
 # }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# To share cached reports between gunicorn workers, use a file or database
+# cache:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#         'LOCATION': BASE_DIR / 'cache',
+#     }
+# }
+# or 'django.core.cache.backends.db.DatabaseCache' with LOCATION 'cache_table'
+# (create it with `python manage.py createcachetable`).
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -155,3 +183,50 @@ LOGOUT_REDIRECT_URL = 'accounts:login'
 DECIMAL_PLACES = 2
 MAX_DIGITS = 12
 
+# Analytics report cache
+ANALYTICS_REPORT_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,  # seconds
+    'MAX_ENTRIES': 200,
+}
+
+# In-process package catalog (see packages/catalog.py)
+PACKAGE_CATALOG = {
+    'CHECK_INTERVAL': 5,  # seconds between checks of the database version stamp
+    'MAX_AGE': 300,  # seconds, reload backstop
+}
+
+# Buffered audit log writer (see bookings/audit.py)
+AUDIT_LOG = {
+    'BACKGROUND': True,
+    'MAX_QUEUE': 10000,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 1.0,  # seconds
+}
+
+# Invoice PDF rendering queue (see payments/tasks.py and `manage.py process_invoices`)
+INVOICE_QUEUE = {
+    'BACKGROUND': True,
+    'LEASE_SECONDS': 120,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 60,  # seconds, times the attempts so far
+    'POLL_INTERVAL': 30.0,  # seconds
+}
+
+# Invoice PDF storage and serving (see payments/storage.py)
+INVOICE_STORAGE = {
+    'ROOT': None,  # default: MEDIA_ROOT
+    'SENDFILE': None,  # 'x-sendfile' or 'x-accel-redirect' when a front-end server serves the files
+    'ACCEL_PREFIX': '/protected/',
+    'CACHE_MAX_AGE': 365 * 24 * 60 * 60,  # seconds
+}
+
+# Audit log archival (see bookings/archive.py and `manage.py archive_audit_logs`)
+AUDIT_ARCHIVE = {
+    'ROOT': BASE_DIR / 'archive' / 'audit_logs',
+    'RETENTION_DAYS': 180,
+}
+
+# Re-validate pending bookings in a background thread after a package's
+# pricing changes (False runs it in the request, after commit)
+PACKAGE_REVALIDATION_BACKGROUND = True